@@ -0,0 +1,72 @@
+"""
+Benchmark of parsing a year of 15-minute prices (365 daily TimeSeries of 96
+points) from the body of a response, decoded to str first ('text', what
+EntsoeRawClient returns by default) or as the bytes that were received
+('bytes', raw_bytes=True, the default of EntsoePandasClient).
+
+The response has no charset in its Content-Type header, so requests detects
+the encoding when decoding. Peak memory is measured with tracemalloc and
+covers the decoded body, the parser's copies and the result.
+
+Usage: python benchmarks/bench_bytes.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+import requests
+
+# run from anywhere, without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+from bench_parsers import make_document
+from entsoe import parsers
+
+DOCUMENT = make_document(365, points_per_series=96, minutes=15)
+
+
+def make_response():
+    response = requests.Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = 'application/xml'
+    response._content = DOCUMENT.encode('utf-8')
+    return response
+
+
+def parse_text(response, engine):
+    return parsers.parse_prices(response.text, engine=engine)
+
+
+def parse_bytes(response, engine):
+    return parsers.parse_prices(response.content, engine=engine)
+
+
+def bench(func, engine, repeat=3):
+    # a fresh response every time, requests does not cache .text
+    return min(timeit.repeat(lambda: func(make_response(), engine),
+                             number=1, repeat=repeat))
+
+
+def peak_memory(func, engine):
+    response = make_response()
+    tracemalloc.start()
+    func(response, engine)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024 ** 2
+
+
+def main():
+    print('body {:.1f} MB'.format(len(DOCUMENT) / 1024 ** 2))
+    print('{:>6} {:>6} {:>10} {:>12}'.format('engine', 'body', 'time',
+                                              'peak memory'))
+    for engine in parsers.ENGINES:
+        for name, func in (('text', parse_text), ('bytes', parse_bytes)):
+            print('{:>6} {:>6} {:>9.3f}s {:>9.1f} MB'.format(
+                engine, name, bench(func, engine), peak_memory(func, engine)))
+
+
+if __name__ == '__main__':
+    main()
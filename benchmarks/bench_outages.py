@@ -0,0 +1,181 @@
+"""
+Benchmark of parse_unavailabilities on a ZIP of 200 outage documents, each
+with a few TimeSeries and Available_Periods, like a busy month of a large
+bidding zone.
+
+The 'two-pass' column emulates the old implementation, which parsed every
+document twice (once for the header, once for the TimeSeries), rebuilt the
+bidding zone lookup for every TimeSeries and concatenated one DataFrame per
+document, 'single-pass' is parse_unavailabilities as it is now and 'pool'
+is parse_unavailabilities on a pool with one process per CPU.
+
+Usage: python benchmarks/bench_outages.py
+"""
+import io
+import os
+import sys
+import timeit
+import zipfile
+
+import pandas as pd
+
+# run from anywhere, without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+from concurrent.futures import ProcessPoolExecutor
+from entsoe import parsers
+from entsoe.mappings import BIDDING_ZONES
+
+DOCUMENT = """<?xml version="1.0" encoding="UTF-8"?>
+<Unavailability_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-6:outagedocument:3:0">
+  <mRID>{mrid}</mRID>
+  <revisionNumber>1</revisionNumber>
+  <type>A80</type>
+  <process.processType>A26</process.processType>
+  <createdDateTime>{created}</createdDateTime>
+  <sender_MarketParticipant.mRID codingScheme="A01">10X1001A1001A450</sender_MarketParticipant.mRID>
+  <sender_MarketParticipant.marketRole.type>A32</sender_MarketParticipant.marketRole.type>
+  <receiver_MarketParticipant.mRID codingScheme="A01">10X1001A1001A450</receiver_MarketParticipant.mRID>
+  <receiver_MarketParticipant.marketRole.type>A39</receiver_MarketParticipant.marketRole.type>
+  <unavailability_Time_Period.timeInterval>
+    <start>2018-01-01T23:00Z</start>
+    <end>2018-02-01T23:00Z</end>
+  </unavailability_Time_Period.timeInterval>
+  <docStatus>
+    <value>A05</value>
+  </docStatus>
+{timeseries}
+  <Reason>
+    <code>B18</code>
+    <text>Planned maintenance of the unit</text>
+  </Reason>
+</Unavailability_MarketDocument>
+"""
+TIMESERIES = """  <TimeSeries>
+    <mRID>{i}</mRID>
+    <businessType>A53</businessType>
+    <biddingZone_Domain.mRID codingScheme="A01">10YBE----------2</biddingZone_Domain.mRID>
+    <start_DateAndOrTime.date>2018-01-01</start_DateAndOrTime.date>
+    <start_DateAndOrTime.time>23:00:00Z</start_DateAndOrTime.time>
+    <end_DateAndOrTime.date>2018-02-01</end_DateAndOrTime.date>
+    <end_DateAndOrTime.time>23:00:00Z</end_DateAndOrTime.time>
+    <quantity_Measure_Unit.name>MAW</quantity_Measure_Unit.name>
+    <curveType>A03</curveType>
+    <production_RegisteredResource.mRID codingScheme="A01">22WDOEL000000017</production_RegisteredResource.mRID>
+    <production_RegisteredResource.name>DOEL 1</production_RegisteredResource.name>
+    <production_RegisteredResource.location.name>Doel</production_RegisteredResource.location.name>
+    <production_RegisteredResource.pSRType.psrType>B14</production_RegisteredResource.pSRType.psrType>
+    <production_RegisteredResource.pSRType.powerSystemResources.mRID codingScheme="A01">22WDOEL000000017</production_RegisteredResource.pSRType.powerSystemResources.mRID>
+    <production_RegisteredResource.pSRType.powerSystemResources.name>DOEL 1</production_RegisteredResource.pSRType.powerSystemResources.name>
+    <production_RegisteredResource.pSRType.powerSystemResources.nominalP unit="MAW">445</production_RegisteredResource.pSRType.powerSystemResources.nominalP>
+{periods}
+  </TimeSeries>
+"""
+PERIOD = """    <Available_Period>
+      <timeInterval>
+        <start>{start}</start>
+        <end>{end}</end>
+      </timeInterval>
+      <resolution>PT1M</resolution>
+      <Point>
+        <position>1</position>
+        <quantity>{quantity}</quantity>
+      </Point>
+    </Available_Period>"""
+
+
+def make_zip(n_documents=200, timeseries_per_document=2,
+             periods_per_timeseries=4):
+    fmt = '%Y-%m-%dT%H:%MZ'
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as arc:
+        for d in range(n_documents):
+            created = pd.Timestamp('2018-01-01T10:00Z') + pd.Timedelta(
+                minutes=d)
+            timeseries = []
+            for i in range(timeseries_per_document):
+                start = pd.Timestamp('2018-01-01T23:00Z')
+                periods = []
+                for p in range(periods_per_timeseries):
+                    end = start + pd.Timedelta(days=1)
+                    periods.append(PERIOD.format(
+                        start=start.strftime(fmt), end=end.strftime(fmt),
+                        quantity=(d + p) % 445))
+                    start = end
+                timeseries.append(TIMESERIES.format(
+                    i=i + 1, periods='\n'.join(periods)))
+            xml = DOCUMENT.format(
+                mrid='outage{}'.format(d),
+                created=created.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                timeseries=''.join(timeseries))
+            arc.writestr('outage_{}.xml'.format(d), xml)
+    return buffer.getvalue()
+
+
+def _unavailability_timeseries_two_pass(soup):
+    dm = {k: v for (v, k) in BIDDING_ZONES.items()}
+    f = [parsers.BSNTYPE[soup.find('businesstype').text],
+         dm[soup.find('biddingzone_domain.mrid').text],
+         soup.find('quantity_measure_unit.name').text,
+         soup.find('curvetype').text,
+         soup.find('production_registeredresource.mrid').text,
+         soup.find('production_registeredresource.name').text,
+         soup.find('production_registeredresource.location.name').text,
+         parsers.PSRTYPE_MAPPINGS[soup.find(
+             'production_registeredresource.psrtype.psrtype').text],
+         float(soup.find('production_registeredresource.psrtype.'
+                         'powersystemresources.nominalp').text)]
+    return [f + p for p in parsers._available_period(soup)]
+
+
+def _outage_parser_two_pass(xml_file, engine):
+    xml_text = xml_file.decode()
+    soup = parsers._parse_document(xml_text, engine=engine)
+    creation_date = pd.Timestamp(soup.createddatetime.text)
+    try:
+        docstatus = parsers.DOCSTATUS[soup.docstatus.value.text]
+    except AttributeError:
+        docstatus = None
+    d = list()
+    for ts in parsers._extract_timeseries(xml_text, engine=engine):
+        row = [creation_date, docstatus]
+        for t in _unavailability_timeseries_two_pass(ts):
+            d.append(row + t)
+    return pd.DataFrame.from_records(d, columns=parsers.OUTAGE_COLUMNS)
+
+
+def parse_unavailabilities_two_pass(response, engine):
+    dfs = list()
+    with zipfile.ZipFile(io.BytesIO(response), 'r') as arc:
+        for f in arc.infolist():
+            if f.filename.endswith('xml'):
+                dfs.append(_outage_parser_two_pass(arc.read(f), engine))
+    df = pd.concat(dfs, axis=0)
+    df.set_index('created_doc_time', inplace=True)
+    df.sort_index(inplace=True)
+    return df
+
+
+def bench(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    content = make_zip()
+    print('{:>6} {:>12} {:>12} {:>12}'.format('engine', 'two-pass',
+                                              'single-pass', 'pool'))
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+        for engine in parsers.ENGINES:
+            two_pass = bench(
+                lambda: parse_unavailabilities_two_pass(content, engine))
+            single_pass = bench(
+                lambda: parsers.parse_unavailabilities(content, engine))
+            in_pool = bench(lambda: parsers.parse_unavailabilities(
+                content, engine, executor=pool))
+            print('{:>6} {:>11.3f}s {:>11.3f}s {:>11.3f}s'.format(
+                engine, two_pass, single_pass, in_pool))
+
+
+if __name__ == '__main__':
+    main()
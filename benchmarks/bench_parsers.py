@@ -0,0 +1,85 @@
+"""
+Benchmark of the top-level parsers against the number of TimeSeries per
+document.
+
+The 'accumulate' column emulates the old implementation, which grew the
+result with Series.append on every TimeSeries (quadratic), 'collect' is
+parse_prices as it is now (one concatenation). With the bs4 engine the
+parsing itself dominates and both take about as long; the difference only
+shows with the lxml engine.
+
+Usage: python benchmarks/bench_parsers.py
+"""
+import os
+import sys
+import timeit
+
+import pandas as pd
+
+# run from anywhere, without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+from entsoe import parsers
+
+HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+          '<Publication_MarketDocument xmlns="urn:iec62325.351:tc57wg16:'
+          '451-3:publicationdocument:7:0">\n')
+FOOTER = '</Publication_MarketDocument>\n'
+TIMESERIES = """  <TimeSeries>
+    <mRID>{i}</mRID>
+    <curveType>A01</curveType>
+    <Period>
+      <timeInterval>
+        <start>{start}</start>
+        <end>{end}</end>
+      </timeInterval>
+      <resolution>PT{minutes}M</resolution>
+{points}
+    </Period>
+  </TimeSeries>
+"""
+POINT = '      <Point><position>{}</position><price.amount>{}</price.amount></Point>'
+
+
+def make_document(n_timeseries, points_per_series=24, minutes=60):
+    start = pd.Timestamp('2015-01-01T00:00Z')
+    fmt = '%Y-%m-%dT%H:%MZ'
+    body = []
+    for i in range(n_timeseries):
+        end = start + pd.Timedelta(minutes=minutes * points_per_series)
+        points = '\n'.join(POINT.format(p, 30 + p % 7)
+                           for p in range(1, points_per_series + 1))
+        body.append(TIMESERIES.format(i=i + 1, start=start.strftime(fmt),
+                                      end=end.strftime(fmt), points=points,
+                                      minutes=minutes))
+        start = end
+    return HEADER + ''.join(body) + FOOTER
+
+
+def parse_prices_accumulate(xml_text, engine):
+    series = pd.Series(dtype=float)
+    for soup in parsers._extract_timeseries(xml_text, engine=engine):
+        series = pd.concat([series, parsers._parse_price_timeseries(soup)])
+    return series.sort_index()
+
+
+def bench(func, repeat=1):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    print('{:>6} {:>6} {:>12} {:>12}'.format('n_ts', 'engine', 'accumulate',
+                                              'collect'))
+    for n_timeseries in (10, 100, 1000, 5000):
+        xml_text = make_document(n_timeseries)
+        for engine in parsers.ENGINES:
+            accumulate = bench(
+                lambda: parse_prices_accumulate(xml_text, engine))
+            collect = bench(lambda: parsers.parse_prices(xml_text, engine))
+            print('{:>6} {:>6} {:>11.3f}s {:>11.3f}s'.format(
+                n_timeseries, engine, accumulate, collect))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark of a five year day-ahead price query with a simulated network
+latency, fetching the yearly blocks one after the other, pipelined with
+prefetch (still one request at a time) and concurrently with max_workers.
+
+Usage: python benchmarks/bench_prefetch.py [latency in seconds]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+import requests
+
+# run from anywhere, without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+from bench_parsers import make_document
+from entsoe import EntsoePandasClient
+
+# one year of hourly prices, in daily TimeSeries
+DOCUMENT = make_document(365).encode('utf-8')
+
+
+class SlowSession:
+    """Answers every request with the same document after `latency`"""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def get(self, url, params=None, **kwargs):
+        time.sleep(self.latency)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = DOCUMENT
+        response.encoding = 'utf-8'
+        return response
+
+
+def bench(latency, **kwargs):
+    client = EntsoePandasClient(api_key='bench', parser_engine='bs4',
+                                session=SlowSession(latency), **kwargs)
+    started = time.perf_counter()
+    client.query_day_ahead_prices('BE',
+                                  start=pd.Timestamp('20150101', tz='UTC'),
+                                  end=pd.Timestamp('20200101', tz='UTC'))
+    return time.perf_counter() - started
+
+
+def main():
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    print('latency {:.1f}s per request, 5 blocks'.format(latency))
+    print('{:>12} {:>10}'.format('sequential', '{:.2f}s'.format(
+        bench(latency))))
+    print('{:>12} {:>10}'.format('prefetch=1', '{:.2f}s'.format(
+        bench(latency, prefetch=1))))
+    print('{:>12} {:>10}'.format('max_workers', '{:.2f}s'.format(
+        bench(latency, max_workers=5))))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 from .entsoerawclient import EntsoeRawClient
 from .entsoepandasclient import EntsoePandasClient
+from .entsoeasyncclient import AsyncEntsoeRawClient
+from .entsoeasyncclient import AsyncEntsoePandasClient
 
 
 __title__ = "entsoe-py"
@@ -0,0 +1,357 @@
+import json
+import logging
+import sqlite3
+
+from .exceptions import NoMatchingDataError
+from .misc import year_blocks
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from functools import partial
+from itertools import islice
+from time import monotonic
+from time import time
+
+logger = logging.getLogger(__name__)
+
+BackfillTask = namedtuple('BackfillTask',
+                          ['dataset', 'zone', 'start', 'end', 'kwargs'])
+BackfillTask.__doc__ = """
+One block of a backfill: query_<dataset>(zone, start=start, end=end,
+**kwargs) on an EntsoePandasClient
+"""
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def expand_job(datasets, zones, start, end):
+    """
+    Split a backfill job into tasks of at most a year
+
+    Parameters
+    ----------
+    datasets : [str | (str, dict)]
+        name of the query without 'query_' (eg. 'day_ahead_prices'),
+        optionally with the keyword arguments of the query, eg.
+        ('generation', {'psr_type': 'B16'})
+    zones : [str]
+    start : pd.Timestamp
+    end : pd.Timestamp
+
+    Returns
+    -------
+    [BackfillTask]
+    """
+    blocks = list(year_blocks(start, end))
+    tasks = []
+    for dataset in datasets:
+        if isinstance(dataset, str):
+            dataset, kwargs = dataset, {}
+        else:
+            dataset, kwargs = dataset
+        for zone in zones:
+            for block_start, block_end in blocks:
+                tasks.append(BackfillTask(dataset, zone, block_start,
+                                          block_end, dict(kwargs)))
+    return tasks
+
+
+def task_key(task):
+    """
+    Returns
+    -------
+    str
+        identifies the task in the journal
+    """
+    return '|'.join([task.dataset, task.zone, task.start.isoformat(),
+                     task.end.isoformat(),
+                     json.dumps(task.kwargs, sort_keys=True)])
+
+
+class Journal:
+    """
+    Durable record of the tasks of backfill jobs and their status, in an
+    SQLite database. A task is only marked done once its result has been
+    written, so after a crash the tasks that were running are simply run
+    again.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : str
+            SQLite database file, created if it does not exist
+        """
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS tasks ('
+                         'key TEXT PRIMARY KEY, dataset TEXT, zone TEXT, '
+                         'start TEXT, end TEXT, kwargs TEXT, status TEXT, '
+                         'attempts INTEGER, rows INTEGER, error TEXT, '
+                         'updated REAL)')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def _execute(self, sql, params=()):
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def add(self, tasks):
+        """
+        Record tasks as pending, leaving tasks that are already known as
+        they are
+
+        Parameters
+        ----------
+        tasks : [BackfillTask]
+        """
+        rows = [(task_key(t), t.dataset, t.zone, t.start.isoformat(),
+                 t.end.isoformat(), json.dumps(t.kwargs, sort_keys=True),
+                 PENDING, 0, time()) for t in tasks]
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN')
+            conn.executemany('INSERT OR IGNORE INTO tasks (key, dataset, '
+                             'zone, start, end, kwargs, status, attempts, '
+                             'updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             rows)
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def status(self, task):
+        """
+        Returns
+        -------
+        str | None
+            'pending', 'running', 'done' or 'failed', None if unknown
+        """
+        rows = self._execute('SELECT status FROM tasks WHERE key = ?',
+                             (task_key(task),))
+        return rows[0][0] if rows else None
+
+    def unfinished(self, tasks):
+        """
+        Returns
+        -------
+        [BackfillTask]
+            the tasks that are not done, in the given order
+        """
+        done = {row[0] for row in self._execute(
+            'SELECT key FROM tasks WHERE status = ?', (DONE,))}
+        return [t for t in tasks if task_key(t) not in done]
+
+    def start(self, task):
+        self._execute('UPDATE tasks SET status = ?, attempts = attempts + 1, '
+                      'updated = ? WHERE key = ?',
+                      (RUNNING, time(), task_key(task)))
+
+    def finish(self, task, rows):
+        self._execute('UPDATE tasks SET status = ?, rows = ?, error = NULL, '
+                      'updated = ? WHERE key = ?',
+                      (DONE, rows, time(), task_key(task)))
+
+    def fail(self, task, error):
+        self._execute('UPDATE tasks SET status = ?, error = ?, updated = ? '
+                      'WHERE key = ?',
+                      (FAILED, repr(error), time(), task_key(task)))
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+            number of tasks per status
+        """
+        return dict(self._execute(
+            'SELECT status, COUNT(*) FROM tasks GROUP BY status'))
+
+
+# client of a worker process, built by _init_worker
+_worker_client = None
+
+
+def _init_worker(client_factory):
+    global _worker_client
+    _worker_client = client_factory()
+
+
+def _fetch_task(client, task):
+    """
+    Returns
+    -------
+    (pd.Series | pd.DataFrame | None, float)
+        the result, None if there is no data for the task, and the seconds
+        it took to fetch and parse it
+    """
+    query = getattr(client, 'query_' + task.dataset)
+    started = monotonic()
+    try:
+        data = query(task.zone, start=task.start, end=task.end,
+                     **task.kwargs)
+    except NoMatchingDataError:
+        data = None
+    return data, monotonic() - started
+
+
+def _fetch_in_worker(task):
+    return _fetch_task(_worker_client, task)
+
+
+class BackfillRunner:
+    """
+    Runs the tasks of a backfill job, writing every result to a
+    TimeSeriesStore as soon as it arrives and recording it in a Journal.
+    Running the same job again skips the tasks that are done, so a job
+    that was interrupted resumes where it stopped.
+
+    With workers set, the tasks are fetched and parsed in that many worker
+    processes, each with its own client built by client_factory, while
+    this process writes the results and keeps the journal. With threads
+    set, the workers are threads sharing the client (and its rate limit)
+    instead.
+    """
+
+    def __init__(self, store, journal, client=None, client_factory=None,
+                 workers=None, threads=False):
+        """
+        Parameters
+        ----------
+        store : entsoe.store.TimeSeriesStore
+        journal : Journal | str
+            a Journal, or the path of its database
+        client : EntsoePandasClient, optional
+            used when there are no workers
+        client_factory : callable, optional
+            returns an EntsoePandasClient, called once in every worker
+            process, so it must be picklable (eg. a module level function
+            or a functools.partial). To share the rate limit between the
+            workers, give the clients the same SQLiteRateLimiter file.
+        workers : int, optional
+            number of worker processes, by default the tasks are run one
+            after the other in this process
+        threads : bool
+            run the workers as threads sharing client, which suits queries
+            that spend most of their time waiting for the API
+        """
+        if workers and not threads and client_factory is None:
+            raise ValueError("Worker processes require a client_factory")
+        if (threads or not workers) and client is None:
+            if client_factory is None:
+                raise ValueError("Pass a client or a client_factory")
+            client = client_factory()
+        if isinstance(journal, str):
+            journal = Journal(journal)
+        self.store = store
+        self.journal = journal
+        self.client = client
+        self.client_factory = client_factory
+        self.workers = workers
+        self.threads = threads
+
+    def _dataset(self, task):
+        return self.store.dataset_name('query_' + task.dataset,
+                                       **task.kwargs)
+
+    def _write(self, task, data):
+        self.store.write(self._dataset(task), task.zone, data,
+                         start=task.start, end=task.end)
+        rows = 0 if data is None else len(data)
+        self.journal.finish(task, rows)
+        return rows
+
+    def run(self, tasks):
+        """
+        Parameters
+        ----------
+        tasks : [BackfillTask]
+            eg. from expand_job
+
+        Returns
+        -------
+        dict
+            number of tasks that were done before, done now and failed, the
+            number of rows written and the seconds spent fetching and
+            parsing, summed over the workers
+        """
+        self.journal.add(tasks)
+        todo = self.journal.unfinished(tasks)
+        result = {'skipped': len(tasks) - len(todo), 'done': 0, 'failed': 0,
+                  'rows': 0, 'seconds': 0.0}
+        logger.info("backfill: %d tasks, %d done before", len(tasks),
+                    result['skipped'])
+        if self.workers:
+            outcomes = self._run_in_workers(todo)
+        else:
+            outcomes = self._run_here(todo)
+        for task, data, seconds, error in outcomes:
+            result['seconds'] += seconds
+            if error is not None:
+                logger.warning("backfill task %s failed: %r", task_key(task),
+                               error)
+                self.journal.fail(task, error)
+                result['failed'] += 1
+                continue
+            result['rows'] += self._write(task, data)
+            result['done'] += 1
+        return result
+
+    def _run_here(self, tasks):
+        for task in tasks:
+            self.journal.start(task)
+            started = monotonic()
+            try:
+                data, seconds = _fetch_task(self.client, task)
+            except Exception as e:
+                yield task, None, monotonic() - started, e
+            else:
+                yield task, data, seconds, None
+
+    def _executor(self):
+        if self.threads:
+            pool = ThreadPoolExecutor(max_workers=self.workers,
+                                      thread_name_prefix='entsoe-backfill')
+            return pool, partial(_fetch_task, self.client)
+        pool = ProcessPoolExecutor(max_workers=self.workers,
+                                   initializer=_init_worker,
+                                   initargs=(self.client_factory,))
+        return pool, _fetch_in_worker
+
+    def _run_in_workers(self, tasks):
+        """Yield the outcome of every task as it finishes, keeping at most
+        two tasks per worker in flight so finished results do not pile up"""
+        tasks = iter(tasks)
+        pending = {}
+        pool, fetch = self._executor()
+        with pool:
+
+            def submit(n):
+                for task in islice(tasks, n):
+                    self.journal.start(task)
+                    pending[pool.submit(fetch, task)] = task
+
+            submit(2 * self.workers)
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = pending.pop(future)
+                    try:
+                        data, seconds = future.result()
+                    except Exception as e:
+                        yield task, None, 0.0, e
+                    else:
+                        yield task, data, seconds, None
+                submit(len(finished))
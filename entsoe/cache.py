@@ -0,0 +1,438 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import zlib
+
+import requests
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from functools import partial
+from time import time
+
+logger = logging.getLogger(__name__)
+
+# parameters that do not change the response
+IGNORED_PARAMS = ('securityToken',)
+
+
+def cache_key(params):
+    """
+    Parameters
+    ----------
+    params : dict
+        request parameters
+
+    Returns
+    -------
+    str
+        hash of the parameters, leaving out the API key
+    """
+    relevant = {k: str(v) for k, v in params.items()
+                if k not in IGNORED_PARAMS}
+    text = json.dumps(relevant, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def cached_response(content):
+    """
+    Build the response returned for a cache hit
+
+    Parameters
+    ----------
+    content : bytes
+
+    Returns
+    -------
+    requests.Response
+    """
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response._content = content
+    response.encoding = 'utf-8'
+    response.from_cache = True
+    response.rate_limit_wait = 0.0
+    response.retries = 0
+    return response
+
+
+def _as_utc(dtm):
+    if dtm.tzinfo is None:
+        return dtm.replace(tzinfo=timezone.utc)
+    return dtm.astimezone(timezone.utc)
+
+
+class ResponseCache:
+    """
+    Cache of raw response bodies on disk, compressed, one file per request.
+
+    How long a response stays valid depends on how recent the requested
+    period is: ENTSO-E keeps revising the last days, so responses for a
+    period ending less than `settled_after` ago expire after `recent_ttl`
+    seconds, older (settled) ones after `settled_ttl` seconds, which is
+    forever by default. When the cache grows beyond `max_size` bytes, the
+    least recently used responses are removed.
+
+    Files are written to a temporary name and renamed into place, so several
+    processes can use the same directory at once.
+    """
+
+    def __init__(self, directory, max_size=2 * 1024 ** 3, recent_ttl=900,
+                 settled_ttl=None, settled_after=timedelta(days=7)):
+        """
+        Parameters
+        ----------
+        directory : str
+            created if it does not exist
+        max_size : int
+            in bytes
+        recent_ttl : float
+            seconds a response for a recent period stays valid
+        settled_ttl : float, optional
+            seconds a response for a settled period stays valid, None is
+            forever
+        settled_after : datetime.timedelta
+            age of the end of the requested period after which the data is
+            considered settled
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.recent_ttl = recent_ttl
+        self.settled_ttl = settled_ttl
+        self.settled_after = settled_after
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = self._scan_size()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.z')
+
+    def _files(self):
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            for file in os.scandir(entry.path):
+                if file.name.endswith('.z'):
+                    yield file
+
+    def _scan_size(self):
+        size = 0
+        for file in self._files():
+            try:
+                size += file.stat().st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    def ttl(self, params):
+        """
+        Parameters
+        ----------
+        params : dict
+            request parameters, periodEnd is formatted as YYYYMMDDhhmm (UTC)
+
+        Returns
+        -------
+        float | None
+            seconds the response stays valid, None is forever
+        """
+        try:
+            end = datetime.strptime(params['periodEnd'], '%Y%m%d%H%M')
+        except (KeyError, ValueError):
+            return self.recent_ttl
+        end = end.replace(tzinfo=timezone.utc)
+        if datetime.now(timezone.utc) - end > self.settled_after:
+            return self.settled_ttl
+        return self.recent_ttl
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, params):
+        """
+        Parameters
+        ----------
+        params : dict
+
+        Returns
+        -------
+        bytes | None
+            the cached body, None if there is no valid one
+        """
+        key = cache_key(params)
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                data = f.read()
+        except (FileNotFoundError, ValueError):
+            self._count('misses')
+            logger.debug("cache miss %s", key)
+            return None
+
+        ttl = self.ttl(params)
+        if ttl is not None and time() - header['stored'] > ttl:
+            self._count('misses')
+            logger.debug("cache expired %s", key)
+            return None
+        try:
+            content = zlib.decompress(data)
+            os.utime(path)
+        except zlib.error:
+            self._count('misses')
+            return None
+        except FileNotFoundError:
+            pass
+        self._count('hits')
+        logger.debug("cache hit %s", key)
+        return content
+
+    def set(self, params, content):
+        """
+        Parameters
+        ----------
+        params : dict
+        content : bytes
+        """
+        self._store(params, [content])
+
+    def set_file(self, params, file, chunk_size=64 * 1024):
+        """
+        Store a body that is held in a file, compressed in chunks so it is
+        never read into memory at once
+
+        Parameters
+        ----------
+        params : dict
+        file : file object
+            binary, read from its current position to the end
+        chunk_size : int
+        """
+        self._store(params, iter(partial(file.read, chunk_size), b''))
+
+    def _store(self, params, chunks):
+        key = cache_key(params)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        header = json.dumps({'stored': time()}).encode('utf-8') + b'\n'
+        compressor = zlib.compressobj()
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                for chunk in chunks:
+                    f.write(compressor.compress(chunk))
+                f.write(compressor.flush())
+                size = f.tell()
+            # the response replaced, if any, no longer counts
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        with self._lock:
+            self.stores += 1
+            self._size += size - replaced
+            full = self._size > self.max_size
+        if full:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used responses until the cache is back
+        under 90% of max_size
+        """
+        files = []
+        for file in self._files():
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, file.path))
+        files.sort()
+        size = sum(f[1] for f in files)
+        target = self.max_size * 0.9
+        evicted = 0
+        for _, file_size, path in files:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+            evicted += 1
+        with self._lock:
+            self._size = size
+            self.evictions += evicted
+
+    def clear(self):
+        """Remove all cached responses"""
+        for file in self._files():
+            try:
+                os.remove(file.path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size = 0
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+            hits, misses, stores and evictions of this instance and the
+            approximate size on disk in bytes
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'stores': self.stores, 'evictions': self.evictions,
+                    'size': self._size}
+
+
+class NegativeCache:
+    """
+    Remembers requests (or blocks of a split query) for which the API
+    answered "No matching data found", so they are not repeated until the
+    entry expires. Like ResponseCache, entries for periods that ended more
+    than `settled_after` ago live longer (`ttl`) than entries for recent
+    periods (`recent_ttl`), for which data may still be published.
+
+    Entries are kept in memory, or in an SQLite database when a path is
+    given, so they survive restarts and are shared between processes.
+    """
+
+    def __init__(self, path=None, ttl=30 * 24 * 3600, recent_ttl=3600,
+                 settled_after=timedelta(days=7)):
+        """
+        Parameters
+        ----------
+        path : str, optional
+            SQLite database file, created if it does not exist
+        ttl : float, optional
+            seconds an entry for a settled period lives, None is forever
+        recent_ttl : float
+            seconds an entry for a recent period lives
+        settled_after : datetime.timedelta
+        """
+        self.path = path
+        self.ttl = ttl
+        self.recent_ttl = recent_ttl
+        self.settled_after = settled_after
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        if path is not None:
+            conn = self._connect()
+            try:
+                conn.execute('CREATE TABLE IF NOT EXISTS negative ('
+                             'key TEXT PRIMARY KEY, expires REAL)')
+            finally:
+                conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def _expires(self, end):
+        if end is None:
+            ttl = self.recent_ttl
+        elif datetime.now(timezone.utc) - _as_utc(end) > self.settled_after:
+            ttl = self.ttl
+        else:
+            ttl = self.recent_ttl
+        if ttl is None:
+            return float('inf')
+        return time() + ttl
+
+    def add(self, key, end=None):
+        """
+        Parameters
+        ----------
+        key : str
+            eg. cache_key(params)
+        end : datetime.datetime, optional
+            end of the requested period, determines how long the entry lives
+        """
+        expires = self._expires(end)
+        if self.path is None:
+            with self._lock:
+                self._entries[key] = expires
+        else:
+            conn = self._connect()
+            try:
+                conn.execute('INSERT OR REPLACE INTO negative VALUES (?, ?)',
+                             (key, expires))
+            finally:
+                conn.close()
+        with self._lock:
+            self.stores += 1
+        logger.debug("negative cache store %s", key)
+
+    def contains(self, key):
+        """
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        bool
+            True if the key is known to have no data and has not expired
+        """
+        if self.path is None:
+            with self._lock:
+                expires = self._entries.get(key)
+        else:
+            conn = self._connect()
+            try:
+                row = conn.execute('SELECT expires FROM negative '
+                                   'WHERE key = ?', (key,)).fetchone()
+            finally:
+                conn.close()
+            expires = row[0] if row else None
+        found = expires is not None and expires > time()
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def clear(self):
+        """Forget all entries"""
+        with self._lock:
+            self._entries.clear()
+        if self.path is not None:
+            conn = self._connect()
+            try:
+                conn.execute('DELETE FROM negative')
+            finally:
+                conn.close()
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+            hits, misses and stores of this instance
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'stores': self.stores}
@@ -0,0 +1,201 @@
+"""
+Command line entry point, installed as `entsoe`:
+
+    entsoe backfill manifest.json --output data --workers 4
+
+The manifest is a JSON file listing the queries to run:
+
+    {
+        "start": "2015-01-01",
+        "end": "2025-01-01",
+        "queries": [
+            {"dataset": "day_ahead_prices", "zones": ["BE", "NL"]},
+            {"dataset": "generation", "zones": ["BE"], "psr_type": "B16",
+             "start": "2020-01-01"}
+        ]
+    }
+
+`dataset` is one of DATASETS, the EntsoePandasClient queries without
+'query_' that return a time series of one zone. A query can override the
+start and end of the manifest, and any other key is passed on to the
+query. Timestamps without a timezone are UTC.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import pandas as pd
+
+from .backfill import BackfillRunner
+from .backfill import expand_job
+from .entsoepandasclient import EntsoePandasClient
+from .metrics import MetricsCollector
+from .parsers import _check_engine
+from .parsers import etree
+from .ratelimit import RateLimiter
+from .store import FORMATS
+from .store import TimeSeriesStore
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+# queries returning one value per timestamp, which the store can merge
+DATASETS = ('day_ahead_prices', 'load', 'generation_forecast', 'generation',
+            'installed_generation_capacity', 'imbalance_prices')
+
+
+def _timestamp(value):
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return ts
+
+
+def load_manifest(path):
+    """
+    Parameters
+    ----------
+    path : str
+        JSON manifest, see the module docstring
+
+    Returns
+    -------
+    [entsoe.backfill.BackfillTask]
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    tasks = []
+    for query in manifest['queries']:
+        query = dict(query)
+        dataset = query.pop('dataset')
+        if dataset not in DATASETS:
+            raise ValueError("Unknown dataset '{}', choose one of {}"
+                             .format(dataset, DATASETS))
+        zones = query.pop('zones')
+        if isinstance(zones, str):
+            zones = [zones]
+        start = query.pop('start', manifest.get('start'))
+        end = query.pop('end', manifest.get('end'))
+        if start is None or end is None:
+            raise ValueError("No start or end for dataset '{}' in {}, set "
+                             "them in the manifest or the query"
+                             .format(dataset, path))
+        start, end = _timestamp(start), _timestamp(end)
+        tasks += expand_job([(dataset, query)], zones, start, end)
+    return tasks
+
+
+def _size(n_bytes):
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if n_bytes < 1024 or unit == 'GB':
+            return '{:.1f} {}'.format(n_bytes, unit)
+        n_bytes /= 1024
+
+
+def throughput(result, metrics, elapsed):
+    """
+    Parameters
+    ----------
+    result : dict
+        as returned by BackfillRunner.run
+    metrics : entsoe.metrics.MetricsCollector
+        attached to the client that ran the tasks
+    elapsed : float
+        wall clock seconds of the run
+
+    Returns
+    -------
+    str
+        requests, bytes and rows per second, and how the time of the tasks
+        was spent
+    """
+    totals = metrics.totals()
+    elapsed = max(elapsed, 1e-9)
+    task_seconds = max(result['seconds'], 1e-9)
+    waited = totals['rate_limit_wait']
+    network = max(totals['request_time'] - waited, 0.0)
+    requests, n_bytes = totals['requests'], totals['bytes']
+    lines = [
+        'tasks     {done} done, {failed} failed, {skipped} done before'
+        .format(**result),
+        'time      {:.1f}s'.format(elapsed),
+        'requests  {} ({:.2f}/s), {} failed'.format(
+            requests, requests / elapsed, totals['errors']),
+        'bytes     {} ({}/s)'.format(_size(n_bytes), _size(n_bytes / elapsed)),
+        'rows      {} ({:.0f}/s)'.format(result['rows'],
+                                         result['rows'] / elapsed),
+        'task time {:.0%} network, {:.0%} rate limit, {:.0%} parsing'.format(
+            network / task_seconds, waited / task_seconds,
+            totals['parse_time'] / task_seconds),
+    ]
+    return '\n'.join(lines)
+
+
+def backfill(args):
+    api_key = args.api_key or os.environ.get('ENTSOE_API_KEY')
+    if not api_key:
+        raise SystemExit("Pass --api-key or set ENTSOE_API_KEY")
+    parser_engine = args.parser_engine
+    if parser_engine is None:
+        parser_engine = 'bs4' if etree is None else 'lxml'
+    # fail before any request is sent
+    try:
+        _check_engine(parser_engine)
+    except ImportError as e:
+        raise SystemExit(str(e))
+    tasks = load_manifest(args.manifest)
+    store = TimeSeriesStore(args.output, format=args.format)
+    metrics = MetricsCollector()
+    rate_limiter = RateLimiter(requests_per_minute=args.requests_per_minute)
+    client = EntsoePandasClient(api_key=api_key, hooks=metrics.hooks(),
+                                rate_limiter=rate_limiter,
+                                parser_engine=parser_engine,
+                                retry_count=args.retries)
+    journal = args.journal or os.path.join(args.output, 'backfill.db')
+    runner = BackfillRunner(store, journal, client=client,
+                            workers=args.workers, threads=True)
+    started = monotonic()
+    result = runner.run(tasks)
+    print(throughput(result, metrics, monotonic() - started))
+    if args.verbose:
+        metrics.log()
+    return 1 if result['failed'] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='entsoe', description='Bulk downloads from the ENTSO-E '
+                                   'Transparency Platform')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser(
+        'backfill', help='run the queries of a manifest into a local store, '
+                         'skipping what was done before')
+    run.add_argument('manifest', help='JSON file listing the queries')
+    run.add_argument('--output', default='entsoe-data',
+                     help='store directory (default: %(default)s)')
+    run.add_argument('--format', default='parquet', choices=tuple(FORMATS),
+                     help='file format (default: %(default)s)')
+    run.add_argument('--journal',
+                     help='journal database (default: OUTPUT/backfill.db)')
+    run.add_argument('--workers', type=int, default=4,
+                     help='queries run at the same time (default: '
+                          '%(default)s)')
+    run.add_argument('--requests-per-minute', type=float, default=400,
+                     help='rate limit (default: %(default)s)')
+    run.add_argument('--retries', type=int, default=3,
+                     help='retries per request (default: %(default)s)')
+    run.add_argument('--parser-engine', choices=('bs4', 'lxml'),
+                     help='(default: lxml if it is installed, else bs4)')
+    run.add_argument('--api-key',
+                     help='ENTSO-E API key (default: $ENTSOE_API_KEY)')
+    run.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose
+                        else logging.WARNING)
+    return backfill(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
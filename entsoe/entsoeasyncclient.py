@@ -0,0 +1,672 @@
+import asyncio
+
+import requests
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from time import monotonic
+
+from .cache import cache_key
+from .cache import cached_response
+from .entsoerawclient import EntsoeRawClient
+from .entsoerawclient import URL
+from .entsoerawclient import check_response
+from .exceptions import NoMatchingDataError
+from .mappings import BIDDING_ZONES
+from .mappings import DOMAIN_MAPPINGS
+from .mappings import TIMEZONE_MAPPINGS
+from .metrics import dispatch
+from .metrics import make_hooks
+from .metrics import report_parse
+from .metrics import request_event
+from .metrics import timed_parse
+from .misc import client_retry_policy
+from .misc import async_paginated
+from .misc import async_retry
+from .misc import async_year_limited
+from .parsers import parse_crossborder_flows
+from .parsers import parse_generation
+from .parsers import parse_imbalance_prices
+from .parsers import parse_loads
+from .parsers import parse_prices
+from .parsers import parse_unavailabilities
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncEntsoeRawClient:
+    """
+    asyncio counterpart of EntsoeRawClient, with the same query methods as
+    coroutines. Requests share one aiohttp connection pool and at most
+    `max_concurrency` of them are in flight at once.
+
+    Use it as an async context manager, or call close() when done:
+
+        async with AsyncEntsoeRawClient(api_key=...) as client:
+            text = await client.query_load('BE', start, end)
+    """
+
+    def __init__(self, api_key, session=None, retry_count=1, retry_delay=0,
+                 proxy=None, rate_limiter=None, retry_policy=None,
+                 timeout=(10, 120), max_concurrency=10, cache=None,
+                 negative_cache=None, raw_bytes=False, hooks=None):
+        """
+        Parameters
+        ----------
+        api_key : str
+        session : aiohttp.ClientSession, optional
+            by default the client creates (and closes) its own session
+        retry_count : int
+            number of times to retry the call if the connection fails or
+            the API is throttling or unavailable
+        retry_delay: int
+            amount of seconds to wait before the first retry, doubled for
+            every next retry. 0 uses the backoff of RetryPolicy.
+        proxy : str
+            aiohttp proxy url
+        rate_limiter : entsoe.ratelimit.RateLimiter, optional
+            every request first waits for the rate limiter, without blocking
+            the event loop. It can be shared with synchronous clients.
+        retry_policy : entsoe.misc.RetryPolicy, optional
+            full control over retries, overrides retry_count and retry_delay
+        timeout : float | (float, float) | None
+            connect and read timeout in seconds of every request
+        max_concurrency : int
+            maximum number of requests in flight at the same time
+        cache : entsoe.cache.ResponseCache, optional
+            successful responses are stored in and served from this cache
+        negative_cache : entsoe.cache.NegativeCache, optional
+            requests that returned no data are remembered here, and raise
+            NoMatchingDataError without a round trip until the entry expires
+        raw_bytes : bool
+            see EntsoeRawClient
+        hooks : dict, optional
+            see EntsoeRawClient. The hooks are called on the event loop.
+        """
+        if api_key is None:
+            raise TypeError("API key cannot be None")
+        self.api_key = api_key
+        self.session = session
+        self._owns_session = session is None
+        self.proxy = proxy
+        self.rate_limiter = rate_limiter
+        if retry_policy is None:
+            retry_policy = client_retry_policy(retry_count, retry_delay)
+        self.retry_policy = retry_policy
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.cache = cache
+        self.negative_cache = negative_cache
+        self.raw_bytes = raw_bytes
+        self.hooks = make_hooks(hooks)
+
+    _datetime_to_str = staticmethod(EntsoeRawClient._datetime_to_str)
+    _endpoint_to_doctype = staticmethod(EntsoeRawClient._endpoint_to_doctype)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """Close the session, if the client created it"""
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        if self.session is None:
+            if aiohttp is None:
+                raise ImportError("AsyncEntsoeRawClient requires aiohttp: "
+                                  "pip install aiohttp")
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    def _client_timeout(self):
+        if aiohttp is None or self.timeout is None:
+            return None
+        if isinstance(self.timeout, tuple):
+            connect, read = self.timeout
+        else:
+            connect = read = self.timeout
+        return aiohttp.ClientTimeout(total=None, sock_connect=connect,
+                                     sock_read=read)
+
+    async def base_request(self, params, start, end):
+        """
+        Parameters
+        ----------
+        params : dict
+        start : pd.Timestamp
+        end : pd.Timestamp
+
+        Returns
+        -------
+        requests.Response
+            the body is read completely, with the same extra attributes as
+            EntsoeRawClient.base_request
+        """
+        hooks = self.hooks['request']
+        if not hooks:
+            return await self._base_request(params, start, end)
+        started = monotonic()
+        try:
+            response = await self._base_request(params, start, end)
+        except Exception as e:
+            dispatch(hooks, request_event(params, None,
+                                          monotonic() - started, error=e))
+            raise
+        dispatch(hooks, request_event(params, response,
+                                      monotonic() - started))
+        return response
+
+    @async_retry
+    async def _base_request(self, params, start, end):
+        start_str = self._datetime_to_str(start)
+        end_str = self._datetime_to_str(end)
+
+        base_params = {
+            'securityToken': self.api_key,
+            'periodStart': start_str,
+            'periodEnd': end_str
+        }
+        params.update(base_params)
+
+        key = None
+        if self.negative_cache is not None:
+            key = cache_key(params)
+            if await self._blocking(self.negative_cache.contains, key):
+                raise NoMatchingDataError
+
+        if self.cache is not None:
+            content = await self._blocking(self.cache.get, params)
+            if content is not None:
+                return cached_response(content)
+
+        async with self._semaphore:
+            wait = 0.0
+            if self.rate_limiter is not None:
+                wait = await self._blocking(self.rate_limiter.reserve)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            response = await self._get(params)
+        response.rate_limit_wait = wait
+        response.from_cache = False
+        try:
+            check_response(response)
+        except NoMatchingDataError:
+            if key is not None:
+                await self._blocking(self.negative_cache.add, key, end=end)
+            raise
+        if self.cache is not None:
+            await self._blocking(self.cache.set, params, response.content)
+        return response
+
+    @staticmethod
+    async def _blocking(func, *args, **kwargs):
+        """Call func on the loop's default executor: the caches and the
+        SQLite rate limiter do file I/O and may wait for locks"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(func, *args,
+                                                        **kwargs))
+
+    async def _get(self, params):
+        """
+        Perform the GET request and wrap the result in a requests.Response,
+        so errors are mapped exactly like in the synchronous client
+
+        Parameters
+        ----------
+        params : dict
+
+        Returns
+        -------
+        requests.Response
+        """
+        session = self._get_session()
+        try:
+            async with session.get(URL, params=params, proxy=self.proxy,
+                                   timeout=self._client_timeout()) as resp:
+                content = await resp.read()
+                response = requests.Response()
+                response.status_code = resp.status
+                response.reason = resp.reason
+                response.url = str(resp.url)
+                response.headers = requests.structures.CaseInsensitiveDict(
+                    resp.headers)
+                response.encoding = requests.utils.get_encoding_from_headers(
+                    response.headers)
+                response._content = content
+        except asyncio.TimeoutError as e:
+            raise requests.Timeout(e) from e
+        except Exception as e:
+            if aiohttp is not None and isinstance(e,
+                                                  aiohttp.ClientConnectionError):
+                raise requests.ConnectionError(e) from e
+            raise
+        return response
+
+    async def _query(self, params, start, end):
+        response = await self.base_request(params=params, start=start,
+                                           end=end)
+        if self.raw_bytes:
+            return response.content
+        return response.text
+
+    async def query_day_ahead_prices(self, country_code, start, end):
+        """
+        Parameters
+        ----------
+        country_code : str
+        start : pd.Timestamp
+        end : pd.Timestamp
+
+        Returns
+        -------
+        str | bytes
+        """
+        domain = BIDDING_ZONES[country_code]
+        params = {
+            'documentType': self._endpoint_to_doctype('Price Document'),
+            'in_Domain': domain,
+            'out_Domain': domain
+        }
+        return await self._query(params, start, end)
+
+    async def query_load(self, country_code, start, end):
+        """
+        Parameters
+        ----------
+        country_code : str
+        start : pd.Timestamp
+        end : pd.Timestamp
+
+        Returns
+        -------
+        str | bytes
+        """
+        domain = BIDDING_ZONES[country_code]
+        params = {
+            'documentType': self._endpoint_to_doctype('System total load'),
+            'processType': 'A16',
+            'outBiddingZone_Domain': domain,
+            'out_Domain': domain
+        }
+        return await self._query(params, start, end)
+
+    async def query_generation_forecast(self, country_code, start, end,
+                                        psr_type=None, lookup_bzones=False):
+        """
+        Parameters
+        ----------
+        country_code : str
+        start : pd.Timestamp
+        end : pd.Timestamp
+        psr_type : str
+            filter on a single psr type
+        lookup_bzones : bool
+            if True, country_code is expected to be a bidding zone
+
+        Returns
+        -------
+        str | bytes
+        """
+        if not lookup_bzones:
+            domain = DOMAIN_MAPPINGS[country_code]
+        else:
+            domain = BIDDING_ZONES[country_code]
+        params = {
+            'documentType': self._endpoint_to_doctype('Wind and solar forecast'),
+            'processType': 'A01',
+            'in_Domain': domain,
+        }
+        if psr_type:
+            params.update({'psrType': psr_type})
+        return await self._query(params, start, end)
+
+    async def query_generation(self, country_code, start, end, psr_type=None,
+                               lookup_bzones=False):
+        """
+        Parameters
+        ----------
+        country_code : str
+        start : pd.Timestamp
+        end : pd.Timestamp
+        psr_type : str
+            filter on a single psr type
+        lookup_bzones : bool
+            if True, country_code is expected to be a bidding zone
+
+        Returns
+        -------
+        str | bytes
+        """
+        if not lookup_bzones:
+            domain = DOMAIN_MAPPINGS[country_code]
+        else:
+            domain = BIDDING_ZONES[country_code]
+        params = {
+            'documentType': self._endpoint_to_doctype('Actual generation per type'),
+            'processType': 'A16',
+            'in_Domain': domain,
+        }
+        if psr_type:
+            params.update({'psrType': psr_type})
+        return await self._query(params, start, end)
+
+    async def query_installed_generation_capacity(self, country_code, start,
+                                                  end, psr_type=None):
+        """
+        Parameters
+        ----------
+        country_code : str
+        start : pd.Timestamp
+        end : pd.Timestamp
+        psr_type : str
+            filter query for a specific psr type
+
+        Returns
+        -------
+        str | bytes
+        """
+        domain = DOMAIN_MAPPINGS[country_code]
+        params = {
+            'documentType': self._endpoint_to_doctype('Installed generation per type'),
+            'processType': 'A33',
+            'in_Domain': domain,
+        }
+        if psr_type:
+            params.update({'psrType': psr_type})
+        return await self._query(params, start, end)
+
+    async def query_crossborder_flows(self, country_code_from, country_code_to,
+                                      start, end):
+        """
+        Parameters
+        ----------
+        country_code_from : str
+        country_code_to : str
+        start : pd.Timestamp
+        end : pd.Timestamp
+
+        Returns
+        -------
+        str | bytes
+        """
+        params = {
+            'documentType': self._endpoint_to_doctype('Aggregated energy data report'),
+            'in_Domain': DOMAIN_MAPPINGS[country_code_to],
+            'out_Domain': DOMAIN_MAPPINGS[country_code_from]
+        }
+        return await self._query(params, start, end)
+
+    async def query_imbalance_prices(self, country_code, start, end,
+                                     psr_type=None):
+        """
+        Parameters
+        ----------
+        country_code : str
+        start : pd.Timestamp
+        end : pd.Timestamp
+        psr_type : str
+            filter query for a specific psr type
+
+        Returns
+        -------
+        str | bytes
+        """
+        domain = DOMAIN_MAPPINGS[country_code]
+        params = {
+            'documentType': self._endpoint_to_doctype('Imbalance prices'),
+            'controlArea_Domain': domain,
+        }
+        if psr_type:
+            params.update({'psrType': psr_type})
+        return await self._query(params, start, end)
+
+    async def query_unavailability_of_generation_units(
+            self, country_code, start, end, docstatus=None) -> bytes:
+        """
+        This endpoint serves ZIP files.
+        The query is limited to 200 items per request.
+
+        Parameters
+        ----------
+        country_code : str
+        start : pd.Timestamp
+        end : pd.Timestamp
+        docstatus : str, optional
+
+        Returns
+        -------
+        bytes
+        """
+        params = {
+            'documentType': self._endpoint_to_doctype('Production unavailability'),
+            'biddingZone_domain': DOMAIN_MAPPINGS[country_code]
+        }
+        if docstatus:
+            params['docStatus'] = docstatus
+        response = await self.base_request(params=params, start=start,
+                                           end=end)
+        return response.content
+
+    async def query_withdrawn_unavailability_of_generation_units(
+            self, country_code, start, end):
+        """
+        Parameters
+        ----------
+        country_code : str
+        start : pd.Timestamp
+        end : pd.Timestamp
+        """
+        return await self.query_unavailability_of_generation_units(
+            country_code=country_code, start=start, end=end, docstatus='A13')
+
+
+class AsyncEntsoePandasClient(AsyncEntsoeRawClient):
+    """
+    asyncio counterpart of EntsoePandasClient. Yearly blocks and paginated
+    requests are fetched concurrently, and the XML is parsed in an executor
+    so the event loop is not blocked.
+    """
+
+    def __init__(self, *args, parser_engine='bs4', skip_empty_blocks=False,
+                 parse_in_executor=True, parse_executor=None,
+                 parse_workers=None, **kwargs):
+        """
+        Parameters
+        ----------
+        parser_engine : str
+            'bs4' (default) or 'lxml', see EntsoePandasClient
+        skip_empty_blocks : bool
+            see EntsoePandasClient
+        parse_in_executor : bool
+            parse responses with loop.run_in_executor instead of on the
+            event loop
+        parse_executor : concurrent.futures.Executor, optional
+            executor used for parsing, the loop's default executor if None
+        parse_workers : int, optional
+            see EntsoePandasClient
+
+        All other parameters are passed on to AsyncEntsoeRawClient, except
+        that raw_bytes is True by default: the parsers read the response
+        bodies as they were received
+        """
+        kwargs.setdefault('raw_bytes', True)
+        super(AsyncEntsoePandasClient, self).__init__(*args, **kwargs)
+        self.parser_engine = parser_engine
+        self.skip_empty_blocks = skip_empty_blocks
+        # window size per endpoint and filters found by paginated
+        self.pagination_windows = {}
+        self.parse_in_executor = parse_in_executor
+        self.parse_executor = parse_executor
+        self.parse_workers = parse_workers
+        self._parse_pool = None
+
+    async def close(self):
+        """Close the session, if the client created it, and the parse pool"""
+        await super(AsyncEntsoePandasClient, self).close()
+        if self._parse_pool is not None:
+            pool, self._parse_pool = self._parse_pool, None
+            await self._blocking(pool.shutdown)
+
+    def _parse_pool_executor(self):
+        if not self.parse_workers:
+            return None
+        if self._parse_pool is None:
+            self._parse_pool = ProcessPoolExecutor(
+                max_workers=self.parse_workers)
+        return self._parse_pool
+
+    async def _parse(self, parser, content, **kwargs):
+        func = partial(parser, content, engine=self.parser_engine, **kwargs)
+        hooks = self.hooks['parse']
+        if hooks:
+            func = partial(timed_parse, func, parser, content)
+        if self.parse_in_executor:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.parse_executor, func)
+        else:
+            result = func()
+        if hooks:
+            return report_parse(hooks, result)
+        return result
+
+    @async_year_limited
+    async def query_day_ahead_prices(self, country_code, start, end):
+        """
+        Returns
+        -------
+        pd.Series
+        """
+        text = await super(AsyncEntsoePandasClient,
+                           self).query_day_ahead_prices(
+            country_code=country_code, start=start, end=end)
+        series = await self._parse(parse_prices, text)
+        return series.tz_convert(TIMEZONE_MAPPINGS[country_code])
+
+    @async_year_limited
+    async def query_load(self, country_code, start, end):
+        """
+        Returns
+        -------
+        pd.Series
+        """
+        text = await super(AsyncEntsoePandasClient, self).query_load(
+            country_code=country_code, start=start, end=end)
+        series = await self._parse(parse_loads, text)
+        return series.tz_convert(TIMEZONE_MAPPINGS[country_code])
+
+    @async_year_limited
+    async def query_generation_forecast(self, country_code, start, end,
+                                        psr_type=None, lookup_bzones=False):
+        """
+        Returns
+        -------
+        pd.DataFrame
+        """
+        text = await super(AsyncEntsoePandasClient,
+                           self).query_generation_forecast(
+            country_code=country_code, start=start, end=end,
+            psr_type=psr_type, lookup_bzones=lookup_bzones)
+        df = await self._parse(parse_generation, text)
+        return df.tz_convert(TIMEZONE_MAPPINGS[country_code])
+
+    @async_year_limited
+    async def query_generation(self, country_code, start, end, psr_type=None,
+                               lookup_bzones=False):
+        """
+        Returns
+        -------
+        pd.DataFrame
+        """
+        text = await super(AsyncEntsoePandasClient, self).query_generation(
+            country_code=country_code, start=start, end=end,
+            psr_type=psr_type, lookup_bzones=lookup_bzones)
+        df = await self._parse(parse_generation, text)
+        return df.tz_convert(TIMEZONE_MAPPINGS[country_code])
+
+    @async_year_limited
+    async def query_installed_generation_capacity(self, country_code, start,
+                                                  end, psr_type=None):
+        """
+        Returns
+        -------
+        pd.DataFrame
+        """
+        text = await super(AsyncEntsoePandasClient,
+                           self).query_installed_generation_capacity(
+            country_code=country_code, start=start, end=end,
+            psr_type=psr_type)
+        df = await self._parse(parse_generation, text)
+        return df.tz_convert(TIMEZONE_MAPPINGS[country_code])
+
+    @async_year_limited
+    async def query_crossborder_flows(self, country_code_from, country_code_to,
+                                      start, end):
+        """
+        Note: Result will be in the timezone of the origin country
+
+        Returns
+        -------
+        pd.Series
+        """
+        text = await super(AsyncEntsoePandasClient,
+                           self).query_crossborder_flows(
+            country_code_from=country_code_from,
+            country_code_to=country_code_to, start=start, end=end)
+        ts = await self._parse(parse_crossborder_flows, text)
+        return ts.tz_convert(TIMEZONE_MAPPINGS[country_code_from])
+
+    @async_year_limited
+    async def query_imbalance_prices(self, country_code, start, end,
+                                     psr_type=None):
+        """
+        Returns
+        -------
+        pd.DataFrame
+        """
+        text = await super(AsyncEntsoePandasClient,
+                           self).query_imbalance_prices(
+            country_code=country_code, start=start, end=end,
+            psr_type=psr_type)
+        df = await self._parse(parse_imbalance_prices, text)
+        return df.tz_convert(TIMEZONE_MAPPINGS[country_code])
+
+    @async_year_limited
+    @async_paginated
+    async def query_unavailability_of_generation_units(
+            self, country_code, start, end, docstatus=None):
+        """
+        Returns
+        -------
+        pd.DataFrame
+        """
+        content = await super(AsyncEntsoePandasClient,
+                              self).query_unavailability_of_generation_units(
+            country_code=country_code, start=start, end=end,
+            docstatus=docstatus)
+        df = await self._parse(parse_unavailabilities, content,
+                               executor=self._parse_pool_executor())
+        tz = TIMEZONE_MAPPINGS[country_code]
+        df = df.tz_convert(tz)
+        df['start'] = df['start'].apply(lambda x: x.tz_convert(tz))
+        df['end'] = df['end'].apply(lambda x: x.tz_convert(tz))
+        return df
+
+    async def query_withdrawn_unavailability_of_generation_units(
+            self, country_code, start, end):
+        """
+        Returns
+        -------
+        pd.DataFrame
+        """
+        return await self.query_unavailability_of_generation_units(
+            country_code=country_code, start=start, end=end, docstatus='A13')
@@ -1,10 +1,32 @@
+import threading
+
 import pandas as pd
+import requests
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 from .entsoerawclient import EntsoeRawClient
+from .exceptions import NoMatchingDataError
 from .mappings import BIDDING_ZONES
+from .mappings import DOMAIN_MAPPINGS
+from .mappings import NEIGHBOURS
+from .mappings import PSRTYPE_MAPPINGS
 from .mappings import TIMEZONE_MAPPINGS
+from .metrics import report_parse
+from .metrics import timed_parse
+from .misc import BulkResult
+from .misc import Coalescer
+from .misc import Pipeline
 from .misc import day_limited
+from .misc import fetch_zones
+from .misc import flow_matrix
+from .misc import long_flows
+from .misc import net_flows
 from .misc import paginated
+from .misc import wide_frame
+from .misc import year_blocks
+from .misc import year_iterator
 from .misc import year_limited
 from .parsers import parse_crossborder_flows
 from .parsers import parse_generation
@@ -16,6 +38,130 @@ from .parsers import parse_units
 
 
 class EntsoePandasClient(EntsoeRawClient):
+    def __init__(self, *args, parser_engine='bs4', max_workers=None,
+                 skip_empty_blocks=False, parse_workers=None, prefetch=None,
+                 coalesce_psr_types=None, **kwargs):
+        """
+        Parameters
+        ----------
+        parser_engine : str
+            'bs4' (default) or 'lxml', the engine used to parse the XML
+            responses. 'lxml' streams the TimeSeries elements and is a lot
+            faster on large responses, but requires lxml to be installed.
+        max_workers : int, optional
+            if set, queries spanning several blocks (eg. multiple years) fetch
+            the blocks concurrently on a pool of this many threads. By default
+            the blocks are fetched one after the other.
+        skip_empty_blocks : bool
+            if True, blocks for which the API returns no data are left out of
+            the result instead of raising NoMatchingDataError for the whole
+            query. The error is still raised if all blocks are empty.
+        parse_workers : int, optional
+            if set, large unavailability archives are parsed on a pool of
+            this many processes, created on first use
+        prefetch : int, optional
+            if set, queries spanning several blocks request up to this many
+            blocks ahead in the background while the current one is parsed.
+            Requests are still made one at a time, so the request rate does
+            not go up. Cannot be combined with max_workers.
+        coalesce_psr_types : float, optional
+            if set, generation queries filtered on a psr type are served
+            from one unfiltered request per zone and period, which is
+            shared for this many seconds. Querying several psr types of the
+            same zone and period then costs a single request.
+
+        All other parameters are passed on to EntsoeRawClient, except that
+        raw_bytes is True by default: the parsers read the response bodies
+        as they were received, without decoding them to str first
+        """
+        kwargs.setdefault('raw_bytes', True)
+        if max_workers and prefetch:
+            raise ValueError("Use either max_workers or prefetch")
+        super(EntsoePandasClient, self).__init__(*args, **kwargs)
+        self.parser_engine = parser_engine
+        self.max_workers = max_workers
+        self.skip_empty_blocks = skip_empty_blocks
+        # window size per endpoint and filters found by paginated
+        self.pagination_windows = {}
+        self.parse_workers = parse_workers
+        self.prefetch = prefetch
+        if prefetch:
+            self._request_slot = Pipeline()
+        self._parse_pool = None
+        self._parse_pool_lock = threading.Lock()
+        self._psr_coalescer = None
+        if coalesce_psr_types is not None:
+            self._psr_coalescer = Coalescer(ttl=coalesce_psr_types)
+        if max_workers and kwargs.get('session') is None:
+            # requests keeps at most 10 connections per host by default
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=max_workers, pool_maxsize=max_workers)
+            self.session.mount('https://', adapter)
+
+    def close(self):
+        """Shut down the threads and processes the client started"""
+        super(EntsoePandasClient, self).close()
+        with self._parse_pool_lock:
+            pool, self._parse_pool = self._parse_pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def _parse_executor(self):
+        """
+        Returns
+        -------
+        concurrent.futures.ProcessPoolExecutor | None
+            the pool to parse unavailability archives on, if parse_workers
+            is set
+        """
+        if not self.parse_workers:
+            return None
+        with self._parse_pool_lock:
+            if self._parse_pool is None:
+                self._parse_pool = ProcessPoolExecutor(
+                    max_workers=self.parse_workers)
+        return self._parse_pool
+
+    def _parse(self, parser, content, **kwargs):
+        """
+        Call parser on content with the parser engine of the client,
+        reporting the call to the 'parse' hooks if there are any
+        """
+        hooks = self.hooks['parse']
+        if not hooks:
+            return parser(content, engine=self.parser_engine, **kwargs)
+        func = partial(parser, content, engine=self.parser_engine, **kwargs)
+        return report_parse(hooks, timed_parse(func, parser, content))
+
+    def _query_generation_frame(self, query, psr_type, **kwargs):
+        """
+        Parameters
+        ----------
+        query : callable
+            query method of EntsoeRawClient returning a generation document
+        psr_type : str | None
+        kwargs
+            passed on to query
+
+        Returns
+        -------
+        pd.DataFrame
+            in UTC
+        """
+        if psr_type is None or self._psr_coalescer is None:
+            text = query(psr_type=psr_type, **kwargs)
+            return self._parse(parse_generation, text)
+
+        def unfiltered():
+            return self._parse(parse_generation, query(**kwargs))
+
+        key = (query.__name__,) + tuple(sorted(kwargs.items()))
+        df = self._psr_coalescer.get(key, unfiltered)
+        column = PSRTYPE_MAPPINGS[psr_type]
+        if column not in df.columns:
+            raise NoMatchingDataError
+        return df[[column]].dropna(how='all')
+
     @year_limited
     def query_day_ahead_prices(self, country_code, start, end) -> pd.Series:
         """
@@ -31,10 +177,12 @@ class EntsoePandasClient(EntsoeRawClient):
         """
         text = super(EntsoePandasClient, self).query_day_ahead_prices(
             country_code=country_code, start=start, end=end)
-        series = parse_prices(text)
+        series = self._parse(parse_prices, text)
         series = series.tz_convert(TIMEZONE_MAPPINGS[country_code])
         return series
 
+    iter_day_ahead_prices = year_iterator(query_day_ahead_prices)
+
     @year_limited
     def query_load(self, country_code, start, end) -> pd.Series:
         """
@@ -50,10 +198,12 @@ class EntsoePandasClient(EntsoeRawClient):
         """
         text = super(EntsoePandasClient, self).query_load(
             country_code=country_code, start=start, end=end)
-        series = parse_loads(text)
+        series = self._parse(parse_loads, text)
         series = series.tz_convert(TIMEZONE_MAPPINGS[country_code])
         return series
 
+    iter_load = year_iterator(query_load)
+
     @year_limited
     def query_generation_forecast(self, country_code, start, end, psr_type=None,
                                   lookup_bzones=False):
@@ -72,13 +222,15 @@ class EntsoePandasClient(EntsoeRawClient):
         -------
         pd.DataFrame
         """
-        text = super(EntsoePandasClient, self).query_generation_forecast(
-            country_code=country_code, start=start, end=end, psr_type=psr_type,
+        df = self._query_generation_frame(
+            super(EntsoePandasClient, self).query_generation_forecast, psr_type,
+            country_code=country_code, start=start, end=end,
             lookup_bzones=lookup_bzones)
-        df = parse_generation(text)
         df = df.tz_convert(TIMEZONE_MAPPINGS[country_code])
         return df
 
+    iter_generation_forecast = year_iterator(query_generation_forecast)
+
     @year_limited
     def query_generation(self, country_code, start, end, psr_type=None,
                          lookup_bzones=False):
@@ -97,13 +249,15 @@ class EntsoePandasClient(EntsoeRawClient):
         -------
         pd.DataFrame
         """
-        text = super(EntsoePandasClient, self).query_generation(
-            country_code=country_code, start=start, end=end, psr_type=psr_type,
+        df = self._query_generation_frame(
+            super(EntsoePandasClient, self).query_generation, psr_type,
+            country_code=country_code, start=start, end=end,
             lookup_bzones=lookup_bzones)
-        df = parse_generation(text)
         df = df.tz_convert(TIMEZONE_MAPPINGS[country_code])
         return df
 
+    iter_generation = year_iterator(query_generation)
+
     @year_limited
     def query_installed_generation_capacity(self, country_code, start, end,
                                             psr_type=None):
@@ -120,13 +274,16 @@ class EntsoePandasClient(EntsoeRawClient):
         -------
         pd.DataFrame
         """
-        text = super(
-            EntsoePandasClient, self).query_installed_generation_capacity(
-            country_code=country_code, start=start, end=end, psr_type=psr_type)
-        df = parse_generation(text)
+        df = self._query_generation_frame(
+            super(EntsoePandasClient,
+                  self).query_installed_generation_capacity, psr_type,
+            country_code=country_code, start=start, end=end)
         df = df.tz_convert(TIMEZONE_MAPPINGS[country_code])
         return df
 
+    iter_installed_generation_capacity = year_iterator(
+        query_installed_generation_capacity)
+
     @year_limited
     def query_crossborder_flows(self, country_code_from, country_code_to, start, end):
         """
@@ -146,10 +303,12 @@ class EntsoePandasClient(EntsoeRawClient):
         text = super(EntsoePandasClient, self).query_crossborder_flows(
             country_code_from=country_code_from,
             country_code_to=country_code_to, start=start, end=end)
-        ts = parse_crossborder_flows(text)
+        ts = self._parse(parse_crossborder_flows, text)
         ts = ts.tz_convert(TIMEZONE_MAPPINGS[country_code_from])
         return ts
 
+    iter_crossborder_flows = year_iterator(query_crossborder_flows)
+
     @year_limited
     def query_imbalance_prices(self, country_code, start, end, psr_type=None):
         """
@@ -167,10 +326,12 @@ class EntsoePandasClient(EntsoeRawClient):
         """
         text = super(EntsoePandasClient, self).query_imbalance_prices(
             country_code=country_code, start=start, end=end, psr_type=psr_type)
-        df = parse_imbalance_prices(text)
+        df = self._parse(parse_imbalance_prices, text)
         df = df.tz_convert(TIMEZONE_MAPPINGS[country_code])
         return df
 
+    iter_imbalance_prices = year_iterator(query_imbalance_prices)
+
     @year_limited
     @paginated
     def query_unavailability_of_generation_units(self, country_code, start, end,
@@ -191,7 +352,54 @@ class EntsoePandasClient(EntsoeRawClient):
                         self).query_unavailability_of_generation_units(
             country_code=country_code, start=start, end=end,
             docstatus=docstatus)
-        df = parse_unavailabilities(content)
+        return self._parse_unavailabilities(content, country_code)
+
+    def iter_unavailability_of_generation_units(self, country_code, start,
+                                                end, docstatus=None):
+        """
+        Page through the documents with the offset parameter, per year,
+        yielding each page as soon as it is parsed
+
+        Parameters
+        ----------
+        country_code : str
+        start : pd.Timestamp
+        end : pd.Timestamp
+        docstatus : str, optional
+
+        Yields
+        -------
+        pd.DataFrame
+            at most 200 documents
+
+        Raises
+        ------
+        NoMatchingDataError
+            if there are no documents in the whole period
+        """
+        found = False
+        for _start, _end in year_blocks(start, end):
+            pages = super(EntsoePandasClient,
+                          self).iter_unavailability_of_generation_units(
+                country_code=country_code, start=_start, end=_end,
+                docstatus=docstatus)
+            try:
+                for content in pages:
+                    found = True
+                    yield self._parse_unavailabilities(content, country_code)
+            except NoMatchingDataError:
+                continue
+        if not found:
+            raise NoMatchingDataError
+
+    def _parse_unavailabilities(self, content, country_code):
+        try:
+            df = self._parse(parse_unavailabilities, content,
+                             executor=self._parse_executor())
+        finally:
+            # a spooled download is a temporary file
+            if hasattr(content, 'close'):
+                content.close()
         df = df.tz_convert(TIMEZONE_MAPPINGS[country_code])
         df['start'] = df['start'].apply(
             lambda x: x.tz_convert(TIMEZONE_MAPPINGS[country_code]))
@@ -223,9 +431,135 @@ class EntsoePandasClient(EntsoeRawClient):
         content = super(EntsoePandasClient, self).query_units(
             country_code=BIDDING_ZONES[bz_domain],
             start=start, end=end, psr_type=psr_type)
-        df = parse_units(content).tz_convert(TIMEZONE_MAPPINGS[bz_domain])
+        df = self._parse(parse_units, content)
+        df = df.tz_convert(TIMEZONE_MAPPINGS[bz_domain])
         df['start'] = df['start'].apply(
             lambda x: x.tz_convert(TIMEZONE_MAPPINGS[bz_domain]))
         df['end'] = df['end'].apply(
             lambda x: x.tz_convert(TIMEZONE_MAPPINGS[bz_domain]))
         return df
+
+    @staticmethod
+    def _zones(country_codes, mapping):
+        if isinstance(country_codes, str):
+            if country_codes == 'all':
+                return list(mapping)
+            return [country_codes]
+        return list(country_codes)
+
+    def query_day_ahead_prices_bulk(self, country_codes, start, end):
+        """
+        Day-ahead prices of several zones at once, queried concurrently
+
+        Parameters
+        ----------
+        country_codes : [str] | 'all'
+            'all' is every zone in BIDDING_ZONES
+        start : pd.Timestamp
+        end : pd.Timestamp
+
+        Returns
+        -------
+        BulkResult
+            `data` is a DataFrame on a UTC index with one column per zone,
+            `failures` maps the zones that failed to their exception
+        """
+        results, failures = fetch_zones(
+            self, self.query_day_ahead_prices,
+            self._zones(country_codes, BIDDING_ZONES), start=start, end=end)
+        return BulkResult(wide_frame(results), failures)
+
+    def query_load_bulk(self, country_codes, start, end):
+        """
+        Load of several zones at once, queried concurrently
+
+        Parameters
+        ----------
+        country_codes : [str] | 'all'
+            'all' is every zone in BIDDING_ZONES
+        start : pd.Timestamp
+        end : pd.Timestamp
+
+        Returns
+        -------
+        BulkResult
+            `data` is a DataFrame on a UTC index with one column per zone,
+            `failures` maps the zones that failed to their exception
+        """
+        results, failures = fetch_zones(
+            self, self.query_load,
+            self._zones(country_codes, BIDDING_ZONES), start=start, end=end)
+        return BulkResult(wide_frame(results), failures)
+
+    def query_generation_bulk(self, country_codes, start, end, psr_type=None):
+        """
+        Generation per type of several zones at once, queried concurrently
+
+        Parameters
+        ----------
+        country_codes : [str] | 'all'
+            'all' is every zone in DOMAIN_MAPPINGS
+        start : pd.Timestamp
+        end : pd.Timestamp
+        psr_type : str, optional
+            filter on a single psr type
+
+        Returns
+        -------
+        BulkResult
+            `data` is a DataFrame on a UTC index with a column MultiIndex
+            (zone, production type), or one column per zone if psr_type is
+            given. `failures` maps the zones that failed to their exception
+        """
+        results, failures = fetch_zones(
+            self, self.query_generation,
+            self._zones(country_codes, DOMAIN_MAPPINGS), start=start,
+            end=end, psr_type=psr_type)
+        df = wide_frame(results)
+        if psr_type is not None and isinstance(df.columns, pd.MultiIndex):
+            df.columns = df.columns.get_level_values(0)
+        return BulkResult(df, failures)
+
+    def query_crossborder_flows_matrix(self, start, end, country_codes=None,
+                                       net=False, as_array=False):
+        """
+        Flows over every border between the given countries (see
+        mappings.NEIGHBOURS), both directions queried concurrently
+
+        Parameters
+        ----------
+        start : pd.Timestamp
+        end : pd.Timestamp
+        country_codes : [str] | 'all', optional
+            all countries in NEIGHBOURS by default
+        net : bool
+            combine both directions of every border into the net flow from
+            the alphabetically first country to the other
+        as_array : bool
+            return a FlowMatrix (time x from x to) instead of a long
+            DataFrame
+
+        Returns
+        -------
+        BulkResult
+            `data` is a DataFrame with columns time (UTC), from, to and
+            flow, or a FlowMatrix. `failures` maps the (from, to) pairs
+            that failed to their exception.
+        """
+        zones = self._zones(country_codes or 'all', NEIGHBOURS)
+        selected = set(zones)
+        pairs = [(a, b) for a in zones for b in NEIGHBOURS.get(a, [])
+                 if b in selected]
+        results, failures = fetch_zones(self, self._query_flow_pair, pairs,
+                                        start=start, end=end)
+        wide = wide_frame(results)
+        if net:
+            wide = net_flows(wide)
+        if as_array:
+            return BulkResult(flow_matrix(wide, zones, antisymmetric=net),
+                              failures)
+        return BulkResult(long_flows(wide), failures)
+
+    def _query_flow_pair(self, pair, start, end):
+        return self.query_crossborder_flows(pair[0], pair[1], start=start,
+                                            end=end)
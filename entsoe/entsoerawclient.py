@@ -1,7 +1,24 @@
+from .cache import cache_key
+from .cache import cached_response
+from .metrics import dispatch
+from .metrics import make_hooks
+from .metrics import request_event
+from .misc import LatencyTracker
+from .misc import client_retry_policy
 from .misc import retry
 
 import pytz
+import re
 import requests
+import tempfile
+import threading
+import zipfile
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from io import BytesIO
+from time import monotonic
 
 from bs4 import BeautifulSoup
 
@@ -12,6 +29,71 @@ from .mappings import DOCUMENTTYPE
 from .mappings import DOMAIN_MAPPINGS
 
 URL = 'https://transparency.entsoe.eu/api'
+# documents per ZIP response, and the largest offset the API accepts
+PAGE_SIZE = 200
+MAX_OFFSET = 4800
+
+
+def _zip_member_count(content):
+    """Number of documents in a ZIP response, given as bytes or a file"""
+    if isinstance(content, bytes):
+        content = BytesIO(content)
+    position = content.tell()
+    with zipfile.ZipFile(content) as arc:
+        count = len(arc.namelist())
+    content.seek(position)
+    return count
+
+
+def _document_count(label, error_text):
+    match = re.search(label + r':\s*(\d+)', error_text)
+    return int(match.group(1)) if match else None
+
+
+def _close_response(future):
+    """Done callback closing the response of a request that lost the race"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def check_response(response):
+    """
+    Raise the appropriate error if the API answered with an error
+
+    Parameters
+    ----------
+    response : requests.Response
+
+    Raises
+    ------
+    NoMatchingDataError
+    PaginationError
+    requests.HTTPError
+    """
+    try:
+        response.raise_for_status()
+    except requests.HTTPError as e:
+        soup = BeautifulSoup(response.text, 'html.parser')
+        text = soup.find_all('text')
+        if len(text):
+            error_text = soup.find('text').text
+            error = None
+            if 'No matching data found' in error_text:
+                error = NoMatchingDataError()
+            elif 'amount of requested data exceeds allowed limit' \
+                    in error_text:
+                requested = _document_count('Requested', error_text)
+                allowed = _document_count('Allowed', error_text) or 200
+                error = PaginationError(
+                    "The API is limited to {} elements per request. This "
+                    "query requested for {} documents and cannot be "
+                    "fulfilled as is.".format(allowed, requested),
+                    requested=requested, allowed=allowed)
+            if error is not None:
+                # like requests.HTTPError, so the hooks see the status
+                error.response = response
+                raise error
+        raise e
 
 
 class EntsoeRawClient:
@@ -25,18 +107,54 @@ class EntsoeRawClient:
     """
 
     def __init__(self, api_key, session=None, retry_count=1, retry_delay=0,
-                 proxies=None):
+                 proxies=None, rate_limiter=None, retry_policy=None,
+                 timeout=(10, 120), hedge_percentile=None, cache=None,
+                 negative_cache=None, spool_threshold=None, raw_bytes=False,
+                 hooks=None):
         """
         Parameters
         ----------
         api_key : str
         session : requests.Session
         retry_count : int
-            number of times to retry the call if the connection fails
+            number of times to retry the call if the connection fails or
+            the API is throttling or unavailable
         retry_delay: int
-            amount of seconds to wait between retries
+            amount of seconds to wait before the first retry, doubled for
+            every next retry. 0 uses the backoff of RetryPolicy.
         proxies : dict
             requests proxies
+        rate_limiter : entsoe.ratelimit.RateLimiter, optional
+            every request first waits for the rate limiter. Pass the same
+            limiter to all clients that share an API key.
+        retry_policy : entsoe.misc.RetryPolicy, optional
+            full control over retries, overrides retry_count and retry_delay
+        timeout : float | (float, float) | None
+            connect and read timeout in seconds of every request
+        hedge_percentile : float, optional
+            between 0 and 1. If set, a request that is still running after
+            this percentile of the recent latencies for its document type
+            is duplicated, and whichever response arrives first is used.
+            The duplicate also waits for the rate limiter.
+        cache : entsoe.cache.ResponseCache, optional
+            successful responses are stored in and served from this cache
+        negative_cache : entsoe.cache.NegativeCache, optional
+            requests that returned no data are remembered here, and raise
+            NoMatchingDataError without a round trip until the entry expires
+        spool_threshold : int, optional
+            if set, ZIP responses are streamed into a temporary file instead
+            of being read into memory, and returned as that (seekable) file.
+            The file is kept in memory up to this many bytes, and moved to
+            disk when it grows larger.
+        raw_bytes : bool
+            if True, the XML query methods return the response body as
+            bytes, as received, instead of decoding it to str. The parsers
+            accept both.
+        hooks : dict, optional
+            callables per event, called with a RequestEvent after every
+            request ('request') and a ParseEvent after every parser call
+            ('parse'), see entsoe.metrics. More can be added later to
+            `client.hooks[event]`.
         """
         if api_key is None:
             raise TypeError("API key cannot be None")
@@ -47,20 +165,75 @@ class EntsoeRawClient:
         self.proxies = proxies
         self.retry_count = retry_count
         self.retry_delay = retry_delay
-
-    @retry
-    def base_request(self, params, start, end):
+        self.rate_limiter = rate_limiter
+        if retry_policy is None:
+            retry_policy = client_retry_policy(retry_count, retry_delay)
+        self.retry_policy = retry_policy
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedged_requests = 0
+        self.latency_tracker = LatencyTracker()
+        self.cache = cache
+        self.negative_cache = negative_cache
+        self.spool_threshold = spool_threshold
+        self.raw_bytes = raw_bytes
+        self.hooks = make_hooks(hooks)
+        # limits the requests in flight, when set by a subclass
+        self._request_slot = None
+        self._hedge_executor = None
+        self._hedge_lock = threading.Lock()
+        if hedge_percentile is not None:
+            self._hedge_executor = ThreadPoolExecutor(
+                thread_name_prefix='entsoe-hedge')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Shut down the threads the client started. Requests made after
+        closing are no longer hedged."""
+        with self._hedge_lock:
+            executor, self._hedge_executor = self._hedge_executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def base_request(self, params, start, end, stream=False):
         """
         Parameters
         ----------
         params : dict
         start : pd.Timestamp
         end : pd.Timestamp
+        stream : bool
+            stream the body into a tempfile.SpooledTemporaryFile, set as
+            `spool` on the returned response, instead of reading it into
+            memory
 
         Returns
         -------
         requests.Response
+            with extra attributes `rate_limit_wait`, the seconds spent
+            waiting for the rate limiter, `retries` and `from_cache`
         """
+        hooks = self.hooks['request']
+        if not hooks:
+            return self._base_request(params, start, end, stream=stream)
+        started = monotonic()
+        try:
+            response = self._base_request(params, start, end, stream=stream)
+        except Exception as e:
+            dispatch(hooks, request_event(params, None,
+                                          monotonic() - started, error=e))
+            raise
+        dispatch(hooks, request_event(params, response,
+                                      monotonic() - started))
+        return response
+
+    @retry
+    def _base_request(self, params, start, end, stream=False):
         start_str = self._datetime_to_str(start)
         end_str = self._datetime_to_str(end)
 
@@ -71,27 +244,148 @@ class EntsoeRawClient:
         }
         params.update(base_params)
 
-        response = self.session.get(url=URL, params=params,
-                                    proxies=self.proxies)
-        try:
-            response.raise_for_status()
-        except requests.HTTPError as e:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            text = soup.find_all('text')
-            if len(text):
-                error_text = soup.find('text').text
-                if 'No matching data found' in error_text:
-                    raise NoMatchingDataError
-                elif 'amount of requested data \
-                      exceeds allowed limit' in error_text:
-                    requested = error_text.split(' ')[-2]
-                    raise PaginationError(
-                        f"The API is limited to 200 elements per request. \
-                          This query requested for {requested} documents and \
-                          cannot be fulfilled as is.")
-            raise e
+        key = None
+        if self.negative_cache is not None:
+            key = cache_key(params)
+            if self.negative_cache.contains(key):
+                raise NoMatchingDataError
+
+        if self.cache is not None:
+            content = self.cache.get(params)
+            if content is not None:
+                response = cached_response(content)
+                if stream:
+                    response.spool = self._spool([content])
+                return response
+
+        if self._request_slot is not None:
+            with self._request_slot:
+                response = self._send(params, stream=stream)
         else:
-            return response
+            response = self._send(params, stream=stream)
+        response.from_cache = False
+        try:
+            check_response(response)
+        except NoMatchingDataError:
+            if key is not None:
+                self.negative_cache.add(key, end=end)
+            raise
+        if stream:
+            try:
+                response.spool = self._spool(
+                    response.iter_content(chunk_size=64 * 1024))
+            finally:
+                response.close()
+            if self.cache is not None:
+                self.cache.set_file(params, response.spool)
+                response.spool.seek(0)
+        elif self.cache is not None:
+            self.cache.set(params, response.content)
+        return response
+
+    def _body(self, response):
+        """
+        Parameters
+        ----------
+        response : requests.Response
+
+        Returns
+        -------
+        str | bytes
+            the body, decoded unless raw_bytes is set
+        """
+        if self.raw_bytes:
+            return response.content
+        return response.text
+
+    def _spool(self, chunks):
+        """
+        Parameters
+        ----------
+        chunks : iterable of bytes
+
+        Returns
+        -------
+        tempfile.SpooledTemporaryFile
+            holding the chunks, positioned at the start
+        """
+        # a max_size of 0 would keep the file in memory forever
+        spool = tempfile.SpooledTemporaryFile(
+            max_size=max(self.spool_threshold, 1))
+        try:
+            for chunk in chunks:
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool
+
+    def _send(self, params, stream=False):
+        """
+        Perform the GET request, hedged if the client is configured to
+
+        Parameters
+        ----------
+        params : dict
+        stream : bool
+
+        Returns
+        -------
+        requests.Response
+        """
+        doc_type = params.get('documentType')
+        delay = None
+        if self.hedge_percentile is not None:
+            delay = self.latency_tracker.percentile(doc_type,
+                                                    self.hedge_percentile)
+        executor = self._hedge_executor
+        if delay is None or executor is None:
+            return self._get(params, doc_type, stream)
+
+        # the delay counts from when the request gets past the rate limiter
+        sent = threading.Event()
+        first = executor.submit(self._get, params, doc_type, stream, sent)
+        sent.wait()
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        with self._hedge_lock:
+            self.hedged_requests += 1
+        second = executor.submit(self._get, params, doc_type, stream)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                loser = second if future is first else first
+                # frees the pooled connection of a streamed response
+                loser.add_done_callback(_close_response)
+                return response
+        raise error
+
+    def _get(self, params, doc_type, stream=False, sent=None):
+        """sent, a threading.Event, is set when the request is sent"""
+        rate_limit_wait = 0.0
+        try:
+            if self.rate_limiter is not None:
+                rate_limit_wait = self.rate_limiter.acquire()
+        finally:
+            if sent is not None:
+                sent.set()
+        started = monotonic()
+        kwargs = {'stream': True} if stream else {}
+        response = self.session.get(url=URL, params=params,
+                                    proxies=self.proxies, timeout=self.timeout,
+                                    **kwargs)
+        self.latency_tracker.record(doc_type, monotonic() - started)
+        response.rate_limit_wait = rate_limit_wait
+        return response
 
     @staticmethod
     def _endpoint_to_doctype(endpoint: str):
@@ -132,7 +426,7 @@ class EntsoeRawClient:
 
         Returns
         -------
-        str
+        str | bytes
         """
         domain = BIDDING_ZONES[country_code]
         params = {
@@ -141,7 +435,7 @@ class EntsoeRawClient:
             'out_Domain': domain
         }
         response = self.base_request(params=params, start=start, end=end)
-        return response.text
+        return self._body(response)
 
     def query_load(self, country_code, start, end):
         """
@@ -153,7 +447,7 @@ class EntsoeRawClient:
 
         Returns
         -------
-        str
+        str | bytes
         """
         domain = BIDDING_ZONES[country_code]
         params = {
@@ -163,7 +457,7 @@ class EntsoeRawClient:
             'out_Domain': domain
         }
         response = self.base_request(params=params, start=start, end=end)
-        return response.text
+        return self._body(response)
 
     def query_generation_forecast(self, country_code, start, end, psr_type=None, lookup_bzones=False):
         """
@@ -179,7 +473,7 @@ class EntsoeRawClient:
 
         Returns
         -------
-        str
+        str | bytes
         """
         if not lookup_bzones:
             domain = DOMAIN_MAPPINGS[country_code]
@@ -195,7 +489,7 @@ class EntsoeRawClient:
             params.update({'psrType': psr_type})
 
         response = self.base_request(params=params, start=start, end=end)
-        return response.text
+        return self._body(response)
 
     def query_generation(self, country_code, start, end, psr_type=None, lookup_bzones=False):
         """
@@ -211,7 +505,7 @@ class EntsoeRawClient:
 
         Returns
         -------
-        str
+        str | bytes
         """
         if not lookup_bzones:
             domain = DOMAIN_MAPPINGS[country_code]
@@ -227,7 +521,7 @@ class EntsoeRawClient:
             params.update({'psrType': psr_type})
 
         response = self.base_request(params=params, start=start, end=end)
-        return response.text
+        return self._body(response)
 
     def query_installed_generation_capacity(self, country_code, start, end, psr_type=None):
         """
@@ -241,7 +535,7 @@ class EntsoeRawClient:
 
         Returns
         -------
-        str
+        str | bytes
         """
         domain = DOMAIN_MAPPINGS[country_code]
         params = {
@@ -253,7 +547,7 @@ class EntsoeRawClient:
             params.update({'psrType': psr_type})
 
         response = self.base_request(params=params, start=start, end=end)
-        return response.text
+        return self._body(response)
 
     def query_crossborder_flows(self, country_code_from, country_code_to, start, end):
         """
@@ -266,7 +560,7 @@ class EntsoeRawClient:
 
         Returns
         -------
-        str
+        str | bytes
         """
         domain_in = DOMAIN_MAPPINGS[country_code_to]
         domain_out = DOMAIN_MAPPINGS[country_code_from]
@@ -276,7 +570,7 @@ class EntsoeRawClient:
             'out_Domain': domain_out
         }
         response = self.base_request(params=params, start=start, end=end)
-        return response.text
+        return self._body(response)
 
     def query_imbalance_prices(self, country_code, start, end, psr_type=None):
         """
@@ -290,7 +584,7 @@ class EntsoeRawClient:
 
         Returns
         -------
-        str
+        str | bytes
         """
         domain = DOMAIN_MAPPINGS[country_code]
         params = {
@@ -300,7 +594,27 @@ class EntsoeRawClient:
         if psr_type:
             params.update({'psrType': psr_type})
         response = self.base_request(params=params, start=start, end=end)
-        return response.text
+        return self._body(response)
+
+    def _unavailability_params(self, country_code, docstatus=None):
+        domain = DOMAIN_MAPPINGS[country_code]
+        params = {
+            'documentType': self._endpoint_to_doctype('Production unavailability'),
+            'biddingZone_domain': domain
+            # ,'businessType': 'A53 (unplanned) | A54 (planned)'
+        }
+
+        if docstatus:
+            params['docStatus'] = docstatus
+        return params
+
+    def _zip_request(self, params, start, end):
+        if self.spool_threshold is not None:
+            response = self.base_request(params=params, start=start, end=end,
+                                         stream=True)
+            return response.spool
+        response = self.base_request(params=params, start=start, end=end)
+        return response.content
 
     def query_unavailability_of_generation_units(self,
                                                  country_code, start, end,
@@ -318,21 +632,60 @@ class EntsoeRawClient:
 
         Returns
         -------
-        bytes
+        bytes | tempfile.SpooledTemporaryFile
+            a file if the client has a spool_threshold, which the caller
+            should close
         """
-        domain = DOMAIN_MAPPINGS[country_code]
-        params = {
-            'documentType': self._endpoint_to_doctype('Production unavailability'),
-            'biddingZone_domain': domain
-            # ,'businessType': 'A53 (unplanned) | A54 (planned)'
-        }
+        params = self._unavailability_params(country_code, docstatus)
+        return self._zip_request(params, start, end)
 
-        if docstatus:
-            params['docStatus'] = docstatus
+    def iter_unavailability_of_generation_units(self, country_code, start,
+                                                end, docstatus=None):
+        """
+        Page through all documents of the period with the offset parameter,
+        200 documents at a time, instead of splitting the period
 
-        response = self.base_request(params=params, start=start, end=end)
+        Parameters
+        ----------
+        country_code : str
+        start : pd.Timestamp
+        end : pd.Timestamp
+        docstatus : str, optional
 
-        return response.content
+        Yields
+        -------
+        bytes | tempfile.SpooledTemporaryFile
+            one ZIP archive per page, see
+            query_unavailability_of_generation_units
+
+        Raises
+        ------
+        NoMatchingDataError
+            if there are no documents at all
+        PaginationError
+            if the period holds more documents than the API pages through
+            (MAX_OFFSET + PAGE_SIZE), the period has to be split
+        """
+        params = self._unavailability_params(country_code, docstatus)
+        offset = 0
+        while True:
+            try:
+                content = self._zip_request(dict(params, offset=offset),
+                                            start, end)
+            except NoMatchingDataError:
+                if offset == 0:
+                    raise
+                return
+            full = _zip_member_count(content) >= PAGE_SIZE
+            yield content
+            if not full:
+                return
+            offset += PAGE_SIZE
+            if offset > MAX_OFFSET:
+                raise PaginationError(
+                    "The API pages through at most {} documents, split the "
+                    "period".format(MAX_OFFSET + PAGE_SIZE),
+                    allowed=MAX_OFFSET + PAGE_SIZE)
 
     def query_withdrawn_unavailability_of_generation_units(
             self, country_code, start, end):
@@ -1,6 +1,20 @@
 class PaginationError(Exception):
-    pass
+    """
+    The query asks for more documents than the API returns at once.
+
+    Attributes
+    ----------
+    requested : int | None
+        number of documents the query asked for, if the API reported it
+    allowed : int | None
+        maximum number of documents per request
+    """
+
+    def __init__(self, *args, requested=None, allowed=None):
+        super(PaginationError, self).__init__(*args)
+        self.requested = requested
+        self.allowed = allowed
 
 
 class NoMatchingDataError(Exception):
-    pass
\ No newline at end of file
+    pass
@@ -43,6 +43,51 @@ DOMAIN_MAPPINGS = {
     'DE-AT-LU': '10Y1001A1001A63L',
 }
 
+# countries in DOMAIN_MAPPINGS that share an interconnector
+NEIGHBOURS = {
+    'AL': ['GR', 'ME', 'RS'],
+    'AT': ['CH', 'CZ', 'DE', 'HU', 'IT', 'SI'],
+    'BA': ['HR', 'ME', 'RS'],
+    'BE': ['DE', 'FR', 'GB', 'LU', 'NL'],
+    'BG': ['GR', 'MK', 'RO', 'RS', 'TR'],
+    'BY': ['LT', 'RU', 'UA'],
+    'CH': ['AT', 'DE', 'FR', 'IT'],
+    'CZ': ['AT', 'DE', 'PL', 'SK'],
+    'DE': ['AT', 'BE', 'CH', 'CZ', 'DK', 'FR', 'LU', 'NL', 'NO', 'PL',
+           'SE'],
+    'DK': ['DE', 'GB', 'NL', 'NO', 'SE'],
+    'EE': ['FI', 'LV', 'RU'],
+    'ES': ['FR', 'PT'],
+    'FI': ['EE', 'NO', 'RU', 'SE'],
+    'FR': ['BE', 'CH', 'DE', 'ES', 'GB', 'IT', 'LU'],
+    'GB': ['BE', 'DK', 'FR', 'GB-NIR', 'IE', 'NL', 'NO'],
+    'GB-NIR': ['GB', 'IE'],
+    'GR': ['AL', 'BG', 'IT', 'MK', 'TR'],
+    'HR': ['BA', 'HU', 'RS', 'SI'],
+    'HU': ['AT', 'HR', 'RO', 'RS', 'SK', 'UA'],
+    'IE': ['GB', 'GB-NIR'],
+    'IT': ['AT', 'CH', 'FR', 'GR', 'ME', 'MT', 'SI'],
+    'LT': ['BY', 'LV', 'PL', 'RU-KGD', 'SE'],
+    'LU': ['BE', 'DE', 'FR'],
+    'LV': ['EE', 'LT', 'RU'],
+    'ME': ['AL', 'BA', 'IT', 'RS'],
+    'MK': ['BG', 'GR', 'RS'],
+    'MT': ['IT'],
+    'NL': ['BE', 'DE', 'DK', 'GB', 'NO'],
+    'NO': ['DE', 'DK', 'FI', 'GB', 'NL', 'RU', 'SE'],
+    'PL': ['CZ', 'DE', 'LT', 'SE', 'SK', 'UA'],
+    'PT': ['ES'],
+    'RO': ['BG', 'HU', 'RS', 'UA'],
+    'RS': ['AL', 'BA', 'BG', 'HR', 'HU', 'ME', 'MK', 'RO'],
+    'RU': ['BY', 'EE', 'FI', 'LV', 'NO', 'UA'],
+    'RU-KGD': ['LT'],
+    'SE': ['DE', 'DK', 'FI', 'LT', 'NO', 'PL'],
+    'SI': ['AT', 'HR', 'IT'],
+    'SK': ['CZ', 'HU', 'PL', 'UA'],
+    'TR': ['BG', 'GR'],
+    'UA': ['BY', 'HU', 'PL', 'RO', 'RU', 'SK'],
+}
+
 BIDDING_ZONES = DOMAIN_MAPPINGS.copy()
 BIDDING_ZONES.update({
     'DE': '10Y1001A1001A63L',  # DE-AT-LU
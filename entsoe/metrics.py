@@ -0,0 +1,359 @@
+import bisect
+import logging
+import re
+import threading
+
+from collections import namedtuple
+from time import monotonic
+
+from .mappings import DOCUMENTTYPE
+
+logger = logging.getLogger(__name__)
+
+EVENTS = ('request', 'parse')
+
+RequestEvent = namedtuple('RequestEvent', [
+    'params', 'doc_type', 'status', 'latency', 'bytes', 'retries',
+    'rate_limit_wait', 'from_cache', 'error'])
+RequestEvent.__doc__ = """
+Passed to the 'request' hooks after every base_request: the request
+parameters (without the API key), the document type, the HTTP status (None
+if there was no response), the seconds the request took including retries
+and waiting for the rate limiter, the size of the body, the number of
+retries, the seconds waited for the rate limiter, whether the response came
+from the cache, and the exception if the request failed
+"""
+
+ParseEvent = namedtuple('ParseEvent', [
+    'parser', 'doc_type', 'timeseries', 'points', 'seconds', 'error'])
+ParseEvent.__doc__ = """
+Passed to the 'parse' hooks after every parser call: the name of the
+parser, the document type, the number of TimeSeries and Points in the
+document (None for ZIP archives), the seconds parsing took and the
+exception if parsing failed
+"""
+
+# upper bounds in seconds of the histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_DOC_TYPE = re.compile(r'<type>\s*(\w+)\s*</type>')
+
+
+def make_hooks(hooks=None):
+    """
+    Parameters
+    ----------
+    hooks : dict, optional
+        callables per event, eg. {'request': [func]}
+
+    Returns
+    -------
+    dict
+        a list of callables for every event in EVENTS
+    """
+    result = {event: [] for event in EVENTS}
+    for event, funcs in (hooks or {}).items():
+        if event not in result:
+            raise ValueError("Unknown event '{}', choose one of {}"
+                             .format(event, EVENTS))
+        if callable(funcs):
+            funcs = [funcs]
+        result[event].extend(funcs)
+    return result
+
+
+def dispatch(hooks, event):
+    """Call every hook with event, logging instead of raising their errors
+    so a broken hook does not fail the query"""
+    for hook in hooks:
+        try:
+            hook(event)
+        except Exception:
+            logger.exception("%r failed", hook)
+
+
+def request_event(params, response, latency, error=None):
+    """
+    Parameters
+    ----------
+    params : dict
+    response : requests.Response | None
+    latency : float
+    error : Exception, optional
+
+    Returns
+    -------
+    RequestEvent
+    """
+    params = {k: v for k, v in params.items() if k != 'securityToken'}
+    if response is None:
+        response = getattr(error, 'response', None)
+    status = n_bytes = None
+    if response is not None:
+        status = response.status_code
+        spool = getattr(response, 'spool', None)
+        if spool is not None:
+            position = spool.tell()
+            n_bytes = spool.seek(0, 2)
+            spool.seek(position)
+        else:
+            n_bytes = len(response.content or b'')
+    return RequestEvent(
+        params=params, doc_type=params.get('documentType'), status=status,
+        latency=latency, bytes=n_bytes,
+        retries=getattr(response, 'retries', None),
+        rate_limit_wait=getattr(response, 'rate_limit_wait', None),
+        from_cache=getattr(response, 'from_cache', False), error=error)
+
+
+def timed_parse(func, parser, content):
+    """
+    Call func, a call of parser on content, and time it
+
+    Returns
+    -------
+    (object, ParseEvent)
+        the result of func (None if it failed) and the event, which holds
+        the exception if func failed
+    """
+    doc_type, timeseries, points = document_stats(content)
+    started = monotonic()
+    try:
+        result, error = func(), None
+    except Exception as e:
+        result, error = None, e
+    return result, ParseEvent(
+        parser=parser.__name__, doc_type=doc_type, timeseries=timeseries,
+        points=points, seconds=monotonic() - started, error=error)
+
+
+def report_parse(hooks, outcome):
+    """
+    Pass the event of timed_parse to the hooks
+
+    Returns
+    -------
+    object
+        the result of the parser, or raises its exception
+    """
+    result, event = outcome
+    dispatch(hooks, event)
+    if event.error is not None:
+        raise event.error
+    return result
+
+
+def document_stats(content):
+    """
+    Parameters
+    ----------
+    content : str | bytes | file-like
+
+    Returns
+    -------
+    (str | None, int | None, int | None)
+        the document type and the number of TimeSeries and Points, all None
+        if content is not an XML document
+    """
+    if isinstance(content, (bytearray, memoryview)):
+        content = bytes(content)
+    if isinstance(content, bytes):
+        if content[:2] == b'PK':
+            return None, None, None
+        header = content[:4096].decode('utf-8', 'replace')
+        return (_document_type(header), content.count(b'<TimeSeries>'),
+                content.count(b'<Point>'))
+    if isinstance(content, str):
+        return (_document_type(content[:4096]),
+                content.count('<TimeSeries>'), content.count('<Point>'))
+    return None, None, None
+
+
+def _document_type(header):
+    match = _DOC_TYPE.search(header)
+    return match.group(1) if match else None
+
+
+class Histogram:
+    """Counts of observed values per bucket, with their sum and maximum"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Parameters
+        ----------
+        buckets : [float]
+            increasing upper bounds, values above the last one are counted
+            in an extra bucket
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Returns
+        -------
+        float | None
+            upper bound of the bucket holding the q-quantile, the maximum
+            for the last bucket, None if nothing was observed
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        buckets = {str(b): c for b, c in zip(self.buckets, self.counts)}
+        buckets['inf'] = self.counts[-1]
+        return {'count': self.count, 'sum': self.sum, 'max': self.max,
+                'buckets': buckets}
+
+
+class MetricsCollector:
+    """
+    In-memory metrics of the requests and parser calls of one or more
+    clients: counters and latency histograms per endpoint (document type)
+    and per parser.
+
+        metrics = MetricsCollector()
+        client = EntsoePandasClient(api_key, hooks=metrics.hooks())
+        ...
+        metrics.log()
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Parameters
+        ----------
+        buckets : [float]
+            upper bounds in seconds of the histogram buckets
+        """
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def hooks(self):
+        """
+        Returns
+        -------
+        dict
+            to pass as `hooks` to a client
+        """
+        return {'request': [self.on_request], 'parse': [self.on_parse]}
+
+    def attach(self, client):
+        """Add the hooks of the collector to a client"""
+        client.hooks['request'].append(self.on_request)
+        client.hooks['parse'].append(self.on_parse)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self._parsers = {}
+
+    def on_request(self, event):
+        name = DOCUMENTTYPE.get(event.doc_type, event.doc_type)
+        with self._lock:
+            stats = self._endpoints.get(name)
+            if stats is None:
+                stats = {'requests': 0, 'errors': 0, 'cache_hits': 0,
+                         'retries': 0, 'bytes': 0, 'rate_limit_wait': 0.0,
+                         'status': {}, 'latency': Histogram(self.buckets)}
+                self._endpoints[name] = stats
+            stats['requests'] += 1
+            if event.error is not None:
+                stats['errors'] += 1
+            if event.from_cache:
+                stats['cache_hits'] += 1
+            stats['retries'] += event.retries or 0
+            stats['bytes'] += event.bytes or 0
+            stats['rate_limit_wait'] += event.rate_limit_wait or 0.0
+            if event.status is not None:
+                stats['status'][event.status] = \
+                    stats['status'].get(event.status, 0) + 1
+            stats['latency'].observe(event.latency)
+
+    def on_parse(self, event):
+        with self._lock:
+            stats = self._parsers.get(event.parser)
+            if stats is None:
+                stats = {'calls': 0, 'errors': 0, 'timeseries': 0,
+                         'points': 0, 'time': Histogram(self.buckets)}
+                self._parsers[event.parser] = stats
+            stats['calls'] += 1
+            if event.error is not None:
+                stats['errors'] += 1
+            stats['timeseries'] += event.timeseries or 0
+            stats['points'] += event.points or 0
+            stats['time'].observe(event.seconds)
+
+    def snapshot(self):
+        """
+        Returns
+        -------
+        dict
+            {'requests': {endpoint: counters}, 'parsers': {parser:
+            counters}}, with the histograms as dicts, ready for json.dumps
+        """
+        def export(stats):
+            return {k: v.to_dict() if isinstance(v, Histogram) else
+                    dict(v) if isinstance(v, dict) else v
+                    for k, v in stats.items()}
+
+        with self._lock:
+            return {'requests': {name: export(stats) for name, stats
+                                 in self._endpoints.items()},
+                    'parsers': {name: export(stats) for name, stats
+                                in self._parsers.items()}}
+
+    def totals(self):
+        """
+        Returns
+        -------
+        dict
+            requests, errors, bytes and the seconds spent on requests
+            (including retries and the rate limit), waiting for the rate
+            limit and parsing, over all endpoints and parsers
+        """
+        with self._lock:
+            endpoints = list(self._endpoints.values())
+            parsers = list(self._parsers.values())
+        return {
+            'requests': sum(s['requests'] for s in endpoints),
+            'errors': sum(s['errors'] for s in endpoints),
+            'bytes': sum(s['bytes'] for s in endpoints),
+            'request_time': sum(s['latency'].sum for s in endpoints),
+            'rate_limit_wait': sum(s['rate_limit_wait'] for s in endpoints),
+            'parse_time': sum(s['time'].sum for s in parsers),
+        }
+
+    def log(self, log=logger, level=logging.INFO):
+        """Log one line per endpoint and per parser"""
+        with self._lock:
+            endpoints = sorted(self._endpoints.items(), key=str)
+            parsers = sorted(self._parsers.items())
+            for name, s in endpoints:
+                latency = s['latency']
+                log.log(level, "%s: %d requests, %d errors, %d from cache, "
+                        "%d retries, %d bytes, p50 %.2fs, p95 %.2fs, "
+                        "max %.2fs", name, s['requests'], s['errors'],
+                        s['cache_hits'], s['retries'], s['bytes'],
+                        latency.quantile(0.5), latency.quantile(0.95),
+                        latency.max)
+            for name, s in parsers:
+                log.log(level, "%s: %d calls, %d TimeSeries, %d points, "
+                        "%.2fs", name, s['calls'], s['timeseries'],
+                        s['points'], s['time'].sum)
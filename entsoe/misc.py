@@ -1,14 +1,35 @@
+import asyncio
+import logging
+import math
+import random
+import threading
+
+import numpy as np
 import pandas as pd
 import requests
 
+from .cache import cache_key
+from .exceptions import NoMatchingDataError
 from .exceptions import PaginationError
+from collections import deque
+from collections import namedtuple
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from functools import partial
 from functools import wraps
 from socket import gaierror
+from time import monotonic
 from time import sleep
 
 from dateutil import rrule
+from itertools import islice
 from itertools import tee
 
+logger = logging.getLogger(__name__)
+
 
 def year_blocks(start, end):
     """
@@ -71,77 +92,971 @@ def pairwise(iterable):
     return zip(a, b)
 
 
+class RetryPolicy:
+    """
+    Decides which failed requests are retried and how long to wait before
+    each retry: exponential backoff with jitter, capped per retry and in
+    total, honoring the Retry-After header of throttled responses.
+
+    Connection errors, timeouts and HTTP responses with a status in
+    `retry_statuses` are retried. NoMatchingDataError, PaginationError and
+    other HTTP errors never are, retrying them gives the same answer.
+    """
+
+    def __init__(self, max_retries=3, backoff=1.0, max_backoff=60.0,
+                 jitter=0.5, max_elapsed=None,
+                 retry_statuses=(429, 500, 502, 503, 504)):
+        """
+        Parameters
+        ----------
+        max_retries : int
+            number of retries after the first attempt
+        backoff : float
+            seconds to wait before the first retry, doubled for every next one
+        max_backoff : float
+            upper limit in seconds of a single wait
+        jitter : float
+            between 0 and 1, the fraction of every wait that is randomised,
+            so that concurrent clients don't retry in lockstep
+        max_elapsed : float, optional
+            give up when a retry would end more than this many seconds after
+            the first attempt started
+        retry_statuses : tuple
+            HTTP status codes that are retried
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.max_elapsed = max_elapsed
+        self.retry_statuses = tuple(retry_statuses)
+
+    def should_retry(self, error):
+        """
+        Parameters
+        ----------
+        error : Exception
+
+        Returns
+        -------
+        bool
+        """
+        if isinstance(error, (NoMatchingDataError, PaginationError)):
+            return False
+        if isinstance(error, requests.HTTPError):
+            response = error.response
+            return (response is not None
+                    and response.status_code in self.retry_statuses)
+        return isinstance(error, (requests.ConnectionError, requests.Timeout,
+                                  requests.exceptions.ChunkedEncodingError,
+                                  gaierror))
+
+    def delay(self, attempt, error=None):
+        """
+        Seconds to wait before retry number `attempt` (counting from 0)
+
+        Parameters
+        ----------
+        attempt : int
+        error : Exception, optional
+            the error that caused the retry
+
+        Returns
+        -------
+        float
+        """
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        delay *= 1 - self.jitter * random.random()
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+def client_retry_policy(retry_count, retry_delay):
+    """
+    The RetryPolicy of the retry_count and retry_delay arguments of the
+    clients. A retry_delay of 0, their default, keeps the backoff of
+    RetryPolicy, so throttled requests are not retried at once.
+
+    Parameters
+    ----------
+    retry_count : int
+    retry_delay : float
+
+    Returns
+    -------
+    RetryPolicy
+    """
+    if retry_delay:
+        return RetryPolicy(max_retries=retry_count, backoff=retry_delay)
+    return RetryPolicy(max_retries=retry_count)
+
+
+def _retry_after(error):
+    """
+    Seconds requested by the Retry-After header of the response that caused
+    the error, if any
+
+    Parameters
+    ----------
+    error : Exception
+
+    Returns
+    -------
+    float | None
+    """
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
 def retry(func):
-    """Catches connection errors, waits and retries"""
+    """Retries failed requests according to the retry_policy of the client,
+    see RetryPolicy. The number of retries needed is set as `retries` on the
+    returned response."""
     @wraps(func)
-    def retry_wrapper(*args, **kwargs):
-        self = args[0]
-        error = None
-        for _ in range(self.retry_count):
+    def retry_wrapper(self, *args, **kwargs):
+        policy = self.retry_policy
+        started = monotonic()
+        attempt = 0
+        while True:
             try:
-                result = func(*args, **kwargs)
-            except (requests.ConnectionError, gaierror) as e:
-                error = e
-                print("Connection Error, retrying in {} seconds".format(
-                    self.retry_delay))
-                sleep(self.retry_delay)
-                continue
+                result = func(self, *args, **kwargs)
+            except Exception as e:
+                if attempt >= policy.max_retries or not policy.should_retry(e):
+                    raise
+                delay = policy.delay(attempt, e)
+                if (policy.max_elapsed is not None and
+                        monotonic() - started + delay > policy.max_elapsed):
+                    raise
+                attempt += 1
+                logger.warning("%s failed with %r, retry %d of %d in %.1f "
+                               "seconds", func.__name__, e, attempt,
+                               policy.max_retries, delay)
+                sleep(delay)
             else:
+                if isinstance(result, requests.Response):
+                    result.retries = attempt
                 return result
-        else:
-            raise error
     return retry_wrapper
 
 
+def async_retry(func):
+    """Coroutine counterpart of retry"""
+    @wraps(func)
+    async def retry_wrapper(self, *args, **kwargs):
+        policy = self.retry_policy
+        started = monotonic()
+        attempt = 0
+        while True:
+            try:
+                result = await func(self, *args, **kwargs)
+            except Exception as e:
+                if attempt >= policy.max_retries or not policy.should_retry(e):
+                    raise
+                delay = policy.delay(attempt, e)
+                if (policy.max_elapsed is not None and
+                        monotonic() - started + delay > policy.max_elapsed):
+                    raise
+                attempt += 1
+                logger.warning("%s failed with %r, retry %d of %d in %.1f "
+                               "seconds", func.__name__, e, attempt,
+                               policy.max_retries, delay)
+                await asyncio.sleep(delay)
+            else:
+                if isinstance(result, requests.Response):
+                    result.retries = attempt
+                return result
+    return retry_wrapper
+
+
+class LatencyTracker:
+    """
+    Keeps the most recent request latencies per document type, to derive
+    the latency percentiles used for hedging requests
+    """
+
+    def __init__(self, window=200, min_samples=20):
+        """
+        Parameters
+        ----------
+        window : int
+            number of most recent latencies kept per document type
+        min_samples : int
+            no percentile is reported until this many latencies are known
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def record(self, doc_type, seconds):
+        with self._lock:
+            latencies = self._latencies.get(doc_type)
+            if latencies is None:
+                latencies = deque(maxlen=self.window)
+                self._latencies[doc_type] = latencies
+            latencies.append(seconds)
+
+    def percentile(self, doc_type, q):
+        """
+        Parameters
+        ----------
+        doc_type : str
+        q : float
+            between 0 and 1
+
+        Returns
+        -------
+        float | None
+            None while fewer than min_samples latencies are known
+        """
+        with self._lock:
+            latencies = list(self._latencies.get(doc_type, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        return float(np.quantile(latencies, q))
+
+
+class Coalescer:
+    """
+    Shares the result of a call between all callers asking for the same key
+    within `ttl` seconds, including the ones that ask while the call is
+    still running, so it is only made once. NoMatchingDataError is shared
+    like a result, other errors only with the callers that were waiting.
+    """
+
+    def __init__(self, ttl=60.0):
+        """
+        Parameters
+        ----------
+        ttl : float
+            seconds a result is shared after the call finished
+        """
+        self.ttl = ttl
+        self.calls = 0
+        self.hits = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _expired(self, entry, now):
+        future, finished = entry
+        return finished is not None and now - finished > self.ttl
+
+    def get(self, key, func):
+        """
+        Parameters
+        ----------
+        key : hashable
+        func : callable
+            called without arguments if there is no shared result for key
+
+        Returns
+        -------
+        object
+            the result of func, or of an earlier call for the same key
+        """
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry, now):
+                self.hits += 1
+                owner = False
+            else:
+                for k in [k for k, e in self._entries.items()
+                          if self._expired(e, now)]:
+                    del self._entries[k]
+                entry = (Future(), None)
+                self._entries[key] = entry
+                self.calls += 1
+                owner = True
+        future = entry[0]
+        if owner:
+            try:
+                future.set_result(func())
+                keep = True
+            except NoMatchingDataError as e:
+                future.set_exception(e)
+                keep = True
+            except BaseException as e:
+                future.set_exception(e)
+                keep = False
+            with self._lock:
+                if keep:
+                    self._entries[key] = (future, monotonic())
+                elif self._entries.get(key) is entry:
+                    del self._entries[key]
+        return future.result()
+
+    def clear(self):
+        """Forget all shared results"""
+        with self._lock:
+            self._entries.clear()
+
+
+# documents are not spread evenly over time, so windows are split to be
+# filled to this fraction of the API's limit on average
+PAGINATION_FILL = 0.8
+# threads fetching the windows of a split query, if the client does not
+# set max_workers
+PAGINATION_WORKERS = 4
+
+
+def _pagination_key(func, args, kwargs):
+    """Identifies the endpoint and filters (zone, document status, ...) of
+    a call, args[0] being the client"""
+    filters = tuple(sorted((k, v) for k, v in kwargs.items()
+                           if k not in ('start', 'end')))
+    return (func.__name__,) + tuple(args[1:]) + filters
+
+
+# the API takes periods in whole hours
+MIN_PAGINATION_WINDOW = pd.Timedelta(hours=1)
+
+
+def _split_period(start, end, parts):
+    step = (end - start) / parts
+    edges = [start]
+    for i in range(1, parts):
+        edge = (start + step * i).floor(MIN_PAGINATION_WINDOW)
+        if edges[-1] < edge < end:
+            edges.append(edge)
+    edges.append(end)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _pagination_parts(error):
+    """Number of windows needed for the documents reported in the error,
+    two if the API did not report the count"""
+    if not error.requested or not error.allowed:
+        return 2
+    return max(2, math.ceil(error.requested /
+                            (error.allowed * PAGINATION_FILL)))
+
+
+def _pagination_windows(client, key, start, end, error=None):
+    """
+    Windows to split the period in: those of the window size remembered for
+    the key, or enough windows for the documents reported in the error, in
+    which case the window size is remembered. None if the period can be
+    fetched at once, or, with an error, if it cannot be split on whole hours.
+    """
+    sizes = getattr(client, 'pagination_windows', None)
+    if error is not None:
+        windows = _split_period(start, end, _pagination_parts(error))
+        if len(windows) < 2:
+            return None
+        if sizes is not None:
+            size = windows[0][1] - windows[0][0]
+            sizes[key] = min(size, sizes.get(key, size))
+        logger.info("%s requested %s documents, split in %d windows",
+                    key[0], error.requested, len(windows))
+        return windows
+    size = sizes.get(key) if sizes is not None else None
+    # split windows are rounded to whole hours
+    if size is None or end - start <= size + MIN_PAGINATION_WINDOW:
+        return None
+    windows = _split_period(start, end, math.ceil((end - start) / size))
+    return windows if len(windows) > 1 else None
+
+
+def _merge_windows(frames):
+    df = _concat_blocks(frames)
+    if isinstance(df, pd.DataFrame):
+        # documents overlapping two windows are returned for both
+        df = df[~df.reset_index().duplicated().to_numpy()]
+    return df
+
+
 def paginated(func):
-    """Catches a PaginationError, splits the requested period in two and tries
-    again. Finally it concatenates the results"""
+    """Catches a PaginationError and splits the requested period in as many
+    windows as needed for the number of documents the API reported, which
+    are fetched concurrently. Finally it concatenates the results.
+
+    The window size is remembered on the client (`pagination_windows`) per
+    endpoint and filters, so later calls are split up front."""
 
     @wraps(func)
     def pagination_wrapper(*args, **kwargs):
-        try:
-            df = func(*args, **kwargs)
-        except PaginationError:
-            start = kwargs.pop('start')
-            end = kwargs.pop('end')
-            pivot = start + (end - start) / 2
-            df1 = pagination_wrapper(*args, start=start, end=pivot, **kwargs)
-            df2 = pagination_wrapper(*args, start=pivot, end=end, **kwargs)
-            df = pd.concat([df1, df2])
-        return df
+        client = args[0]
+        key = _pagination_key(func, args, kwargs)
+        start = kwargs.pop('start')
+        end = kwargs.pop('end')
+        windows = _pagination_windows(client, key, start, end)
+        if windows is None:
+            try:
+                return func(*args, start=start, end=end, **kwargs)
+            except PaginationError as e:
+                if end - start <= MIN_PAGINATION_WINDOW:
+                    raise
+                windows = _pagination_windows(client, key, start, end,
+                                              error=e)
+                # no whole hour to split on, e.g. 10:00-11:30
+                if windows is None:
+                    raise
+
+        def fetch(window):
+            try:
+                return pagination_wrapper(*args, start=window[0],
+                                          end=window[1], **kwargs)
+            except NoMatchingDataError:
+                return None
+
+        workers = getattr(client, 'max_workers', None) or PAGINATION_WORKERS
+        with ThreadPoolExecutor(
+                max_workers=min(workers, len(windows))) as pool:
+            frames = list(pool.map(fetch, windows))
+        return _merge_windows(frames)
 
     return pagination_wrapper
 
 
+def _block_key(name, kwargs):
+    return cache_key(dict(kwargs, _call=name))
+
+
+def _block_end(kwargs):
+    return kwargs.get('end', kwargs.get('date'))
+
+
+def fetch_blocks(client, func, calls, name=None):
+    """
+    Call func once per block and concatenate the results in block order.
+
+    If the client has `max_workers` set, the blocks are fetched concurrently
+    on a thread pool. If it has `prefetch` set instead, the next blocks are
+    requested while the current one is parsed, see _pipelined. Otherwise
+    the blocks are fetched one after the other. A block that raises
+    NoMatchingDataError aborts the whole query, unless the client has
+    `skip_empty_blocks` set, in which case the block is left out. If all
+    blocks are empty, NoMatchingDataError is raised.
+
+    If the client has a `negative_cache` and a name for the call is given,
+    blocks that are known to be empty are not fetched at all.
+
+    Parameters
+    ----------
+    client : EntsoePandasClient
+    func : callable
+        called as func(**kwargs) for every block
+    calls : [dict]
+        keyword arguments for every block
+    name : str, optional
+        identifies the call (method and positional arguments) in the
+        negative cache
+
+    Returns
+    -------
+    pd.Series | pd.DataFrame
+    """
+    max_workers = getattr(client, 'max_workers', None)
+    prefetch = getattr(client, 'prefetch', None)
+    fetch = partial(_fetch_block, client, func, name)
+
+    if max_workers and len(calls) > 1:
+        with ThreadPoolExecutor(
+                max_workers=min(max_workers, len(calls))) as pool:
+            frames = list(pool.map(fetch, calls))
+    elif prefetch and len(calls) > 1:
+        frames = list(_pipelined(fetch, calls, prefetch,
+                                 getattr(client, '_request_slot', None)))
+    else:
+        frames = [fetch(kwargs) for kwargs in calls]
+
+    return _concat_blocks(frames)
+
+
+def _fetch_block(client, func, name, kwargs):
+    """
+    Call func(**kwargs) for one block, see fetch_blocks
+
+    Returns
+    -------
+    pd.Series | pd.DataFrame | None
+        None if the block is empty and the client skips empty blocks
+    """
+    skip_empty = getattr(client, 'skip_empty_blocks', False)
+    negative_cache = getattr(client, 'negative_cache', None)
+    if name is None:
+        negative_cache = None
+    try:
+        if negative_cache is not None:
+            key = _block_key(name, kwargs)
+            if negative_cache.contains(key):
+                raise NoMatchingDataError
+            try:
+                return func(**kwargs)
+            except NoMatchingDataError:
+                negative_cache.add(key, end=_block_end(kwargs))
+                raise
+        return func(**kwargs)
+    except NoMatchingDataError:
+        if not skip_empty:
+            raise
+        return None
+
+
+def iter_blocks(client, func, calls, name=None):
+    """
+    Iterator counterpart of fetch_blocks: call func once per block and
+    yield every result as soon as it is available, so only one block is
+    held in memory at a time
+
+    Parameters
+    ----------
+    client : EntsoePandasClient
+    func : callable
+    calls : [dict]
+    name : str, optional
+
+    Yields
+    -------
+    pd.Series | pd.DataFrame
+
+    Raises
+    ------
+    NoMatchingDataError
+        when a block is empty and the client does not skip empty blocks,
+        after the blocks before it have been yielded, or at the end if all
+        blocks are empty
+    """
+    prefetch = getattr(client, 'prefetch', None)
+    fetch = partial(_fetch_block, client, func, name)
+    if prefetch and len(calls) > 1:
+        frames = _pipelined(fetch, calls, prefetch,
+                            getattr(client, '_request_slot', None))
+    else:
+        frames = map(fetch, calls)
+    found = False
+    for frame in frames:
+        if frame is not None:
+            found = True
+            yield frame
+    if not found:
+        raise NoMatchingDataError
+
+
+class Pipeline:
+    """
+    Coordinates the threads of _pipelined: one thread at a time makes a
+    request, and one at a time does the rest of the work (mostly parsing,
+    which would only compete for the GIL). A task takes the work when its
+    request has finished, and hands it over when it starts another one, so
+    the download of the next block overlaps the parsing of the current one.
+
+    Used as a context manager around every request by the client.
+    """
+
+    def __init__(self):
+        self._request = threading.Lock()
+        self._work = threading.Lock()
+        self._local = threading.local()
+
+    def run(self, func, *args, **kwargs):
+        """Call func as a task of the pipeline: it takes the work once its
+        request has finished"""
+        self._local.task = True
+        self._local.working = False
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if self._local.working:
+                self._work.release()
+            self._local.task = False
+            self._local.working = False
+
+    def __enter__(self):
+        if getattr(self._local, 'working', False):
+            self._work.release()
+            self._local.working = False
+        self._request.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._request.release()
+        if getattr(self._local, 'task', False):
+            self._work.acquire()
+            self._local.working = True
+        return False
+
+
+def _pipelined(fetch, calls, depth, pipeline=None):
+    """
+    Yield fetch(kwargs) for every call in order, running up to `depth`
+    calls ahead of the one being consumed on background threads. At most
+    depth + 1 results are buffered, so a slow consumer holds back the
+    fetching.
+
+    With a Pipeline, that the client also uses around its requests, only
+    one thread at a time makes a request and one at a time parses: while a
+    block is parsed the next one is downloaded, without raising the request
+    rate.
+
+    Parameters
+    ----------
+    fetch : callable
+    calls : [dict]
+    depth : int
+    pipeline : Pipeline, optional
+
+    Yields
+    -------
+    pd.Series | pd.DataFrame | None
+    """
+    calls = iter(calls)
+    pending = deque()
+    pool = ThreadPoolExecutor(max_workers=depth + 1,
+                              thread_name_prefix='entsoe-prefetch')
+    if pipeline is not None:
+        fetch = partial(pipeline.run, fetch)
+    try:
+        for kwargs in islice(calls, depth + 1):
+            pending.append(pool.submit(fetch, kwargs))
+        while pending:
+            frame = pending.popleft().result()
+            for kwargs in islice(calls, 1):
+                pending.append(pool.submit(fetch, kwargs))
+            yield frame
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _concat_blocks(frames):
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        raise NoMatchingDataError
+    return pd.concat(frames)
+
+
+# threads querying the zones of a bulk query, if the client does not set
+# max_workers
+BULK_WORKERS = 8
+
+BulkResult = namedtuple('BulkResult', ['data', 'failures'])
+BulkResult.__doc__ = """
+Result of a query over several zones: `data` holds the zones that
+succeeded, `failures` maps every zone that failed to its exception
+"""
+
+
+def fetch_zones(client, func, zones, **kwargs):
+    """
+    Call func(zone, **kwargs) for every zone concurrently, on the client's
+    max_workers threads (BULK_WORKERS by default). The client's rate
+    limiter, if any, keeps the requests within the limit. A zone that
+    fails does not stop the others.
+
+    Parameters
+    ----------
+    client : EntsoePandasClient
+    func : callable
+    zones : [str]
+
+    Returns
+    -------
+    ({str: pd.Series | pd.DataFrame}, {str: Exception})
+        the results and the errors per zone, in the order of zones
+    """
+    def fetch(zone):
+        try:
+            return zone, func(zone, **kwargs), None
+        except Exception as e:
+            logger.warning("%s failed for %s: %r", func.__name__, zone, e)
+            return zone, None, e
+
+    results, failures = {}, {}
+    if not zones:
+        return results, failures
+    workers = getattr(client, 'max_workers', None) or BULK_WORKERS
+    with ThreadPoolExecutor(max_workers=min(workers, len(zones))) as pool:
+        for zone, result, error in pool.map(fetch, zones):
+            if error is None:
+                results[zone] = result
+            else:
+                failures[zone] = error
+    return results, failures
+
+
+def wide_frame(results):
+    """
+    Join the results per zone on a common UTC index, one column per zone,
+    or a column MultiIndex (zone, column) for DataFrames
+
+    Parameters
+    ----------
+    results : {str: pd.Series | pd.DataFrame}
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    if not results:
+        return pd.DataFrame(index=pd.DatetimeIndex([], tz='UTC'))
+    pieces = {}
+    for zone, result in results.items():
+        result = result.tz_convert('UTC')
+        pieces[zone] = result[~result.index.duplicated(keep='first')]
+    return pd.concat(pieces, axis=1).sort_index()
+
+
+FlowMatrix = namedtuple('FlowMatrix', ['values', 'index', 'zones'])
+FlowMatrix.__doc__ = """
+Flows between zones as a 3-D array: values[t, i, j] is the flow from
+zones[i] to zones[j] at index[t], NaN where there is no border or no data
+"""
+
+
+def net_flows(wide):
+    """
+    Parameters
+    ----------
+    wide : pd.DataFrame
+        flows with columns (from, to)
+
+    Returns
+    -------
+    pd.DataFrame
+        one column (a, b) per border, with a before b alphabetically,
+        holding the flow from a to b minus the flow from b to a. Borders
+        with only one direction in `wide` are left out.
+    """
+    pieces = {}
+    for a, b in wide.columns:
+        first, second = sorted((a, b))
+        if (first, second) in pieces or (second, first) not in wide.columns \
+                or (first, second) not in wide.columns:
+            continue
+        pieces[(first, second)] = wide[(first, second)].sub(
+            wide[(second, first)], fill_value=0)
+    if not pieces:
+        return pd.DataFrame(index=wide.index)
+    return pd.concat(pieces, axis=1)
+
+
+def flow_matrix(wide, zones, antisymmetric=False):
+    """
+    Parameters
+    ----------
+    wide : pd.DataFrame
+        flows with columns (from, to)
+    zones : [str]
+        the zones along the second and third axis, in this order
+    antisymmetric : bool
+        also fill in the reverse direction as the negative flow, for net
+        flows
+
+    Returns
+    -------
+    FlowMatrix
+    """
+    position = {zone: i for i, zone in enumerate(zones)}
+    values = np.full((len(wide), len(zones), len(zones)), np.nan)
+    for (a, b), column in wide.items():
+        flows = column.to_numpy(dtype=np.float64)
+        values[:, position[a], position[b]] = flows
+        if antisymmetric:
+            values[:, position[b], position[a]] = -flows
+    return FlowMatrix(values, wide.index, list(zones))
+
+
+def long_flows(wide):
+    """
+    Parameters
+    ----------
+    wide : pd.DataFrame
+        flows with columns (from, to)
+
+    Returns
+    -------
+    pd.DataFrame
+        columns time, from, to and flow, without missing values
+    """
+    if not len(wide.columns):
+        return pd.DataFrame({'time': pd.DatetimeIndex([], tz='UTC'),
+                             'from': pd.Series([], dtype=object),
+                             'to': pd.Series([], dtype=object),
+                             'flow': pd.Series([], dtype=np.float64)})
+    wide = wide.rename_axis(index='time', columns=['from', 'to'])
+    long = wide.melt(ignore_index=False, value_name='flow').reset_index()
+    return long.dropna(subset=['flow']).reset_index(drop=True)
+
+
+async def async_fetch_blocks(client, func, calls, name=None):
+    """
+    Coroutine counterpart of fetch_blocks: all blocks are awaited
+    concurrently, the client limits the number of requests in flight
+
+    Parameters
+    ----------
+    client : AsyncEntsoePandasClient
+    func : callable
+        coroutine function, called as func(**kwargs) for every block
+    calls : [dict]
+        keyword arguments for every block
+    name : str, optional
+        identifies the call in the negative cache
+
+    Returns
+    -------
+    pd.Series | pd.DataFrame
+    """
+    skip_empty = getattr(client, 'skip_empty_blocks', False)
+    negative_cache = getattr(client, 'negative_cache', None)
+    if name is None:
+        negative_cache = None
+
+    async def fetch(kwargs):
+        try:
+            if negative_cache is not None:
+                key = _block_key(name, kwargs)
+                if negative_cache.contains(key):
+                    raise NoMatchingDataError
+                try:
+                    return await func(**kwargs)
+                except NoMatchingDataError:
+                    negative_cache.add(key, end=_block_end(kwargs))
+                    raise
+            return await func(**kwargs)
+        except NoMatchingDataError:
+            if not skip_empty:
+                raise
+            return None
+
+    tasks = [asyncio.ensure_future(fetch(kwargs)) for kwargs in calls]
+    try:
+        frames = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return _concat_blocks(frames)
+
+
+def _call_name(func, args):
+    return '{}{}'.format(func.__name__, args)
+
+
 def year_limited(func):
     """Deals with calls where you cannot query more than a year, by splitting
     the call up in blocks per year"""
 
     @wraps(func)
-    def year_wrapper(*args, **kwargs):
+    def year_wrapper(self, *args, **kwargs):
         start = kwargs.pop('start')
         end = kwargs.pop('end')
         blocks = year_blocks(start, end)
-        frames = [func(*args, start=_start, end=_end, **kwargs)
-                  for _start, _end in blocks]
-        df = pd.concat(frames)
-        return df
+        calls = [dict(kwargs, start=_start, end=_end)
+                 for _start, _end in blocks]
+        name = _call_name(func, args)
+        return fetch_blocks(self, partial(func, self, *args), calls,
+                            name=name)
 
     return year_wrapper
 
 
+def year_iterator(query):
+    """Builds the iterator counterpart of a year_limited query method, which
+    yields the result of every yearly block as soon as it is parsed instead
+    of concatenating them, see iter_blocks"""
+    func = query.__wrapped__
+
+    def iter_wrapper(self, *args, **kwargs):
+        start = kwargs.pop('start')
+        end = kwargs.pop('end')
+        calls = [dict(kwargs, start=_start, end=_end)
+                 for _start, _end in year_blocks(start, end)]
+        name = _call_name(func, args)
+        return iter_blocks(self, partial(func, self, *args), calls,
+                           name=name)
+
+    iter_wrapper.__name__ = func.__name__.replace('query_', 'iter_', 1)
+    iter_wrapper.__qualname__ = func.__qualname__.replace(
+        func.__name__, iter_wrapper.__name__)
+    iter_wrapper.__doc__ = (
+        "Iterator counterpart of {}, yielding the result of every yearly "
+        "block as soon as it is parsed, in order. Takes the same parameters."
+        .format(func.__name__))
+    return iter_wrapper
+
+
 def day_limited(func):
     """Deals with calls where you cannot query more than a day, by splitting
     the call up in blocks per day"""
 
     @wraps(func)
-    def day_wrapper(*args, **kwargs):
+    def day_wrapper(self, *args, **kwargs):
         start = kwargs.pop('start')
         end = kwargs.pop('end')
         blocks = day_blocks(start, end)
-        frames = [func(*args, date=dt, **kwargs)
-                  for dt in blocks]
-        df = pd.concat(frames)
-        return df
+        calls = [dict(kwargs, date=dt) for dt in blocks]
+        name = _call_name(func, args)
+        return fetch_blocks(self, partial(func, self, *args), calls,
+                            name=name)
 
     return day_wrapper
+
+
+def async_year_limited(func):
+    """Coroutine counterpart of year_limited"""
+
+    @wraps(func)
+    async def year_wrapper(self, *args, **kwargs):
+        start = kwargs.pop('start')
+        end = kwargs.pop('end')
+        blocks = year_blocks(start, end)
+        calls = [dict(kwargs, start=_start, end=_end)
+                 for _start, _end in blocks]
+        name = _call_name(func, args)
+        return await async_fetch_blocks(self, partial(func, self, *args),
+                                        calls, name=name)
+
+    return year_wrapper
+
+
+def async_paginated(func):
+    """Coroutine counterpart of paginated, the windows are fetched
+    concurrently"""
+
+    @wraps(func)
+    async def pagination_wrapper(*args, **kwargs):
+        client = args[0]
+        key = _pagination_key(func, args, kwargs)
+        start = kwargs.pop('start')
+        end = kwargs.pop('end')
+        windows = _pagination_windows(client, key, start, end)
+        if windows is None:
+            try:
+                return await func(*args, start=start, end=end, **kwargs)
+            except PaginationError as e:
+                if end - start <= MIN_PAGINATION_WINDOW:
+                    raise
+                windows = _pagination_windows(client, key, start, end,
+                                              error=e)
+                # no whole hour to split on, e.g. 10:00-11:30
+                if windows is None:
+                    raise
+
+        async def fetch(window):
+            try:
+                return await pagination_wrapper(*args, start=window[0],
+                                                end=window[1], **kwargs)
+            except NoMatchingDataError:
+                return None
+
+        frames = await asyncio.gather(*[fetch(window) for window in windows])
+        return _merge_windows(frames)
+
+    return pagination_wrapper
@@ -1,122 +1,283 @@
 import bs4
+import numpy as np
+import os
 import pandas as pd
 import zipfile
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from .mappings import BIDDING_ZONES
 from .mappings import BSNTYPE
 from .mappings import DOCSTATUS
 from .mappings import PSRTYPE_MAPPINGS
 from io import BytesIO
 
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
 
-def _extract_timeseries(xml_text):
+ENGINES = ('bs4', 'lxml')
+
+
+class _LxmlTag:
+    """
+    Wraps an lxml element whose tags have been normalised by _lxml_normalize,
+    exposing the small part of the bs4.element.Tag interface that the
+    timeseries parsers use: find, find_all, text and attribute lookup of
+    descendants.
+    """
+    __slots__ = ('element',)
+
+    def __init__(self, element):
+        self.element = element
+
+    def __getattr__(self, name):
+        return self.find(name)
+
+    @property
+    def text(self):
+        return ''.join(self.element.itertext())
+
+    def find(self, name):
+        element = next(self.element.iterdescendants(name), None)
+        if element is None:
+            return None
+        return _LxmlTag(element)
+
+    def find_all(self, name):
+        return [_LxmlTag(element)
+                for element in self.element.iterdescendants(name)]
+
+
+def _check_engine(engine):
+    if engine not in ENGINES:
+        raise ValueError("Unknown parser engine '{}', choose one of {}"
+                         .format(engine, ENGINES))
+    if engine == 'lxml' and etree is None:
+        raise ImportError("The 'lxml' parser engine requires lxml to be "
+                          "installed: pip install lxml")
+
+
+def _lxml_normalize(element):
+    """
+    Strip the namespace and lowercase the tag of the element and all its
+    descendants, so the tag names are identical to the ones bs4's
+    html.parser produces
+    """
+    for el in element.iter(etree.Element):
+        tag = el.tag
+        el.tag = tag[tag.find('}') + 1:].lower()
+    return element
+
+
+def _lxml_source(xml_text):
+    """
+    lxml parses bytes: a str is encoded again, while a bytes body is read
+    in place (BytesIO shares a bytes object instead of copying it)
+    """
+    if isinstance(xml_text, str):
+        xml_text = xml_text.encode('utf-8')
+    return BytesIO(xml_text)
+
+
+def _bs4_source(xml_text):
+    """
+    html.parser works on str. The documents are UTF-8, so bytes are decoded
+    directly instead of letting bs4 detect the encoding, which is slower.
+    """
+    if isinstance(xml_text, str):
+        return xml_text
+    return str(xml_text, 'utf-8')
+
+
+def _extract_timeseries_lxml(xml_text):
+    """
+    Stream the TimeSeries elements with lxml's iterparse, clearing every
+    element once it has been consumed so the tree never holds more than
+    one TimeSeries. A yielded TimeSeries is therefore only valid until the
+    next one is requested.
+
+    Parameters
+    ----------
+    xml_text : str | bytes
+
+    Yields
+    -------
+    _LxmlTag
+    """
+    context = etree.iterparse(_lxml_source(xml_text), events=('end',),
+                              tag='{*}TimeSeries')
+    for _, element in context:
+        yield _LxmlTag(_lxml_normalize(element))
+        element.clear(keep_tail=True)
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+    del context
+
+
+def _extract_timeseries(xml_text, engine='bs4'):
     """
     Parameters
     ----------
-    xml_text : str
+    xml_text : str | bytes
+    engine : str
+        'bs4' or 'lxml'
 
     Yields
     -------
-    bs4.element.tag
+    bs4.element.tag | _LxmlTag
     """
+    _check_engine(engine)
     if not xml_text:
         return
-    soup = bs4.BeautifulSoup(xml_text, 'html.parser')
+    if engine == 'lxml':
+        yield from _extract_timeseries_lxml(xml_text)
+        return
+    soup = bs4.BeautifulSoup(_bs4_source(xml_text), 'html.parser')
     for timeseries in soup.find_all('timeseries'):
         yield timeseries
 
 
-def parse_prices(xml_text):
+def _parse_document(xml_text, engine='bs4'):
     """
+    Parse a complete (small) document, for when header fields outside the
+    TimeSeries are needed as well
+
     Parameters
     ----------
-    xml_text : str
+    xml_text : str | bytes
+    engine : str
+        'bs4' or 'lxml'
+
+    Returns
+    -------
+    bs4.BeautifulSoup | _LxmlTag
+    """
+    _check_engine(engine)
+    if engine == 'lxml':
+        tree = etree.parse(_lxml_source(xml_text))
+        return _LxmlTag(_lxml_normalize(tree.getroot()))
+    return bs4.BeautifulSoup(_bs4_source(xml_text), 'html.parser')
+
+
+def _concat_series(pieces):
+    """
+    Build one Series out of the Series parsed per TimeSeries, with a single
+    concatenation instead of growing it piece by piece
+
+    Parameters
+    ----------
+    pieces : [pd.Series]
+
+    Returns
+    -------
+    pd.Series
+    """
+    if not pieces:
+        return pd.Series(dtype=np.float64)
+    if len(pieces) == 1:
+        return pieces[0]
+    return pd.concat(pieces)
+
+
+def parse_prices(xml_text, engine='bs4'):
+    """
+    Parameters
+    ----------
+    xml_text : str | bytes
+    engine : str
+        'bs4' or 'lxml'
 
     Returns
     -------
     pd.Series
     """
-    series = pd.Series()
-    for soup in _extract_timeseries(xml_text):
-        series = series.append(_parse_price_timeseries(soup))
+    pieces = [_parse_price_timeseries(soup)
+              for soup in _extract_timeseries(xml_text, engine=engine)]
+    series = _concat_series(pieces)
     series = series.sort_index()
     return series
 
 
-def parse_loads(xml_text):
+def parse_loads(xml_text, engine='bs4'):
     """
     Parameters
     ----------
-    xml_text : str
+    xml_text : str | bytes
+    engine : str
+        'bs4' or 'lxml'
 
     Returns
     -------
     pd.Series
     """
-    series = pd.Series()
-    for soup in _extract_timeseries(xml_text):
-        series = series.append(_parse_load_timeseries(soup))
+    pieces = [_parse_load_timeseries(soup)
+              for soup in _extract_timeseries(xml_text, engine=engine)]
+    series = _concat_series(pieces)
     series = series.sort_index()
     return series
 
 
-def parse_generation(xml_text):
+def parse_generation(xml_text, engine='bs4'):
     """
     Parameters
     ----------
-    xml_text : str
+    xml_text : str | bytes
+    engine : str
+        'bs4' or 'lxml'
 
     Returns
     -------
     pd.DataFrame
     """
-    all_series = {}
-    for soup in _extract_timeseries(xml_text):
+    pieces = {}
+    for soup in _extract_timeseries(xml_text, engine=engine):
         ts = _parse_generation_forecast_timeseries(soup)
-        series = all_series.get(ts.name)
-        if series is None:
-            all_series[ts.name] = ts
-        else:
-            series = series.append(ts)
-            series.sort_index()
-            all_series[series.name] = series
+        pieces.setdefault(ts.name, []).append(ts)
 
-    for name in all_series:
-        ts = all_series[name]
-        all_series[name] = ts[~ts.index.duplicated(keep='first')]
+    all_series = {}
+    for name, series in pieces.items():
+        ts = _concat_series(series)
+        ts = ts[~ts.index.duplicated(keep='first')]
+        all_series[name] = ts.sort_index()
 
     df = pd.DataFrame.from_dict(all_series)
     return df
 
 
-def parse_crossborder_flows(xml_text):
+def parse_crossborder_flows(xml_text, engine='bs4'):
     """
     Parameters
     ----------
-    xml_text : str
+    xml_text : str | bytes
+    engine : str
+        'bs4' or 'lxml'
 
     Returns
     -------
     pd.Series
     """
-    series = pd.Series()
-    for soup in _extract_timeseries(xml_text):
-        series = series.append(_parse_crossborder_flows_timeseries(soup))
+    pieces = [_parse_crossborder_flows_timeseries(soup)
+              for soup in _extract_timeseries(xml_text, engine=engine)]
+    series = _concat_series(pieces)
     series = series.sort_index()
     return series
 
 
-def parse_imbalance_prices(xml_text):
+def parse_imbalance_prices(xml_text, engine='bs4'):
     """
     Parameters
     ----------
-    xml_text : str
+    xml_text : str | bytes
+    engine : str
+        'bs4' or 'lxml'
 
     Returns
     -------
     pd.DataFrame
     """
-    timeseries_blocks = _extract_timeseries(xml_text)
+    timeseries_blocks = _extract_timeseries(xml_text, engine=engine)
     frames = (_parse_imbalance_prices_timeseries(soup)
               for soup in timeseries_blocks)
     df = pd.concat(frames, axis=1)
@@ -155,30 +316,80 @@ def _parse_imbalance_prices_timeseries(soup):
     return df
 
 
-def _parse_price_timeseries(soup):
+def _decode_points(period, value_tag):
     """
+    Collect the positions and values of all Points in a Period in one pass
+
     Parameters
     ----------
-    soup : bs4.element.tag
+    period : bs4.element.tag | _LxmlTag
+    value_tag : str
+        name of the element holding the value, eg. 'quantity'
 
     Returns
     -------
-    pd.Series
+    (np.ndarray, np.ndarray)
+        int64 positions and float64 values
     """
-    positions = []
-    prices = []
-    for point in soup.find_all('point'):
-        positions.append(int(point.find('position').text))
-        prices.append(float(point.find('price.amount').text))
+    if isinstance(period, _LxmlTag):
+        element = period.element
+        positions = [e.text for e in element.iterdescendants('position')]
+        values = [e.text for e in element.iterdescendants(value_tag)]
+        if len(positions) != len(values):
+            raise ValueError("Every Point needs a 'position' and a '{}'"
+                             .format(value_tag))
+    else:
+        points = period.find_all('point')
+        positions = [point.find('position').text for point in points]
+        values = [point.find(value_tag).text for point in points]
+    return (np.array(positions, dtype=np.int64),
+            np.array(values, dtype=np.float64))
+
+
+def _parse_timeseries_points(soup, value_tag):
+    """
+    Map the Points of every Period in a TimeSeries onto the period's time
+    grid by their position. Positions that are absent are NaN, except for
+    curve type A03 (variable sized blocks) where a point holds until the
+    next one and the values are forward filled.
 
-    series = pd.Series(index=positions, data=prices)
-    series = series.sort_index()
-    series.index = _parse_datetimeindex(soup)
+    Parameters
+    ----------
+    soup : bs4.element.tag | _LxmlTag
+    value_tag : str
+        name of the element holding the value, eg. 'quantity'
 
-    return series
+    Returns
+    -------
+    pd.Series
+    """
+    curvetype = soup.find('curvetype')
+    forward_fill = curvetype is not None and curvetype.text == 'A03'
+    periods = soup.find_all('period') or [soup]
+
+    pieces = []
+    for period in periods:
+        index = _parse_datetimeindex(period)
+        positions, values = _decode_points(period, value_tag)
+        slots = positions - 1
+        valid = (slots >= 0) & (slots < len(index))
+        data = np.full(len(index), np.nan)
+        data[slots[valid]] = values[valid]
+        if forward_fill:
+            present = np.zeros(len(index), dtype=bool)
+            present[slots[valid]] = True
+            last = np.where(present, np.arange(len(index)), 0)
+            np.maximum.accumulate(last, out=last)
+            data = np.where(present[last], data[last], np.nan)
+        pieces.append(pd.Series(data=data, index=index))
+
+    if len(pieces) == 1:
+        return pieces[0]
+    series = pd.concat(pieces)
+    return series[~series.index.duplicated(keep='first')].sort_index()
 
 
-def _parse_load_timeseries(soup):
+def _parse_price_timeseries(soup):
     """
     Parameters
     ----------
@@ -188,17 +399,20 @@ def _parse_load_timeseries(soup):
     -------
     pd.Series
     """
-    positions = []
-    prices = []
-    for point in soup.find_all('point'):
-        positions.append(int(point.find('position').text))
-        prices.append(float(point.find('quantity').text))
+    return _parse_timeseries_points(soup, 'price.amount')
 
-    series = pd.Series(index=positions, data=prices)
-    series = series.sort_index()
-    series.index = _parse_datetimeindex(soup)
 
-    return series
+def _parse_load_timeseries(soup):
+    """
+    Parameters
+    ----------
+    soup : bs4.element.tag
+
+    Returns
+    -------
+    pd.Series
+    """
+    return _parse_timeseries_points(soup, 'quantity')
 
 
 def _parse_generation_forecast_timeseries(soup):
@@ -212,16 +426,7 @@ def _parse_generation_forecast_timeseries(soup):
     pd.Series
     """
     psrtype = soup.find('psrtype').text
-    positions = []
-    quantities = []
-    for point in soup.find_all('point'):
-        positions.append(int(point.find('position').text))
-        quantities.append(float(point.find('quantity').text))
-
-    series = pd.Series(index=positions, data=quantities)
-    series = series.sort_index()
-    series.index = _parse_datetimeindex(soup)
-
+    series = _parse_timeseries_points(soup, 'quantity')
     series.name = PSRTYPE_MAPPINGS[psrtype]
     return series
 
@@ -243,7 +448,7 @@ def _parse_datetimeindex(soup):
     start = pd.Timestamp(soup.find('start').text)
     end = pd.Timestamp(soup.find('end').text)
     delta = _resolution_to_timedelta(res_text=soup.find('resolution').text)
-    index = pd.date_range(start=start, end=end, freq=delta, closed='left')
+    index = pd.date_range(start=start, end=end, freq=delta, inclusive='left')
     return index
 
 
@@ -257,26 +462,17 @@ def _parse_crossborder_flows_timeseries(soup):
     -------
     pd.Series
     """
-    positions = []
-    flows = []
-    for point in soup.find_all('point'):
-        positions.append(int(point.find('position').text))
-        flows.append(float(point.find('quantity').text))
+    return _parse_timeseries_points(soup, 'quantity')
 
-    series = pd.Series(index=positions, data=flows)
-    series = series.sort_index()
-    series.index = _parse_datetimeindex(soup)
-
-    return series
 
-
-def _resolution_to_timedelta(res_text: str) -> str:
+def _resolution_to_timedelta(res_text: str):
     """
     Convert an Entsoe resolution to something that pandas can understand
     """
     resolutions = {
         'PT60M': '60min',
-        'P1Y': '12M',
+        # keeps the time of the start, which month aliases would move
+        'P1Y': pd.DateOffset(years=1),
         'PT15M': '15min',
         'PT30M': '30min'
     }
@@ -290,24 +486,127 @@ def _resolution_to_timedelta(res_text: str) -> str:
     return delta
 
 
-def parse_unavailabilities(response: bytes) -> pd.DataFrame:
+OUTAGE_COLUMNS = ['created_doc_time',
+                  'docstatus',
+                  'businesstype',
+                  'biddingzone_domain',
+                  'qty_uom',
+                  'curvetype',
+                  'production_resource_id',
+                  'production_resource_name',
+                  'production_resource_location',
+                  'plant_type',
+                  'nominal_power',
+                  'start',
+                  'end',
+                  'resolution',
+                  'pstn',
+                  'avail_qty'
+                  ]
+
+# EIC code -> bidding zone name, built once instead of for every TimeSeries
+_BIDDING_ZONE_NAMES = {v: k for k, v in BIDDING_ZONES.items()}
+
+
+def parse_unavailabilities(response: bytes, engine='bs4', executor=None,
+                           max_workers=None, batch_size=32,
+                           parallel_threshold=64) -> pd.DataFrame:
     """
     Response for Unavailability of Generation Units is ZIP folder
     with one document inside it for each outage.
     This function parses all the files in the ZIP and returns a Pandas DataFrame.
+    The rows of all documents are collected in one set of column buffers,
+    so the DataFrame is built once.
+
+    Large archives can be parsed on a process pool: the documents are sent
+    to the workers in batches, each batch comes back as one columnar frame
+    and the frames are concatenated once.
+
+    Parameters
+    ----------
+    response : bytes | file-like
+        the ZIP archive, or a seekable binary file holding it (as returned
+        by a client with a spool_threshold), from which the documents are
+        read one at a time
+    engine : str
+        'bs4' or 'lxml'
+    executor : concurrent.futures.ProcessPoolExecutor, optional
+        pool to parse on
+    max_workers : int, optional
+        if no executor is given, size of a pool created for this call
+    batch_size : int
+        number of documents per task sent to the pool
+    parallel_threshold : int
+        archives with fewer documents are parsed in this process, where
+        they are faster to parse than to send to a pool
+
+    Returns
+    -------
+    pd.DataFrame
     """
-    dfs = list()
-    with zipfile.ZipFile(BytesIO(response), 'r') as arc:
-        for f in arc.infolist():
-            if f.filename.endswith('xml'):
-                frame = _outage_parser(arc.read(f))
-                dfs.append(frame)
-    df = pd.concat(dfs, axis=0)
+    _check_engine(engine)
+    if isinstance(response, (bytes, bytearray, memoryview)):
+        response = BytesIO(response)
+    with zipfile.ZipFile(response, 'r') as arc:
+        members = [f for f in arc.infolist() if f.filename.endswith('xml')]
+        if (executor is None and not max_workers) or \
+                len(members) < parallel_threshold:
+            df = _parse_outage_batch((arc.read(f) for f in members),
+                                     engine=engine)
+        else:
+            # read lazily, as the pool takes them
+            batches = ([arc.read(f) for f in members[i:i + batch_size]]
+                       for i in range(0, len(members), batch_size))
+            df = _parse_outage_batches(batches, engine, executor,
+                                       max_workers)
     df.set_index('created_doc_time', inplace=True)
     df.sort_index(inplace=True)
     return df
 
 
+def _parse_outage_batch(documents, engine='bs4') -> pd.DataFrame:
+    """
+    Parameters
+    ----------
+    documents : iterable of bytes
+        outage documents
+    engine : str
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per available period, columns as in OUTAGE_COLUMNS
+    """
+    columns = _outage_columns()
+    for document in documents:
+        _outage_rows(document, columns, engine=engine)
+    return pd.DataFrame(columns, columns=OUTAGE_COLUMNS)
+
+
+def _parse_outage_batches(batches, engine, executor=None, max_workers=None):
+    """
+    Parse batches of outage documents on a process pool and merge the
+    results with a single concatenation. At most two batches per worker are
+    in flight, so the batches are only read as the pool gets to them.
+    """
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return _parse_outage_batches(batches, engine, pool, max_workers)
+    in_flight = 2 * (max_workers or os.cpu_count() or 1)
+    pending = deque()
+    frames = []
+    for batch in batches:
+        if len(pending) >= in_flight:
+            frames.append(pending.popleft().result())
+        pending.append(executor.submit(_parse_outage_batch, batch, engine))
+    frames += [future.result() for future in pending]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _outage_columns():
+    return {name: [] for name in OUTAGE_COLUMNS}
+
+
 def _available_period(timeseries: bs4.BeautifulSoup) -> list:
     # if not timeseries:
     #    return
@@ -320,11 +619,8 @@ def _available_period(timeseries: bs4.BeautifulSoup) -> list:
 
 
 def _unavailability_timeseries(soup: bs4.BeautifulSoup) -> list:
-    # if not ts:
-    #    return
-    dm = {k: v for (v, k) in BIDDING_ZONES.items()}
     f = [BSNTYPE[soup.find('businesstype').text],
-         dm[soup.find('biddingzone_domain.mrid').text],
+         _BIDDING_ZONE_NAMES[soup.find('biddingzone_domain.mrid').text],
          soup.find('quantity_measure_unit.name').text,
          soup.find('curvetype').text,
          soup.find('production_registeredresource.mrid').text,
@@ -336,42 +632,95 @@ def _unavailability_timeseries(soup: bs4.BeautifulSoup) -> list:
     return [f + p for p in _available_period(soup)]
 
 
-def _outage_parser(xml_file: bytes) -> pd.DataFrame:
-    xml_text = xml_file.decode()
-    # if not(xml_text):
-    # return
-    headers = ['created_doc_time',
-               'docstatus',
-               'businesstype',
-               'biddingzone_domain',
-               'qty_uom',
-               'curvetype',
-               'production_resource_id',
-               'production_resource_name',
-               'production_resource_location',
-               'plant_type',
-               'nominal_power',
-               'start',
-               'end',
-               'resolution',
-               'pstn',
-               'avail_qty'
-               ]
-    soup = bs4.BeautifulSoup(xml_text, 'html.parser')
-    creation_date = pd.Timestamp(soup.createddatetime.text)
-    try:
-        docstatus = DOCSTATUS[soup.docstatus.value.text]
-    except AttributeError:
-        docstatus = None
-    d = list()
-    series = _extract_timeseries(xml_text)
-    for ts in series:
-        row = [creation_date, docstatus]
-        for t in _unavailability_timeseries(ts):
-            d.append(row + t)
-    df = pd.DataFrame.from_records(d, columns=headers)
-    return df
+def _docstatus(tag):
+    value = tag.find('value') if tag is not None else None
+    if value is None:
+        return None
+    return DOCSTATUS[value.text]
+
+
+def _iter_outage_document_lxml(xml_file):
+    """
+    Stream an outage document with lxml's iterparse. The header fields
+    come before the TimeSeries in the document, so they are known by the
+    time the first TimeSeries is yielded.
+
+    Yields
+    -------
+    (pd.Timestamp, str, _LxmlTag)
+        creation date, document status and TimeSeries, which is only valid
+        until the next one is requested
+    """
+    creation_date = docstatus = None
+    context = etree.iterparse(
+        _lxml_source(xml_file), events=('end',),
+        tag=('{*}createdDateTime', '{*}docStatus', '{*}TimeSeries'))
+    for _, element in context:
+        tag = _LxmlTag(_lxml_normalize(element))
+        name = element.tag
+        if name == 'timeseries':
+            yield creation_date, docstatus, tag
+        elif name == 'createddatetime':
+            creation_date = pd.Timestamp(tag.text)
+        else:
+            docstatus = _docstatus(tag)
+        element.clear(keep_tail=True)
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+    del context
+
+
+def _iter_outage_document(xml_file, engine='bs4'):
+    """
+    Parse an outage document once, yielding its TimeSeries together with
+    the header fields
+
+    Parameters
+    ----------
+    xml_file : bytes
+    engine : str
+        'bs4' or 'lxml'
+
+    Yields
+    -------
+    (pd.Timestamp, str, bs4.element.Tag | _LxmlTag)
+    """
+    _check_engine(engine)
+    if engine == 'lxml':
+        yield from _iter_outage_document_lxml(xml_file)
+        return
+    soup = bs4.BeautifulSoup(_bs4_source(xml_file), 'html.parser')
+    creation_date = pd.Timestamp(soup.find('createddatetime').text)
+    docstatus = _docstatus(soup.find('docstatus'))
+    for timeseries in soup.find_all('timeseries'):
+        yield creation_date, docstatus, timeseries
+
+
+def _outage_rows(xml_file: bytes, columns: dict, engine='bs4'):
+    """
+    Append the rows of one outage document to the column buffers
+
+    Parameters
+    ----------
+    xml_file : bytes
+    columns : dict
+        list of values per column in OUTAGE_COLUMNS
+    engine : str
+        'bs4' or 'lxml'
+    """
+    buffers = [columns[name] for name in OUTAGE_COLUMNS]
+    for creation_date, docstatus, ts in _iter_outage_document(
+            xml_file, engine=engine):
+        for row in _unavailability_timeseries(ts):
+            buffers[0].append(creation_date)
+            buffers[1].append(docstatus)
+            for buffer, value in zip(buffers[2:], row):
+                buffer.append(value)
+
+
+def _outage_parser(xml_file: bytes, engine='bs4') -> pd.DataFrame:
+    return _parse_outage_batch([xml_file], engine=engine)
 
 
-def parse_units(xml):
-    return parse_generation(xml)
+def parse_units(xml, engine='bs4'):
+    return parse_generation(xml, engine=engine)
@@ -0,0 +1,168 @@
+import sqlite3
+import threading
+
+from time import monotonic
+from time import sleep
+from time import time
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the number of requests, shared by every client it
+    is passed to. ENTSO-E allows 400 requests per minute per token and bans
+    tokens that go over it.
+
+    Callers reserve a token and sleep until it is theirs, so waiting threads
+    are served in the order they arrived and never hold the lock while
+    sleeping.
+    """
+
+    def __init__(self, requests_per_minute=400, burst=10):
+        """
+        Parameters
+        ----------
+        requests_per_minute : float
+            sustained request rate
+        burst : int
+            number of requests that can be made at once after being idle
+        """
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self.requests = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._rate = requests_per_minute / 60
+        self._stats_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = None
+
+    def _reserve(self, tokens, updated, now):
+        """
+        Take one token from a bucket that held `tokens` at time `updated`
+
+        Returns
+        -------
+        (float, float)
+            tokens left (negative when reserved ahead) and seconds to wait
+        """
+        if updated is not None:
+            tokens = min(float(self.burst),
+                         tokens + (now - updated) * self._rate)
+        tokens -= 1
+        wait = max(0.0, -tokens / self._rate)
+        return tokens, wait
+
+    def _take(self):
+        with self._lock:
+            now = monotonic()
+            self._tokens, wait = self._reserve(self._tokens, self._updated,
+                                               now)
+            self._updated = now
+        return wait
+
+    def reserve(self):
+        """
+        Reserve the next request slot without waiting for it, for callers
+        that sleep themselves (eg. with asyncio.sleep)
+
+        Returns
+        -------
+        float
+            seconds to wait before making the request
+        """
+        wait = self._take()
+        with self._stats_lock:
+            self.requests += 1
+            self.total_wait += wait
+            if wait > 0:
+                self.throttled += 1
+                self.max_wait = max(self.max_wait, wait)
+        return wait
+
+    def acquire(self):
+        """
+        Block until a request may be made
+
+        Returns
+        -------
+        float
+            seconds the caller waited
+        """
+        wait = self.reserve()
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+            number of requests, how many of them had to wait, and the total
+            and longest wait in seconds
+        """
+        with self._stats_lock:
+            return {'requests': self.requests,
+                    'throttled': self.throttled,
+                    'total_wait': self.total_wait,
+                    'max_wait': self.max_wait}
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """
+    RateLimiter whose bucket lives in an SQLite database, so that several
+    processes on the same machine can share one limit. The bucket is
+    updated in an exclusive transaction; statistics are per instance.
+    """
+
+    def __init__(self, path, requests_per_minute=400, burst=10, key='default'):
+        """
+        Parameters
+        ----------
+        path : str
+            database file, created if it does not exist
+        requests_per_minute : float
+        burst : int
+        key : str
+            name of the bucket, to keep the limits of different API tokens
+            in the same file apart
+        """
+        super(SQLiteRateLimiter, self).__init__(
+            requests_per_minute=requests_per_minute, burst=burst)
+        self.path = path
+        self.key = key
+        conn = self._connect()
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS bucket ('
+                         'key TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def _take(self):
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tokens, updated FROM bucket '
+                               'WHERE key = ?', (self.key,)).fetchone()
+            tokens, updated = row if row else (float(self.burst), None)
+            now = time()
+            tokens, wait = self._reserve(tokens, updated, now)
+            conn.execute('INSERT OR REPLACE INTO bucket VALUES (?, ?, ?)',
+                         (self.key, tokens, now))
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return wait
@@ -0,0 +1,450 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import pandas as pd
+
+from .exceptions import NoMatchingDataError
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'parquet': 'data.parquet', 'feather': 'data.arrow',
+           'csv': 'data.csv'}
+
+# column holding a stored Series, and the index of every stored frame
+SERIES_COLUMN = '__series__'
+INDEX_COLUMN = '__index__'
+
+
+def _utc(dtm):
+    dtm = pd.Timestamp(dtm)
+    if dtm.tzinfo is None:
+        return dtm.tz_localize('UTC')
+    return dtm.tz_convert('UTC')
+
+
+def merge_intervals(intervals):
+    """
+    Parameters
+    ----------
+    intervals : [(pd.Timestamp, pd.Timestamp)]
+
+    Returns
+    -------
+    [(pd.Timestamp, pd.Timestamp)]
+        sorted, with overlapping and adjacent intervals joined
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_intervals(covered, start, end):
+    """
+    Parameters
+    ----------
+    covered : [(pd.Timestamp, pd.Timestamp)]
+        merged, as returned by merge_intervals
+    start : pd.Timestamp
+    end : pd.Timestamp
+
+    Returns
+    -------
+    [(pd.Timestamp, pd.Timestamp)]
+        the parts of start - end that are not covered
+    """
+    missing = []
+    for covered_start, covered_end in covered:
+        if covered_end <= start:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > start:
+            missing.append((start, covered_start))
+        start = max(start, covered_end)
+    if start < end:
+        missing.append((start, end))
+    return missing
+
+
+def _write_atomic(path, write):
+    """Call write(tmp) on a temporary file next to path, then move it into
+    place, so readers never see a partially written file"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+# how new data is merged with the stored data of a dataset
+MERGE_TIMESTAMPS = 'timestamps'
+MERGE_ROWS = 'rows'
+# datasets of events, several of which can share a timestamp; all others
+# are time series
+MERGE_MODES = {
+    'unavailability_of_generation_units': MERGE_ROWS,
+    'withdrawn_unavailability_of_generation_units': MERGE_ROWS,
+}
+
+
+def _merge(stored, new, mode):
+    """
+    Time series (MERGE_TIMESTAMPS) replace the stored values at their
+    timestamps. Events (MERGE_ROWS), such as unavailabilities indexed by
+    their creation time, only drop rows that are stored already.
+    """
+    df = pd.concat([stored, new])
+    if mode == MERGE_TIMESTAMPS:
+        return df[~df.index.duplicated(keep='last')]
+    # compared as text, as CSV files do not keep the column types
+    rows = df.reset_index().astype(str)
+    return df[~rows.duplicated(keep='last').to_numpy()]
+
+
+class TimeSeriesStore:
+    """
+    Local store of query results, in Parquet (or Arrow IPC, or CSV) files
+    partitioned by dataset, zone and year:
+
+        <directory>/<dataset>/zone=<zone>/year=<year>/data.parquet
+
+    Next to the data, every dataset and zone keeps the periods that have
+    been fetched, including the ones without data, so sync only requests
+    what is missing. All data is stored and returned in UTC.
+
+    New data replaces the stored values at its timestamps, except for the
+    datasets merged by rows (see `merge_modes`), which keep every distinct
+    row.
+
+    Files are written to a temporary name and renamed into place. Several
+    processes can read the store while it is written, but every dataset
+    and zone should only be written by one of them at a time.
+
+    The Parquet and Arrow IPC formats require pyarrow:
+    pip install entsoe-py[parquet]
+    """
+
+    def __init__(self, directory, format='parquet', merge_modes=None,
+                 settled_after=pd.Timedelta(days=7)):
+        """
+        Parameters
+        ----------
+        directory : str
+            created if it does not exist
+        format : str
+            'parquet' (default), 'feather' (Arrow IPC) or 'csv'
+        merge_modes : dict, optional
+            MERGE_TIMESTAMPS or MERGE_ROWS per dataset name, or per query
+            name without filters, added to MERGE_MODES. Datasets that are
+            not listed are merged by timestamp.
+        settled_after : pd.Timedelta
+            age after which a period without data is taken to stay without
+            data, see sync
+        """
+        if format not in FORMATS:
+            raise ValueError("Unknown format '{}', choose one of {}"
+                             .format(format, tuple(FORMATS)))
+        if format != 'csv' and pyarrow is None:
+            raise ImportError("The '{}' format requires pyarrow to be "
+                              "installed: pip install entsoe-py[parquet]"
+                              .format(format))
+        self.directory = directory
+        self.format = format
+        self.merge_modes = dict(MERGE_MODES, **(merge_modes or {}))
+        self.settled_after = settled_after
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def dataset_name(query, **kwargs):
+        """
+        Parameters
+        ----------
+        query : callable | str
+            eg. client.query_generation or 'query_generation'
+        kwargs
+            filters passed to the query, eg. psr_type='B16'
+
+        Returns
+        -------
+        str
+            eg. 'generation' or 'generation-psr_type=B16'
+        """
+        name = query if isinstance(query, str) else query.__name__
+        if name.startswith('query_'):
+            name = name[len('query_'):]
+        filters = ['{}={}'.format(k, v) for k, v in sorted(kwargs.items())
+                   if v is not None]
+        return '-'.join([name] + filters)
+
+    def _zone_dir(self, dataset, zone):
+        return os.path.join(self.directory, dataset, 'zone={}'.format(zone))
+
+    def _path(self, dataset, zone, year):
+        return os.path.join(self._zone_dir(dataset, zone),
+                            'year={}'.format(year), FORMATS[self.format])
+
+    def _coverage_path(self, dataset, zone):
+        return os.path.join(self._zone_dir(dataset, zone), 'coverage.json')
+
+    def years(self, dataset, zone):
+        """
+        Returns
+        -------
+        [int]
+            the years that hold data
+        """
+        directory = self._zone_dir(dataset, zone)
+        if not os.path.isdir(directory):
+            return []
+        years = []
+        for entry in os.scandir(directory):
+            if entry.name.startswith('year=') and os.path.exists(
+                    os.path.join(entry.path, FORMATS[self.format])):
+                years.append(int(entry.name[len('year='):]))
+        return sorted(years)
+
+    def coverage(self, dataset, zone):
+        """
+        Returns
+        -------
+        [(pd.Timestamp, pd.Timestamp)]
+            the periods that have been fetched, merged and in UTC
+        """
+        try:
+            with open(self._coverage_path(dataset, zone)) as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return []
+        return [(pd.Timestamp(start), pd.Timestamp(end))
+                for start, end in stored['intervals']]
+
+    def _add_coverage(self, dataset, zone, start, end):
+        intervals = merge_intervals(
+            self.coverage(dataset, zone) + [(start, end)])
+        text = json.dumps({'intervals': [[s.isoformat(), e.isoformat()]
+                                         for s, e in intervals]})
+
+        def write(tmp):
+            with open(tmp, 'w') as f:
+                f.write(text)
+
+        _write_atomic(self._coverage_path(dataset, zone), write)
+
+    def missing(self, dataset, zone, start, end):
+        """
+        Parameters
+        ----------
+        dataset : str
+        zone : str
+        start : pd.Timestamp
+        end : pd.Timestamp
+
+        Returns
+        -------
+        [(pd.Timestamp, pd.Timestamp)]
+            the parts of start - end that have not been fetched, in UTC
+        """
+        return missing_intervals(self.coverage(dataset, zone), _utc(start),
+                                 _utc(end))
+
+    def _read_file(self, path):
+        if self.format == 'parquet':
+            df = pd.read_parquet(path)
+        elif self.format == 'feather':
+            df = pd.read_feather(path)
+        else:
+            df = pd.read_csv(path)
+            df[INDEX_COLUMN] = pd.to_datetime(df[INDEX_COLUMN], utc=True)
+        return df.set_index(INDEX_COLUMN).rename_axis(None)
+
+    def _write_file(self, path, df):
+        df = df.rename_axis(INDEX_COLUMN).reset_index()
+        if self.format == 'parquet':
+            _write_atomic(path, lambda tmp: df.to_parquet(tmp, index=False))
+        elif self.format == 'feather':
+            _write_atomic(path, lambda tmp: df.to_feather(tmp))
+        else:
+            _write_atomic(path, lambda tmp: df.to_csv(tmp, index=False))
+
+    def merge_mode(self, dataset):
+        """
+        Parameters
+        ----------
+        dataset : str
+
+        Returns
+        -------
+        str
+            MERGE_TIMESTAMPS or MERGE_ROWS
+        """
+        query = dataset.split('-')[0]
+        return self.merge_modes.get(
+            dataset, self.merge_modes.get(query, MERGE_TIMESTAMPS))
+
+    def write(self, dataset, zone, data, start=None, end=None):
+        """
+        Merge data into the store, see merge_mode. If start and end are
+        given, the period is recorded as fetched, also when data is empty.
+
+        Parameters
+        ----------
+        dataset : str
+        zone : str
+        data : pd.Series | pd.DataFrame | None
+            on a DatetimeIndex
+        start : pd.Timestamp, optional
+        end : pd.Timestamp, optional
+
+        Raises
+        ------
+        ValueError
+            if data merged by timestamp has several rows per timestamp
+        """
+        mode = self.merge_mode(dataset)
+        if mode == MERGE_TIMESTAMPS and data is not None and \
+                not data.index.is_unique:
+            raise ValueError("'{}' is merged by timestamp, but the data has "
+                             "several rows per timestamp".format(dataset))
+        with self._lock:
+            if data is not None and len(data):
+                if isinstance(data, pd.Series):
+                    data = data.to_frame(SERIES_COLUMN)
+                data = data.tz_convert('UTC')
+                for year, part in data.groupby(data.index.year):
+                    path = self._path(dataset, zone, year)
+                    if os.path.exists(path):
+                        part = _merge(self._read_file(path), part, mode)
+                    self._write_file(path, part.sort_index())
+            if start is not None and end is not None:
+                self._add_coverage(dataset, zone, _utc(start), _utc(end))
+
+    def read(self, dataset, zone, start=None, end=None):
+        """
+        Parameters
+        ----------
+        dataset : str
+        zone : str
+        start : pd.Timestamp, optional
+        end : pd.Timestamp, optional
+            exclusive
+
+        Returns
+        -------
+        pd.Series | pd.DataFrame
+            in UTC, a Series if a Series was stored
+
+        Raises
+        ------
+        NoMatchingDataError
+            if the store holds nothing for dataset and zone
+        """
+        years = self.years(dataset, zone)
+        if start is not None:
+            years = [y for y in years if y >= _utc(start).year]
+        if end is not None:
+            years = [y for y in years if y <= _utc(end).year]
+        if not years:
+            raise NoMatchingDataError
+        df = pd.concat([self._read_file(self._path(dataset, zone, year))
+                        for year in years])
+        if start is not None:
+            df = df[df.index >= _utc(start)]
+        if end is not None:
+            df = df[df.index < _utc(end)]
+        if list(df.columns) == [SERIES_COLUMN]:
+            return df[SERIES_COLUMN].rename(None)
+        return df
+
+    def sync(self, query, zone, start, end, dataset=None, refresh=None,
+             **kwargs):
+        """
+        Fetch the parts of start - end that are not in the store yet with
+        query, and write them to the store
+
+        ENTSO-E publishes data with a delay, so a fetched period is only
+        recorded up to the end of the data that was returned. A period
+        without data, or of a dataset merged by rows, is recorded up to
+        `settled_after` ago.
+
+        Parameters
+        ----------
+        query : callable
+            a query method of EntsoePandasClient, eg.
+            client.query_day_ahead_prices
+        zone : str
+            country code passed to query
+        start : pd.Timestamp
+        end : pd.Timestamp
+        dataset : str, optional
+            by default derived from the query and kwargs, see dataset_name
+        refresh : pd.Timedelta, optional
+            fetch the last `refresh` of the stored period again, as the
+            most recent data may still be revised
+        kwargs
+            passed on to query, eg. psr_type
+
+        Returns
+        -------
+        [(pd.Timestamp, pd.Timestamp)]
+            the periods that were fetched, in UTC
+        """
+        if dataset is None:
+            dataset = self.dataset_name(query, **kwargs)
+        start, end = _utc(start), _utc(end)
+        gaps = self.missing(dataset, zone, start, end)
+        if refresh is not None:
+            covered = [i for i in self.coverage(dataset, zone)
+                       if i[0] < end and i[1] > start]
+            if covered:
+                last = min(covered[-1][1], end)
+                gaps = merge_intervals(
+                    gaps + [(max(last - refresh, start), last)])
+        for gap_start, gap_end in gaps:
+            logger.debug("sync %s %s %s - %s", dataset, zone, gap_start,
+                         gap_end)
+            try:
+                data = query(zone, start=gap_start, end=gap_end, **kwargs)
+            except NoMatchingDataError:
+                data = None
+            else:
+                index = data.index.tz_convert('UTC')
+                data = data[(index >= gap_start) & (index < gap_end)]
+            covered_end = self._covered_end(dataset, data, gap_end)
+            if covered_end > gap_start:
+                self.write(dataset, zone, data, start=gap_start,
+                           end=covered_end)
+            else:
+                self.write(dataset, zone, data)
+        return gaps
+
+    def _covered_end(self, dataset, data, gap_end):
+        """End of the part of a fetched gap that holds all data there is"""
+        if data is not None and len(data) and \
+                self.merge_mode(dataset) == MERGE_TIMESTAMPS:
+            index = data.index.tz_convert('UTC').sort_values()
+            # the last value lasts one resolution
+            step = index[-1] - index[-2] if len(index) > 1 else pd.Timedelta(0)
+            return min(gap_end, index[-1] + step)
+        # the API takes periods in whole hours
+        settled = (pd.Timestamp.now(tz='UTC') - self.settled_after).floor('h')
+        return min(gap_end, settled)
@@ -21,7 +21,7 @@ with open(path.join(here, 'README.md'), encoding='utf-8') as f:
     long_description = f.read()
 
 # Get the version from the source code
-with open(path.join(here, 'entsoe', 'entsoe.py'), encoding='utf-8') as f:
+with open(path.join(here, 'entsoe', '__init__.py'), encoding='utf-8') as f:
     lines = f.readlines()
     for l in lines:
         if l.startswith('__version__'):
@@ -72,6 +72,18 @@ setup(
     # your project is installed.
     install_requires=['requests', 'pytz', 'beautifulsoup4', 'pandas'],
 
+    # Optional dependencies, eg. `pip install entsoe-py[lxml]`
+    extras_require={
+        'lxml': ['lxml'],
+        'async': ['aiohttp'],
+        'parquet': ['pyarrow'],
+    },
+
+    # The `entsoe` command, see entsoe/cli.py
+    entry_points={
+        'console_scripts': ['entsoe=entsoe.cli:main'],
+    },
+
     # If there are data files included in your packages that need to be
     # installed, specify them here.  If using Python 2.6 or less, then these
     # have to be included in MANIFEST.in as well.
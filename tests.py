@@ -1,16 +1,441 @@
+import io
+import json
 import os
+import tempfile
+import threading
+import time
 import unittest
+import zipfile
 
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
 import pandas as pd
+import requests
 
 from bs4 import BeautifulSoup
 
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+from entsoe import cli
+from entsoe import parsers
+from entsoe.backfill import BackfillRunner
+from entsoe.backfill import BackfillTask
+from entsoe.backfill import Journal
+from entsoe.backfill import expand_job
+from entsoe.cache import NegativeCache
+from entsoe.cache import ResponseCache
+from entsoe.entsoeasyncclient import AsyncEntsoePandasClient
+from entsoe.entsoeasyncclient import AsyncEntsoeRawClient
 from entsoe.entsoepandasclient import EntsoePandasClient
 from entsoe.entsoerawclient import EntsoeRawClient
 from entsoe.exceptions import NoMatchingDataError
+from entsoe.exceptions import PaginationError
+from entsoe.mappings import BIDDING_ZONES
+from entsoe.mappings import DOMAIN_MAPPINGS
+from entsoe.mappings import NEIGHBOURS
+from entsoe.metrics import Histogram
+from entsoe.metrics import MetricsCollector
+from entsoe.metrics import document_stats
+from entsoe.misc import Coalescer
+from entsoe.misc import LatencyTracker
+from entsoe.misc import RetryPolicy
+from entsoe.ratelimit import RateLimiter
+from entsoe.ratelimit import SQLiteRateLimiter
+from entsoe.store import MERGE_ROWS
+from entsoe.store import TimeSeriesStore
+from entsoe.store import merge_intervals
+from entsoe.store import missing_intervals
+
+# the parser engines that can run here
+ENGINES = parsers.ENGINES if etree is not None else ('bs4',)
 
 api_key = os.environ.get('ENTSOE_API_KEY')
 
+PRICES_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<Publication_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-3:publicationdocument:7:0">
+  <mRID>a3a1f9c3b0c74d0b9f1c5b0e0e9b1a2c</mRID>
+  <type>A44</type>
+  <createdDateTime>2018-01-10T09:32:12Z</createdDateTime>
+  <period.timeInterval>
+    <start>2017-12-31T23:00Z</start>
+    <end>2018-01-02T23:00Z</end>
+  </period.timeInterval>
+  <TimeSeries>
+    <mRID>1</mRID>
+    <businessType>A62</businessType>
+    <in_Domain.mRID codingScheme="A01">10YBE----------2</in_Domain.mRID>
+    <out_Domain.mRID codingScheme="A01">10YBE----------2</out_Domain.mRID>
+    <currency_Unit.name>EUR</currency_Unit.name>
+    <price_Measure_Unit.name>MWH</price_Measure_Unit.name>
+    <curveType>A01</curveType>
+    <Period>
+      <timeInterval>
+        <start>2017-12-31T23:00Z</start>
+        <end>2018-01-01T03:00Z</end>
+      </timeInterval>
+      <resolution>PT60M</resolution>
+      <Point><position>1</position><price.amount>38.60</price.amount></Point>
+      <Point><position>2</position><price.amount>35.21</price.amount></Point>
+      <Point><position>3</position><price.amount>31.04</price.amount></Point>
+      <Point><position>4</position><price.amount>-2.50</price.amount></Point>
+    </Period>
+  </TimeSeries>
+  <TimeSeries>
+    <mRID>2</mRID>
+    <businessType>A62</businessType>
+    <in_Domain.mRID codingScheme="A01">10YBE----------2</in_Domain.mRID>
+    <out_Domain.mRID codingScheme="A01">10YBE----------2</out_Domain.mRID>
+    <currency_Unit.name>EUR</currency_Unit.name>
+    <price_Measure_Unit.name>MWH</price_Measure_Unit.name>
+    <curveType>A01</curveType>
+    <Period>
+      <timeInterval>
+        <start>2018-01-01T03:00Z</start>
+        <end>2018-01-01T07:00Z</end>
+      </timeInterval>
+      <resolution>PT60M</resolution>
+      <Point><position>1</position><price.amount>29.99</price.amount></Point>
+      <Point><position>2</position><price.amount>30.50</price.amount></Point>
+      <Point><position>3</position><price.amount>41.00</price.amount></Point>
+      <Point><position>4</position><price.amount>45.75</price.amount></Point>
+    </Period>
+  </TimeSeries>
+</Publication_MarketDocument>
+"""
+
+LOAD_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<GL_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-6:generationloaddocument:3:0">
+  <mRID>5e2b2c4f6a7d4f0a9b3e1c2d3f4a5b6c</mRID>
+  <type>A65</type>
+  <process.processType>A16</process.processType>
+  <createdDateTime>2018-01-10T09:35:01Z</createdDateTime>
+  <TimeSeries>
+    <mRID>1</mRID>
+    <businessType>A04</businessType>
+    <objectAggregation>A01</objectAggregation>
+    <outBiddingZone_Domain.mRID codingScheme="A01">10YBE----------2</outBiddingZone_Domain.mRID>
+    <quantity_Measure_Unit.name>MAW</quantity_Measure_Unit.name>
+    <curveType>A01</curveType>
+    <Period>
+      <timeInterval>
+        <start>2017-12-31T23:00Z</start>
+        <end>2018-01-01T00:30Z</end>
+      </timeInterval>
+      <resolution>PT15M</resolution>
+      <Point><position>1</position><quantity>9503</quantity></Point>
+      <Point><position>2</position><quantity>9412</quantity></Point>
+      <Point><position>3</position><quantity>9330</quantity></Point>
+      <Point><position>4</position><quantity>9281</quantity></Point>
+      <Point><position>5</position><quantity>9190</quantity></Point>
+      <Point><position>6</position><quantity>9077</quantity></Point>
+    </Period>
+  </TimeSeries>
+</GL_MarketDocument>
+"""
+
+GENERATION_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<GL_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-6:generationloaddocument:3:0">
+  <mRID>0c9f2a1b3d4e4f5a8b7c6d5e4f3a2b1c</mRID>
+  <type>A75</type>
+  <process.processType>A16</process.processType>
+  <createdDateTime>2018-01-10T09:40:44Z</createdDateTime>
+  <TimeSeries>
+    <mRID>1</mRID>
+    <businessType>A01</businessType>
+    <objectAggregation>A08</objectAggregation>
+    <inBiddingZone_Domain.mRID codingScheme="A01">10YBE----------2</inBiddingZone_Domain.mRID>
+    <quantity_Measure_Unit.name>MAW</quantity_Measure_Unit.name>
+    <curveType>A01</curveType>
+    <MktPSRType>
+      <psrType>B16</psrType>
+    </MktPSRType>
+    <Period>
+      <timeInterval>
+        <start>2018-01-01T07:00Z</start>
+        <end>2018-01-01T08:00Z</end>
+      </timeInterval>
+      <resolution>PT15M</resolution>
+      <Point><position>1</position><quantity>0</quantity></Point>
+      <Point><position>2</position><quantity>12</quantity></Point>
+      <Point><position>3</position><quantity>41</quantity></Point>
+      <Point><position>4</position><quantity>87</quantity></Point>
+    </Period>
+  </TimeSeries>
+  <TimeSeries>
+    <mRID>2</mRID>
+    <businessType>A01</businessType>
+    <objectAggregation>A08</objectAggregation>
+    <inBiddingZone_Domain.mRID codingScheme="A01">10YBE----------2</inBiddingZone_Domain.mRID>
+    <quantity_Measure_Unit.name>MAW</quantity_Measure_Unit.name>
+    <curveType>A01</curveType>
+    <MktPSRType>
+      <psrType>B19</psrType>
+    </MktPSRType>
+    <Period>
+      <timeInterval>
+        <start>2018-01-01T07:00Z</start>
+        <end>2018-01-01T08:00Z</end>
+      </timeInterval>
+      <resolution>PT15M</resolution>
+      <Point><position>1</position><quantity>803</quantity></Point>
+      <Point><position>2</position><quantity>811</quantity></Point>
+      <Point><position>3</position><quantity>795</quantity></Point>
+      <Point><position>4</position><quantity>770</quantity></Point>
+    </Period>
+  </TimeSeries>
+</GL_MarketDocument>
+"""
+
+CROSSBORDER_FLOWS_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<Publication_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-3:publicationdocument:7:0">
+  <mRID>7d1e2f3a4b5c4d6e8f9a0b1c2d3e4f5a</mRID>
+  <type>A11</type>
+  <createdDateTime>2018-01-10T09:45:10Z</createdDateTime>
+  <TimeSeries>
+    <mRID>1</mRID>
+    <businessType>A66</businessType>
+    <in_Domain.mRID codingScheme="A01">10YNL----------L</in_Domain.mRID>
+    <out_Domain.mRID codingScheme="A01">10YBE----------2</out_Domain.mRID>
+    <quantity_Measure_Unit.name>MAW</quantity_Measure_Unit.name>
+    <curveType>A01</curveType>
+    <Period>
+      <timeInterval>
+        <start>2017-12-31T23:00Z</start>
+        <end>2018-01-01T02:00Z</end>
+      </timeInterval>
+      <resolution>PT60M</resolution>
+      <Point><position>1</position><quantity>512</quantity></Point>
+      <Point><position>2</position><quantity>498</quantity></Point>
+      <Point><position>3</position><quantity>627</quantity></Point>
+    </Period>
+  </TimeSeries>
+</Publication_MarketDocument>
+"""
+
+IMBALANCE_PRICES_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<Balancing_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-6:balancingdocument:3:0">
+  <mRID>2b3c4d5e6f7a4b8c9d0e1f2a3b4c5d6e</mRID>
+  <type>A85</type>
+  <createdDateTime>2018-01-10T09:50:37Z</createdDateTime>
+  <TimeSeries>
+    <mRID>1</mRID>
+    <businessType>A19</businessType>
+    <acquiring_Domain.mRID codingScheme="A01">10YBE----------2</acquiring_Domain.mRID>
+    <connecting_Domain.mRID codingScheme="A01">10YBE----------2</connecting_Domain.mRID>
+    <currency_Unit.name>EUR</currency_Unit.name>
+    <price_Measure_Unit.name>MWH</price_Measure_Unit.name>
+    <curveType>A01</curveType>
+    <Period>
+      <timeInterval>
+        <start>2017-12-31T23:00Z</start>
+        <end>2017-12-31T23:30Z</end>
+      </timeInterval>
+      <resolution>PT15M</resolution>
+      <Point>
+        <position>1</position>
+        <imbalance_Price.amount>45.12</imbalance_Price.amount>
+        <imbalance_Price.category>A04</imbalance_Price.category>
+      </Point>
+      <Point>
+        <position>1</position>
+        <imbalance_Price.amount>21.30</imbalance_Price.amount>
+        <imbalance_Price.category>A05</imbalance_Price.category>
+      </Point>
+      <Point>
+        <position>2</position>
+        <imbalance_Price.amount>47.80</imbalance_Price.amount>
+        <imbalance_Price.category>A04</imbalance_Price.category>
+      </Point>
+      <Point>
+        <position>2</position>
+        <imbalance_Price.amount>19.95</imbalance_Price.amount>
+        <imbalance_Price.category>A05</imbalance_Price.category>
+      </Point>
+    </Period>
+  </TimeSeries>
+</Balancing_MarketDocument>
+"""
+
+OUTAGE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<Unavailability_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-6:outagedocument:3:0">
+  <mRID>{mrid}</mRID>
+  <revisionNumber>1</revisionNumber>
+  <type>A80</type>
+  <process.processType>A26</process.processType>
+  <createdDateTime>{created}</createdDateTime>
+  <docStatus>
+    <value>A05</value>
+  </docStatus>
+  <TimeSeries>
+    <mRID>1</mRID>
+    <businessType>A53</businessType>
+    <biddingZone_Domain.mRID codingScheme="A01">10YBE----------2</biddingZone_Domain.mRID>
+    <quantity_Measure_Unit.name>MAW</quantity_Measure_Unit.name>
+    <curveType>A03</curveType>
+    <production_RegisteredResource.mRID codingScheme="A01">22WDOEL000000017</production_RegisteredResource.mRID>
+    <production_RegisteredResource.name>DOEL 1</production_RegisteredResource.name>
+    <production_RegisteredResource.location.name>Doel</production_RegisteredResource.location.name>
+    <production_RegisteredResource.pSRType.psrType>B14</production_RegisteredResource.pSRType.psrType>
+    <production_RegisteredResource.pSRType.powerSystemResources.mRID codingScheme="A01">22WDOEL000000017</production_RegisteredResource.pSRType.powerSystemResources.mRID>
+    <production_RegisteredResource.pSRType.powerSystemResources.name>DOEL 1</production_RegisteredResource.pSRType.powerSystemResources.name>
+    <production_RegisteredResource.pSRType.powerSystemResources.nominalP unit="MAW">445</production_RegisteredResource.pSRType.powerSystemResources.nominalP>
+    <Available_Period>
+      <timeInterval>
+        <start>2018-01-01T23:00Z</start>
+        <end>2018-01-03T23:00Z</end>
+      </timeInterval>
+      <resolution>PT1M</resolution>
+      <Point>
+        <position>1</position>
+        <quantity>{quantity}</quantity>
+      </Point>
+    </Available_Period>
+  </TimeSeries>
+</Unavailability_MarketDocument>
+"""
+
+SPARSE_LOAD_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<GL_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-6:generationloaddocument:3:0">
+  <mRID>9a8b7c6d5e4f4a3b2c1d0e9f8a7b6c5d</mRID>
+  <type>A65</type>
+  <TimeSeries>
+    <mRID>1</mRID>
+    <businessType>A04</businessType>
+    <curveType>{curvetype}</curveType>
+    <Period>
+      <timeInterval>
+        <start>2017-12-31T23:00Z</start>
+        <end>2018-01-01T05:00Z</end>
+      </timeInterval>
+      <resolution>PT60M</resolution>
+      <Point><position>1</position><quantity>100</quantity></Point>
+      <Point><position>4</position><quantity>400</quantity></Point>
+      <Point><position>3</position><quantity>300</quantity></Point>
+    </Period>
+    <Period>
+      <timeInterval>
+        <start>2018-01-01T05:00Z</start>
+        <end>2018-01-01T07:00Z</end>
+      </timeInterval>
+      <resolution>PT60M</resolution>
+      <Point><position>2</position><quantity>700</quantity></Point>
+    </Period>
+  </TimeSeries>
+</GL_MarketDocument>
+"""
+
+NO_MATCHING_DATA_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<Acknowledgement_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-1:acknowledgementdocument:7:0">
+  <mRID>b1a2c3d4e5f6a7b8c9d0e1f2a3b4c5d6</mRID>
+  <createdDateTime>2018-01-10T09:55:00Z</createdDateTime>
+  <Reason>
+    <code>999</code>
+    <text>No matching data found for Data item Day-ahead Prices [12.1.D] (10YBE----------2, 10YBE----------2) and interval 2014-01-01T00:00:00.000Z/2015-01-01T00:00:00.000Z.</text>
+  </Reason>
+</Acknowledgement_MarketDocument>
+"""
+
+PAGINATION_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<Acknowledgement_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-1:acknowledgementdocument:7:0">
+  <mRID>c2b3d4e5f6a7b8c9d0e1f2a3b4c5d6e7</mRID>
+  <createdDateTime>2018-01-10T09:56:00Z</createdDateTime>
+  <Reason>
+    <code>999</code>
+    <text>The amount of requested data exceeds allowed limit. Allowed: {allowed} documents. Requested: {requested} documents.</text>
+  </Reason>
+</Acknowledgement_MarketDocument>
+"""
+
+
+def make_price_document(start, end):
+    """A day-ahead price document with hourly prices between start and end"""
+    start = pd.Timestamp(start).tz_convert('UTC')
+    end = pd.Timestamp(end).tz_convert('UTC')
+    hours = int((end - start) / pd.Timedelta(hours=1))
+    points = ''.join(
+        '<Point><position>{}</position><price.amount>{}</price.amount>'
+        '</Point>'.format(i + 1, start.year + i % 24) for i in range(hours))
+    return """<?xml version="1.0" encoding="UTF-8"?>
+<Publication_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-3:publicationdocument:7:0">
+  <type>A44</type>
+  <TimeSeries>
+    <mRID>1</mRID>
+    <curveType>A01</curveType>
+    <Period>
+      <timeInterval><start>{}</start><end>{}</end></timeInterval>
+      <resolution>PT60M</resolution>
+      {}
+    </Period>
+  </TimeSeries>
+</Publication_MarketDocument>
+""".format(start.strftime('%Y-%m-%dT%H:%MZ'), end.strftime('%Y-%m-%dT%H:%MZ'),
+           points)
+
+
+def make_response(content, status_code=200, headers=None):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    # lets iter_content serve the body as if it was streamed
+    response._content_consumed = True
+    response.encoding = 'utf-8'
+    response.headers.update(headers or {})
+    response.url = 'https://transparency.entsoe.eu/api'
+    return response
+
+
+class FakeSession:
+    """
+    Stands in for requests.Session, answering every GET with
+    respond(params), which returns a requests.Response
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = []
+        self.kwargs = []
+
+    def get(self, url, params=None, **kwargs):
+        self.calls.append(dict(params))
+        self.kwargs.append(kwargs)
+        return self.respond(dict(params))
+
+
+def parse_period(params):
+    start = pd.Timestamp(params['periodStart'], tz='UTC')
+    end = pd.Timestamp(params['periodEnd'], tz='UTC')
+    return start, end
+
+
+def price_responder(params):
+    return make_response(make_price_document(*parse_period(params)))
+
+
+def make_outage_zip(n_documents):
+    """Build an unavailability ZIP as served by the API"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as arc:
+        for i in range(n_documents):
+            created = pd.Timestamp('2018-01-01T10:00Z') + pd.Timedelta(
+                minutes=i)
+            xml = OUTAGE_XML.format(mrid='outage{}'.format(i),
+                                    created=created.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                                    quantity=i % 445)
+            arc.writestr('outage_{}.xml'.format(i), xml)
+    return buffer.getvalue()
+
 
 class EntsoeRawClientTest(unittest.TestCase):
     @classmethod
@@ -109,5 +534,1748 @@ class EntsoePandasClientTest(EntsoeRawClientTest):
         pass
 
 
+class ParserEngineParityTest(unittest.TestCase):
+    """The lxml engine must produce exactly what the bs4 engine produces,
+    the installed engines are compared to bs4"""
+
+    def assert_timeseries_parity(self, xml_text, func):
+        bs4_result = [func(ts) for ts in
+                      parsers._extract_timeseries(xml_text, engine='bs4')]
+        self.assertGreater(len(bs4_result), 0)
+        for engine in ENGINES:
+            results = [func(ts) for ts in
+                       parsers._extract_timeseries(xml_text, engine=engine)]
+            self.assertEqual(len(bs4_result), len(results))
+            for expected, result in zip(bs4_result, results):
+                pd.testing.assert_series_equal(result, expected)
+
+    def assert_parser_parity(self, parser, content, assert_equal):
+        expected = parser(content, engine='bs4')
+        for engine in ENGINES:
+            assert_equal(parser(content, engine=engine), expected)
+
+    def test_price_timeseries(self):
+        self.assert_timeseries_parity(PRICES_XML,
+                                      parsers._parse_price_timeseries)
+
+    def test_load_timeseries(self):
+        self.assert_timeseries_parity(LOAD_XML, parsers._parse_load_timeseries)
+
+    def test_generation_timeseries(self):
+        self.assert_timeseries_parity(
+            GENERATION_XML, parsers._parse_generation_forecast_timeseries)
+
+    def test_crossborder_flows_timeseries(self):
+        self.assert_timeseries_parity(
+            CROSSBORDER_FLOWS_XML,
+            parsers._parse_crossborder_flows_timeseries)
+
+    def test_parse_prices(self):
+        self.assert_parser_parity(parsers.parse_prices, PRICES_XML,
+                                  pd.testing.assert_series_equal)
+
+    def test_parse_loads(self):
+        self.assert_parser_parity(parsers.parse_loads, LOAD_XML,
+                                  pd.testing.assert_series_equal)
+
+    def test_parse_crossborder_flows(self):
+        self.assert_parser_parity(parsers.parse_crossborder_flows,
+                                  CROSSBORDER_FLOWS_XML,
+                                  pd.testing.assert_series_equal)
+
+    def test_parse_generation(self):
+        self.assert_parser_parity(parsers.parse_generation, GENERATION_XML,
+                                  pd.testing.assert_frame_equal)
+
+    def test_parse_imbalance_prices(self):
+        self.assert_parser_parity(parsers.parse_imbalance_prices,
+                                  IMBALANCE_PRICES_XML,
+                                  pd.testing.assert_frame_equal)
+
+    def test_parse_unavailabilities(self):
+        self.assert_parser_parity(parsers.parse_unavailabilities,
+                                  make_outage_zip(3),
+                                  pd.testing.assert_frame_equal)
+
+    def test_parse_unavailabilities_columns(self):
+        content = make_outage_zip(3)
+        for engine in ENGINES:
+            df = parsers.parse_unavailabilities(content, engine=engine)
+            self.assertEqual(df.index.name, 'created_doc_time')
+            self.assertEqual(list(df.columns), parsers.OUTAGE_COLUMNS[1:])
+            self.assertEqual(len(df), 3)
+            self.assertTrue(df.index.is_monotonic_increasing)
+            row = df.iloc[2]
+            self.assertEqual(row['docstatus'], 'Active')
+            self.assertEqual(row['biddingzone_domain'], 'BE')
+            self.assertEqual(row['plant_type'], 'Nuclear')
+            self.assertEqual(row['nominal_power'], 445.0)
+            self.assertEqual(row['avail_qty'], '2')
+            self.assertEqual(row['start'], pd.Timestamp('2018-01-01T23:00Z'))
+
+    def test_parse_unavailabilities_in_pool(self):
+        content = make_outage_zip(7)
+        expected = parsers.parse_unavailabilities(content)
+        df = parsers.parse_unavailabilities(content, max_workers=2,
+                                            batch_size=3,
+                                            parallel_threshold=1)
+        pd.testing.assert_frame_equal(df, expected)
+
+    def test_client_close_shuts_down_parse_pool(self):
+        with EntsoePandasClient(api_key='test', parse_workers=1) as client:
+            pool = client._parse_executor()
+        self.assertIsNone(client._parse_pool)
+        with self.assertRaises(RuntimeError):
+            pool.submit(int)
+
+    def test_small_archive_skips_pool(self):
+        executor = mock.Mock()
+        content = make_outage_zip(3)
+        df = parsers.parse_unavailabilities(content, executor=executor,
+                                            parallel_threshold=4)
+        self.assertEqual(len(df), 3)
+        executor.submit.assert_not_called()
+
+    def test_pool_batches_are_read_lazily(self):
+        read = []
+        in_flight = []
+
+        def batches():
+            for i in range(10):
+                read.append(i)
+                yield [make_outage_zip(1)]
+
+        class Future:
+            def __init__(self, fn, *args):
+                self.fn, self.args = fn, args
+
+            def result(self):
+                in_flight.append(len(read) - len(in_flight))
+                return pd.DataFrame(columns=parsers.OUTAGE_COLUMNS)
+
+        executor = mock.Mock()
+        executor.submit.side_effect = Future
+        parsers._parse_outage_batches(batches(), 'bs4', executor,
+                                      max_workers=1)
+        self.assertEqual(executor.submit.call_count, 10)
+        # two batches per worker are read ahead of the results
+        self.assertLessEqual(max(in_flight), 3)
+
+    def test_outage_without_docstatus(self):
+        xml = OUTAGE_XML.format(mrid='1', created='2018-01-01T10:00:00Z',
+                                quantity=0)
+        start = xml.index('  <docStatus>')
+        end = xml.index('</docStatus>\n') + len('</docStatus>\n')
+        xml = (xml[:start] + xml[end:]).encode()
+        for engine in ENGINES:
+            df = parsers._outage_parser(xml, engine=engine)
+            self.assertEqual(len(df), 1)
+            self.assertIsNone(df['docstatus'].iloc[0])
+
+    def test_bytes_input(self):
+        expected = parsers.parse_generation(GENERATION_XML, engine='bs4')
+        for engine in ENGINES:
+            pd.testing.assert_frame_equal(
+                parsers.parse_generation(GENERATION_XML.encode(),
+                                         engine=engine), expected)
+
+    def test_empty_response(self):
+        for engine in ENGINES:
+            self.assertEqual(
+                list(parsers._extract_timeseries('', engine=engine)), [])
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            parsers.parse_generation(GENERATION_XML, engine='html5lib')
+
+    @unittest.skipIf(etree is None, "requires lxml")
+    def test_client_engine(self):
+        client = EntsoePandasClient(api_key='test', parser_engine='lxml')
+        self.assertEqual(client.parser_engine, 'lxml')
+
+
+class PointDecodingTest(unittest.TestCase):
+    index = pd.date_range('2017-12-31T23:00Z', periods=8, freq='60min')
+
+    def parse(self, curvetype, engine):
+        xml = SPARSE_LOAD_XML.format(curvetype=curvetype)
+        soup = next(parsers._extract_timeseries(xml, engine=engine))
+        return parsers._parse_load_timeseries(soup)
+
+    def test_fixed_blocks_leave_gaps(self):
+        expected = pd.Series([100, None, 300, 400, None, None, None, 700],
+                             index=self.index, dtype=float)
+        for engine in ENGINES:
+            pd.testing.assert_series_equal(self.parse('A01', engine),
+                                           expected, check_freq=False)
+
+    def test_variable_blocks_forward_fill(self):
+        expected = pd.Series([100, 100, 300, 400, 400, 400, None, 700],
+                             index=self.index, dtype=float)
+        for engine in ENGINES:
+            pd.testing.assert_series_equal(self.parse('A03', engine),
+                                           expected, check_freq=False)
+
+    def test_complete_period_keeps_frequency(self):
+        soup = next(parsers._extract_timeseries(LOAD_XML))
+        series = parsers._parse_load_timeseries(soup)
+        self.assertEqual(len(series), 6)
+        self.assertEqual(series.index.freq, pd.Timedelta('15min'))
+        self.assertEqual(series.iloc[-1], 9077)
+
+
+    def test_yearly_resolution(self):
+        xml = GENERATION_XML.replace(
+            '<start>2018-01-01T07:00Z</start>',
+            '<start>2016-12-31T23:00Z</start>').replace(
+            '<end>2018-01-01T08:00Z</end>',
+            '<end>2018-12-31T23:00Z</end>').replace('PT15M', 'P1Y')
+        for engine in ENGINES:
+            df = parsers.parse_generation(xml, engine=engine)
+            self.assertEqual(list(df.index), [
+                pd.Timestamp('2016-12-31T23:00Z'),
+                pd.Timestamp('2017-12-31T23:00Z')])
+            self.assertEqual(list(df['Solar']), [0, 12])
+
+
+class TopLevelParserTest(unittest.TestCase):
+    def test_prices_concatenated_in_order(self):
+        series = parsers.parse_prices(PRICES_XML)
+        self.assertEqual(len(series), 8)
+        self.assertTrue(series.index.is_monotonic_increasing)
+        self.assertEqual(series.iloc[3], -2.5)
+        self.assertEqual(series.iloc[4], 29.99)
+
+    def test_empty_document(self):
+        self.assertTrue(parsers.parse_loads('').empty)
+
+    def test_generation_merges_series_of_same_type(self):
+        xml = GENERATION_XML.replace('B19', 'B16')
+        df = parsers.parse_generation(xml)
+        self.assertEqual(list(df.columns), ['Solar'])
+        self.assertEqual(len(df), 4)
+        self.assertEqual(df['Solar'].iloc[-1], 87)
+
+    def test_bytes_input(self):
+        data = GENERATION_XML.encode('utf-8')
+        for engine in ENGINES:
+            expected = parsers.parse_generation(GENERATION_XML, engine=engine)
+            for body in (data, bytearray(data), memoryview(data)):
+                pd.testing.assert_frame_equal(
+                    parsers.parse_generation(body, engine=engine), expected)
+        self.assertTrue(parsers.parse_loads(b'').empty)
+
+    def test_raw_bytes_client(self):
+        session = FakeSession(lambda params: make_response(PRICES_XML))
+        start = pd.Timestamp('20180101', tz='UTC')
+        end = pd.Timestamp('20180102', tz='UTC')
+        client = EntsoeRawClient(api_key='test', session=session)
+        text = client.query_day_ahead_prices('BE', start=start, end=end)
+        self.assertIsInstance(text, str)
+        client = EntsoeRawClient(api_key='test', session=session,
+                                 raw_bytes=True)
+        body = client.query_day_ahead_prices('BE', start=start, end=end)
+        self.assertEqual(body, PRICES_XML.encode('utf-8'))
+        client = EntsoePandasClient(api_key='test', session=session)
+        self.assertTrue(client.raw_bytes)
+        self.assertEqual(len(client.query_day_ahead_prices(
+            'BE', start=start, end=end)), 8)
+
+
+class BlockFetchingTest(unittest.TestCase):
+    start = pd.Timestamp('20150101', tz='Europe/Brussels')
+    end = pd.Timestamp('20180101', tz='Europe/Brussels')
+
+    def make_client(self, respond=price_responder, **kwargs):
+        return EntsoePandasClient(api_key='test', session=FakeSession(respond),
+                                  **kwargs)
+
+    def test_concurrent_blocks_keep_order(self):
+        sequential = self.make_client().query_day_ahead_prices(
+            'BE', start=self.start, end=self.end)
+        client = self.make_client(max_workers=3)
+        concurrent = client.query_day_ahead_prices(
+            'BE', start=self.start, end=self.end)
+        self.assertEqual(len(client.session.calls), 3)
+        self.assertTrue(concurrent.index.is_monotonic_increasing)
+        pd.testing.assert_series_equal(concurrent, sequential)
+
+    def first_block_empty(self, params):
+        start, end = parse_period(params)
+        if start.year == 2014:
+            return make_response(NO_MATCHING_DATA_XML, status_code=400)
+        return price_responder(params)
+
+    def test_empty_block_raises_by_default(self):
+        client = self.make_client(self.first_block_empty, max_workers=3)
+        with self.assertRaises(NoMatchingDataError):
+            client.query_day_ahead_prices('BE', start=self.start,
+                                          end=self.end)
+
+    def test_skip_empty_blocks(self):
+        client = self.make_client(self.first_block_empty, max_workers=3,
+                                  skip_empty_blocks=True)
+        series = client.query_day_ahead_prices('BE', start=self.start,
+                                               end=self.end)
+        self.assertEqual(series.index[0],
+                         pd.Timestamp('20160101', tz='Europe/Brussels'))
+        self.assertEqual(series.index[-1],
+                         pd.Timestamp('20171231 23:00', tz='Europe/Brussels'))
+
+    def test_all_blocks_empty(self):
+        client = self.make_client(
+            lambda params: make_response(NO_MATCHING_DATA_XML, 400),
+            skip_empty_blocks=True)
+        with self.assertRaises(NoMatchingDataError):
+            client.query_day_ahead_prices('BE', start=self.start,
+                                          end=self.end)
+
+    def test_iter_blocks(self):
+        client = self.make_client()
+        expected = client.query_day_ahead_prices('BE', start=self.start,
+                                                 end=self.end)
+        blocks = client.iter_day_ahead_prices('BE', start=self.start,
+                                              end=self.end)
+        first = next(blocks)
+        # blocks are only fetched when they are needed
+        self.assertEqual(len(client.session.calls), 4)
+        self.assertEqual(first.index[-1],
+                         pd.Timestamp('20151231 23:00', tz='Europe/Brussels'))
+        series = pd.concat([first] + list(blocks))
+        pd.testing.assert_series_equal(series, expected)
+        self.assertEqual(client.iter_day_ahead_prices.__name__,
+                         'iter_day_ahead_prices')
+
+    def test_iter_blocks_skips_empty(self):
+        client = self.make_client(self.first_block_empty,
+                                  skip_empty_blocks=True)
+        blocks = list(client.iter_day_ahead_prices('BE', start=self.start,
+                                                   end=self.end))
+        self.assertEqual(len(blocks), 2)
+        client = self.make_client(self.first_block_empty)
+        with self.assertRaises(NoMatchingDataError):
+            list(client.iter_day_ahead_prices('BE', start=self.start,
+                                              end=self.end))
+
+
+class BulkQueryTest(unittest.TestCase):
+    start = pd.Timestamp('20180101', tz='UTC')
+    end = pd.Timestamp('20180103', tz='UTC')
+
+    def make_client(self, respond=price_responder, **kwargs):
+        return EntsoePandasClient(api_key='test',
+                                  session=FakeSession(respond), **kwargs)
+
+    def test_prices_wide_frame(self):
+        client = self.make_client()
+        result = client.query_day_ahead_prices_bulk(
+            ['BE', 'NL', 'XX'], start=self.start, end=self.end)
+        self.assertEqual(list(result.data.columns), ['BE', 'NL'])
+        self.assertEqual(str(result.data.index.tz), 'UTC')
+        self.assertEqual(len(result.data), 48)
+        self.assertEqual(list(result.failures), ['XX'])
+        self.assertIsInstance(result.failures['XX'], KeyError)
+        expected = client.query_day_ahead_prices(
+            'NL', start=self.start, end=self.end).tz_convert('UTC')
+        pd.testing.assert_series_equal(result.data['NL'], expected,
+                                       check_names=False, check_freq=False)
+
+    def test_failures_do_not_abort(self):
+        def respond(params):
+            if params['out_Domain'] == BIDDING_ZONES['NL']:
+                return make_response(NO_MATCHING_DATA_XML, 400)
+            return make_response(LOAD_XML)
+
+        data, failures = self.make_client(respond).query_load_bulk(
+            ['BE', 'NL'], start=self.start, end=self.end)
+        self.assertEqual(list(data.columns), ['BE'])
+        self.assertIsInstance(failures['NL'], NoMatchingDataError)
+
+    def test_all_zones(self):
+        result = self.make_client(max_workers=4).query_day_ahead_prices_bulk(
+            'all', start=self.start, end=self.end)
+        self.assertEqual(set(result.data.columns) | set(result.failures),
+                         set(BIDDING_ZONES))
+        self.assertGreater(len(result.data.columns), 30)
+
+    def test_generation_multiindex(self):
+        client = self.make_client(
+            lambda params: make_response(GENERATION_XML))
+        data, failures = client.query_generation_bulk(
+            ['BE', 'NL'], start=self.start, end=self.end)
+        self.assertEqual(failures, {})
+        self.assertEqual(data.columns.nlevels, 2)
+        self.assertEqual(set(data.columns.get_level_values(0)), {'BE', 'NL'})
+
+
+class PsrCoalescingTest(unittest.TestCase):
+    start = pd.Timestamp('20180101', tz='UTC')
+    end = pd.Timestamp('20180102', tz='UTC')
+
+    def make_client(self, **kwargs):
+        session = FakeSession(lambda params: make_response(GENERATION_XML))
+        client = EntsoePandasClient(api_key='test', session=session, **kwargs)
+        return client, session
+
+    def test_one_request_for_all_types(self):
+        client, session = self.make_client(coalesce_psr_types=60)
+        solar = client.query_generation('BE', start=self.start, end=self.end,
+                                        psr_type='B16')
+        wind = client.query_generation('BE', start=self.start, end=self.end,
+                                       psr_type='B19')
+        self.assertEqual(len(session.calls), 1)
+        self.assertNotIn('psrType', session.calls[0])
+        self.assertEqual(list(solar.columns), ['Solar'])
+        self.assertEqual(list(solar['Solar']), [0, 12, 41, 87])
+        self.assertEqual(list(wind.columns), ['Wind Onshore'])
+
+        client.query_generation('NL', start=self.start, end=self.end,
+                                psr_type='B16')
+        client.query_installed_generation_capacity(
+            'BE', start=self.start, end=self.end, psr_type='B16')
+        self.assertEqual(len(session.calls), 3)
+
+    def test_missing_type(self):
+        client, session = self.make_client(coalesce_psr_types=60)
+        with self.assertRaises(NoMatchingDataError):
+            client.query_generation('BE', start=self.start, end=self.end,
+                                    psr_type='B01')
+
+    def test_same_as_filtered(self):
+        coalesced, _ = self.make_client(coalesce_psr_types=60)
+        plain, session = self.make_client()
+        expected = plain.query_generation_forecast(
+            'BE', start=self.start, end=self.end, psr_type='B19')
+        self.assertEqual(session.calls[0]['psrType'], 'B19')
+        # the fixture holds both types, unlike a real filtered response
+        pd.testing.assert_frame_equal(
+            coalesced.query_generation_forecast(
+                'BE', start=self.start, end=self.end, psr_type='B19'),
+            expected[['Wind Onshore']])
+
+    def test_expiry(self):
+        client, session = self.make_client(coalesce_psr_types=0)
+        for psr_type in ('B16', 'B19'):
+            client.query_generation('BE', start=self.start, end=self.end,
+                                    psr_type=psr_type)
+            time.sleep(0.01)
+        self.assertEqual(len(session.calls), 2)
+
+    def test_concurrent_callers_share_one_call(self):
+        coalescer = Coalescer(ttl=60)
+        started = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return 'result'
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            first = pool.submit(coalescer.get, 'key', slow)
+            started.wait()
+            others = [pool.submit(coalescer.get, 'key', slow)
+                      for _ in range(3)]
+            results = [f.result() for f in [first] + others]
+        self.assertEqual(results, ['result'] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(coalescer.hits, 3)
+
+    def test_errors_are_not_kept(self):
+        coalescer = Coalescer(ttl=60)
+
+        def fail():
+            raise requests.ConnectionError
+
+        with self.assertRaises(requests.ConnectionError):
+            coalescer.get('key', fail)
+        self.assertEqual(coalescer.get('key', lambda: 1), 1)
+
+
+class FlowMatrixTest(unittest.TestCase):
+    start = pd.Timestamp('20180101', tz='UTC')
+    end = pd.Timestamp('20180102', tz='UTC')
+
+    @staticmethod
+    def respond(params):
+        # 512, 498, 627 MW from BE, 100 MW less the other way
+        xml = CROSSBORDER_FLOWS_XML
+        if params['out_Domain'] != DOMAIN_MAPPINGS['BE']:
+            for value in ('512', '498', '627'):
+                xml = xml.replace('>{}<'.format(value),
+                                  '>{}<'.format(int(value) - 100))
+        if params['in_Domain'] == DOMAIN_MAPPINGS['LU']:
+            return make_response(NO_MATCHING_DATA_XML, 400)
+        return make_response(xml)
+
+    def query(self, **kwargs):
+        client = EntsoePandasClient(api_key='test',
+                                    session=FakeSession(self.respond))
+        return client.query_crossborder_flows_matrix(
+            self.start, self.end, country_codes=['BE', 'FR', 'NL', 'LU'],
+            **kwargs)
+
+    def test_neighbours_are_symmetric(self):
+        for country, neighbours in NEIGHBOURS.items():
+            self.assertIn(country, DOMAIN_MAPPINGS)
+            for neighbour in neighbours:
+                self.assertIn(country, NEIGHBOURS[neighbour])
+        # interconnectors commissioned since 2020: ALEGrO, NordLink,
+        # North Sea Link and Viking Link
+        for a, b in (('BE', 'DE'), ('DE', 'NO'), ('GB', 'NO'), ('DK', 'GB')):
+            self.assertIn(b, NEIGHBOURS[a])
+
+    def test_long_format(self):
+        data, failures = self.query()
+        self.assertEqual(list(data.columns), ['time', 'from', 'to', 'flow'])
+        # BE-FR, BE-NL, LU-BE, LU-FR both ways, but nothing into LU
+        self.assertEqual(sorted(failures), [('BE', 'LU'), ('FR', 'LU')])
+        self.assertEqual(len(data), 6 * 3)
+        be_nl = data[(data['from'] == 'BE') & (data['to'] == 'NL')]
+        self.assertEqual(list(be_nl['flow']), [512, 498, 627])
+
+    def test_net_array(self):
+        matrix, failures = self.query(net=True, as_array=True)
+        self.assertEqual(matrix.zones, ['BE', 'FR', 'NL', 'LU'])
+        self.assertEqual(matrix.values.shape, (3, 4, 4))
+        be, nl = 0, 2
+        self.assertTrue((matrix.values[:, be, nl] == 100).all())
+        self.assertTrue((matrix.values[:, nl, be] == -100).all())
+        # only one direction of the borders with LU
+        self.assertTrue(np.isnan(matrix.values[:, :, 3]).all())
+        self.assertTrue(np.isnan(matrix.values[:, 3, :]).all())
+
+
+class PrefetchTest(unittest.TestCase):
+    start = pd.Timestamp('20140101', tz='Europe/Brussels')
+    end = pd.Timestamp('20180101', tz='Europe/Brussels')
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def respond(self, params):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        return price_responder(params)
+
+    def make_client(self, **kwargs):
+        return EntsoePandasClient(api_key='test',
+                                  session=FakeSession(self.respond), **kwargs)
+
+    def test_same_result_one_request_at_a_time(self):
+        expected = self.make_client().query_day_ahead_prices(
+            'BE', start=self.start, end=self.end)
+        client = self.make_client(prefetch=2)
+        series = client.query_day_ahead_prices('BE', start=self.start,
+                                               end=self.end)
+        pd.testing.assert_series_equal(series, expected)
+        self.assertEqual(self.max_in_flight, 1)
+
+    def test_prefetch_is_bounded(self):
+        client = self.make_client(prefetch=1)
+        blocks = client.iter_day_ahead_prices('BE', start=self.start,
+                                              end=self.end)
+        next(blocks)
+        time.sleep(0.1)
+        # the first block was consumed, the second is buffered and the
+        # third requested, the fourth waits until the consumer catches up
+        self.assertEqual(len(client.session.calls), 3)
+        self.assertEqual(len(list(blocks)), 3)
+        self.assertEqual(len(client.session.calls), 4)
+
+    def test_not_combined_with_max_workers(self):
+        with self.assertRaises(ValueError):
+            self.make_client(prefetch=1, max_workers=2)
+
+
+@mock.patch('entsoe.ratelimit.sleep')
+class RateLimiterTest(unittest.TestCase):
+    def test_burst_then_wait(self, sleep):
+        limiter = RateLimiter(requests_per_minute=60, burst=2)
+        waits = [limiter.acquire() for _ in range(4)]
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertAlmostEqual(waits[2], 1, places=1)
+        self.assertAlmostEqual(waits[3], 2, places=1)
+        self.assertEqual(sleep.call_count, 2)
+        stats = limiter.stats()
+        self.assertEqual(stats['requests'], 4)
+        self.assertEqual(stats['throttled'], 2)
+        self.assertAlmostEqual(stats['total_wait'], 3, places=1)
+
+    def test_thread_safe(self, sleep):
+        limiter = RateLimiter(requests_per_minute=60, burst=1)
+        threads = [threading.Thread(target=limiter.acquire)
+                   for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(limiter.requests, 20)
+        self.assertAlmostEqual(limiter.max_wait, 19, places=1)
+
+    def test_shared_between_processes(self, sleep):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'limit.sqlite')
+            first = SQLiteRateLimiter(path, requests_per_minute=60, burst=2)
+            second = SQLiteRateLimiter(path, requests_per_minute=60, burst=2)
+            self.assertEqual(first.acquire(), 0)
+            self.assertEqual(first.acquire(), 0)
+            self.assertGreater(second.acquire(), 0.5)
+
+    def test_client_waits_for_limiter(self, sleep):
+        limiter = RateLimiter(requests_per_minute=60, burst=1)
+        client = EntsoeRawClient(api_key='test', rate_limiter=limiter,
+                                 session=FakeSession(price_responder))
+        start = pd.Timestamp('20180101', tz='Europe/Brussels')
+        end = pd.Timestamp('20180102', tz='Europe/Brussels')
+        client.query_day_ahead_prices('BE', start=start, end=end)
+        response = client.base_request(params={'documentType': 'A44'},
+                                       start=start, end=end)
+        self.assertGreater(response.rate_limit_wait, 0)
+        self.assertEqual(limiter.requests, 2)
+
+
+class SequenceResponder:
+    """Answers with the given responses in turn, raising exceptions"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+
+    def __call__(self, params):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@mock.patch('entsoe.misc.sleep')
+class RetryPolicyTest(unittest.TestCase):
+    start = pd.Timestamp('20180101', tz='Europe/Brussels')
+    end = pd.Timestamp('20180102', tz='Europe/Brussels')
+
+    def query(self, *responses, **kwargs):
+        kwargs.setdefault('retry_policy', RetryPolicy(max_retries=3))
+        self.client = EntsoeRawClient(
+            api_key='test', session=FakeSession(SequenceResponder(*responses)),
+            **kwargs)
+        return self.client.base_request(params={'documentType': 'A44'},
+                                        start=self.start, end=self.end)
+
+    def test_retries_unavailable(self, sleep):
+        with self.assertLogs('entsoe.misc', 'WARNING'):
+            response = self.query(make_response('busy', 503),
+                                  make_response('busy', 502),
+                                  make_response(PRICES_XML))
+        self.assertEqual(response.retries, 2)
+        self.assertEqual(sleep.call_count, 2)
+        first, second = [call.args[0] for call in sleep.call_args_list]
+        self.assertTrue(0.5 <= first <= 1)
+        self.assertTrue(1 <= second <= 2)
+
+    def test_honors_retry_after(self, sleep):
+        self.query(make_response('slow down', 429, {'Retry-After': '7'}),
+                   make_response(PRICES_XML))
+        self.assertEqual(sleep.call_args.args[0], 7)
+
+    def test_retries_connection_errors(self, sleep):
+        response = self.query(requests.ConnectionError(),
+                              requests.ReadTimeout(),
+                              make_response(PRICES_XML))
+        self.assertEqual(response.retries, 2)
+
+    def test_gives_up(self, sleep):
+        with self.assertRaises(requests.HTTPError):
+            self.query(*[make_response('busy', 503)] * 4)
+        self.assertEqual(len(self.client.session.calls), 4)
+
+    def test_max_elapsed(self, sleep):
+        policy = RetryPolicy(max_retries=5, backoff=10, jitter=0,
+                             max_elapsed=15)
+        with self.assertRaises(requests.HTTPError):
+            self.query(*[make_response('busy', 503)] * 6,
+                       retry_policy=policy)
+        self.assertEqual(len(self.client.session.calls), 2)
+
+    def test_never_retries_no_data(self, sleep):
+        with self.assertRaises(NoMatchingDataError):
+            self.query(make_response(NO_MATCHING_DATA_XML, 400),
+                       make_response(PRICES_XML))
+        self.assertEqual(len(self.client.session.calls), 1)
+        sleep.assert_not_called()
+
+    def test_defaults_from_retry_count(self, sleep):
+        response = self.query(make_response('busy', 503),
+                              make_response(PRICES_XML),
+                              retry_policy=None, retry_count=1,
+                              retry_delay=0)
+        self.assertEqual(response.retries, 1)
+        # no delay set, but throttled requests still back off
+        self.assertGreater(sleep.call_args.args[0], 0)
+
+
+class TimeoutAndHedgingTest(unittest.TestCase):
+    start = pd.Timestamp('20180101', tz='Europe/Brussels')
+    end = pd.Timestamp('20180102', tz='Europe/Brussels')
+
+    def test_timeout_passed_to_session(self):
+        client = EntsoeRawClient(api_key='test', timeout=(3, 30),
+                                 session=FakeSession(price_responder))
+        client.query_day_ahead_prices('BE', start=self.start, end=self.end)
+        self.assertEqual(client.session.kwargs[0]['timeout'], (3, 30))
+
+    def test_latency_percentile_per_document_type(self):
+        tracker = LatencyTracker(min_samples=5)
+        for seconds in range(1, 5):
+            tracker.record('A44', seconds)
+        self.assertIsNone(tracker.percentile('A44', 0.5))
+        tracker.record('A44', 5)
+        tracker.record('A65', 100)
+        self.assertEqual(tracker.percentile('A44', 0.5), 3)
+        self.assertIsNone(tracker.percentile('A65', 0.5))
+
+    def test_hedged_request_wins(self):
+        calls = []
+
+        def slow_first(params):
+            calls.append(params)
+            if len(calls) == 1:
+                time.sleep(1)
+            return price_responder(params)
+
+        client = EntsoeRawClient(api_key='test', hedge_percentile=0.9,
+                                 session=FakeSession(slow_first))
+        for _ in range(client.latency_tracker.min_samples):
+            client.latency_tracker.record('A44', 0.01)
+        started = time.monotonic()
+        text = client.query_day_ahead_prices('BE', start=self.start,
+                                             end=self.end)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertIn('Publication_MarketDocument', text)
+        self.assertEqual(client.hedged_requests, 1)
+        self.assertEqual(len(calls), 2)
+
+    def test_losing_response_is_closed(self):
+        responses = []
+
+        def slow_first(params):
+            response = price_responder(params)
+            response.close = mock.Mock()
+            responses.append(response)
+            if len(responses) == 1:
+                time.sleep(0.3)
+            return response
+
+        client = EntsoeRawClient(api_key='test', hedge_percentile=0.9,
+                                 session=FakeSession(slow_first))
+        for _ in range(client.latency_tracker.min_samples):
+            client.latency_tracker.record('A44', 0.01)
+        client.query_day_ahead_prices('BE', start=self.start, end=self.end)
+        client.close()
+        responses[0].close.assert_called_once_with()
+        responses[1].close.assert_not_called()
+
+    def test_close_shuts_down_hedging(self):
+        with EntsoeRawClient(api_key='test', hedge_percentile=0.9,
+                             session=FakeSession(price_responder)) as client:
+            executor = client._hedge_executor
+        self.assertIsNone(client._hedge_executor)
+        with self.assertRaises(RuntimeError):
+            executor.submit(int)
+        # still answers, without hedging
+        for _ in range(client.latency_tracker.min_samples):
+            client.latency_tracker.record('A44', 0.01)
+        client.query_day_ahead_prices('BE', start=self.start, end=self.end)
+        self.assertEqual(client.hedged_requests, 0)
+
+    def test_rate_limit_wait_not_hedged(self):
+        limiter = mock.Mock()
+        limiter.acquire.side_effect = lambda: time.sleep(0.3) or 0.3
+        client = EntsoeRawClient(api_key='test', hedge_percentile=0.9,
+                                 rate_limiter=limiter,
+                                 session=FakeSession(price_responder))
+        for _ in range(client.latency_tracker.min_samples):
+            client.latency_tracker.record('A44', 0.1)
+        client.query_day_ahead_prices('BE', start=self.start, end=self.end)
+        self.assertEqual(client.hedged_requests, 0)
+        self.assertEqual(limiter.acquire.call_count, 1)
+
+    def test_fast_request_not_hedged(self):
+        client = EntsoeRawClient(api_key='test', hedge_percentile=0.9,
+                                 session=FakeSession(price_responder))
+        for _ in range(client.latency_tracker.min_samples):
+            client.latency_tracker.record('A44', 1)
+        client.query_day_ahead_prices('BE', start=self.start, end=self.end)
+        self.assertEqual(client.hedged_requests, 0)
+        self.assertEqual(len(client.session.calls), 1)
+
+
+class FakeAsyncResponse:
+    def __init__(self, response):
+        self.response = response
+        self.status = response.status_code
+        self.reason = 'Error' if response.status_code >= 400 else 'OK'
+        self.url = response.url
+        self.headers = response.headers
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def read(self):
+        return self.response.content
+
+
+class FakeAsyncSession:
+    """aiohttp.ClientSession stand-in, see FakeSession"""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get(self, url, params=None, **kwargs):
+        self.calls.append(dict(params))
+        return FakeAsyncResponse(self.respond(dict(params)))
+
+    async def close(self):
+        pass
+
+
+class AsyncClientTest(unittest.IsolatedAsyncioTestCase):
+    start = pd.Timestamp('20150101', tz='Europe/Brussels')
+    end = pd.Timestamp('20180101', tz='Europe/Brussels')
+
+    async def test_raw_client(self):
+        async with AsyncEntsoeRawClient(
+                api_key='test',
+                session=FakeAsyncSession(price_responder)) as client:
+            text = await client.query_day_ahead_prices(
+                'BE', start=self.start, end=self.end)
+        self.assertIn('Publication_MarketDocument', text)
+        params = client.session.calls[0]
+        self.assertEqual(params['documentType'], 'A44')
+        self.assertEqual(params['securityToken'], 'test')
+
+    async def test_pandas_client_matches_sync_client(self):
+        sync = EntsoePandasClient(api_key='test',
+                                  session=FakeSession(price_responder))
+        expected = sync.query_day_ahead_prices('BE', start=self.start,
+                                               end=self.end)
+        client = AsyncEntsoePandasClient(
+            api_key='test', session=FakeAsyncSession(price_responder))
+        series = await client.query_day_ahead_prices('BE', start=self.start,
+                                                     end=self.end)
+        self.assertEqual(len(client.session.calls), 3)
+        pd.testing.assert_series_equal(series, expected)
+
+    async def test_error_mapping(self):
+        client = AsyncEntsoePandasClient(
+            api_key='test', session=FakeAsyncSession(
+                lambda params: make_response(NO_MATCHING_DATA_XML, 400)))
+        with self.assertRaises(NoMatchingDataError):
+            await client.query_load('BE', start=self.start, end=self.end)
+
+    @mock.patch('entsoe.misc.asyncio.sleep')
+    async def test_retries(self, sleep):
+        client = AsyncEntsoeRawClient(
+            api_key='test', retry_policy=RetryPolicy(max_retries=2),
+            session=FakeAsyncSession(SequenceResponder(
+                make_response('busy', 503), make_response(PRICES_XML))))
+        response = await client.base_request(
+            params={'documentType': 'A44'}, start=self.start, end=self.end)
+        self.assertEqual(response.retries, 1)
+        sleep.assert_awaited_once()
+
+    async def test_skip_empty_blocks(self):
+        def respond(params):
+            if parse_period(params)[0].year == 2014:
+                return make_response(NO_MATCHING_DATA_XML, 400)
+            return price_responder(params)
+
+        client = AsyncEntsoePandasClient(
+            api_key='test', skip_empty_blocks=True,
+            session=FakeAsyncSession(respond))
+        series = await client.query_day_ahead_prices('BE', start=self.start,
+                                                     end=self.end)
+        self.assertEqual(series.index[0],
+                         pd.Timestamp('20160101', tz='Europe/Brussels'))
+
+    async def test_pagination(self):
+        responder = OutageResponder()
+        client = AsyncEntsoePandasClient(
+            api_key='test', session=FakeAsyncSession(responder))
+        df = await client.query_unavailability_of_generation_units(
+            'BE', start=PaginationTest.start, end=PaginationTest.end)
+        self.assertEqual(len(df), len(responder.documents))
+        self.assertEqual(responder.paginated, 1)
+
+    async def test_caches_and_limiter_off_the_loop(self):
+        loop_thread = threading.current_thread()
+        threads = []
+
+        def record(result):
+            def call(*args, **kwargs):
+                threads.append(threading.current_thread())
+                return result
+            return call
+
+        cache = mock.Mock(get=record(None), set=record(None))
+        negative_cache = mock.Mock(contains=record(False))
+        limiter = mock.Mock(reserve=record(0.0))
+        client = AsyncEntsoeRawClient(
+            api_key='test', cache=cache, negative_cache=negative_cache,
+            rate_limiter=limiter, session=FakeAsyncSession(price_responder))
+        await client.base_request(params={'documentType': 'A44'},
+                                  start=self.start, end=self.end)
+        self.assertEqual(len(threads), 4)
+        self.assertNotIn(loop_thread, threads)
+
+    async def test_close_shuts_down_parse_pool(self):
+        client = AsyncEntsoePandasClient(
+            api_key='test', parse_workers=1,
+            session=FakeAsyncSession(price_responder))
+        pool = client._parse_pool_executor()
+        await client.close()
+        self.assertIsNone(client._parse_pool)
+        with self.assertRaises(RuntimeError):
+            pool.submit(int)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    start = pd.Timestamp('20180101', tz='Europe/Brussels')
+    end = pd.Timestamp('20180102', tz='Europe/Brussels')
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def make_client(self, cache, respond=price_responder, api_key='test'):
+        return EntsoeRawClient(api_key=api_key, cache=cache,
+                               session=FakeSession(respond))
+
+    def test_second_request_served_from_cache(self):
+        cache = ResponseCache(self.tmp.name)
+        client = self.make_client(cache)
+        first = client.query_day_ahead_prices('BE', self.start, self.end)
+        # a different API key shares the cached response
+        other = self.make_client(cache, api_key='other')
+        second = other.query_day_ahead_prices('BE', self.start, self.end)
+        self.assertEqual(first, second)
+        self.assertEqual(len(client.session.calls), 1)
+        self.assertEqual(len(other.session.calls), 0)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['stores']),
+                         (1, 1, 1))
+        # a new instance, eg. in another process, finds it on disk
+        fresh = self.make_client(ResponseCache(self.tmp.name))
+        fresh.query_day_ahead_prices('BE', self.start, self.end)
+        self.assertEqual(len(fresh.session.calls), 0)
+
+    def test_recent_periods_expire(self):
+        cache = ResponseCache(self.tmp.name, recent_ttl=0)
+        client = self.make_client(cache)
+        end = pd.Timestamp.now(tz='UTC').floor('h')
+        start = end - pd.Timedelta(hours=2)
+        client.query_day_ahead_prices('BE', start, end)
+        client.query_day_ahead_prices('BE', start, end)
+        self.assertEqual(len(client.session.calls), 2)
+        client.query_day_ahead_prices('BE', self.start, self.end)
+        client.query_day_ahead_prices('BE', self.start, self.end)
+        self.assertEqual(len(client.session.calls), 3)
+
+    def test_errors_are_not_cached(self):
+        cache = ResponseCache(self.tmp.name)
+        client = self.make_client(
+            cache, lambda params: make_response(NO_MATCHING_DATA_XML, 400))
+        for _ in range(2):
+            with self.assertRaises(NoMatchingDataError):
+                client.query_load('BE', self.start, self.end)
+        self.assertEqual(len(client.session.calls), 2)
+        self.assertEqual(cache.stats()['stores'], 0)
+
+    def test_evicts_least_recently_used(self):
+        cache = ResponseCache(self.tmp.name, max_size=2500)
+        for day in range(1, 6):
+            params = {'documentType': 'A44', 'periodStart': '2018010{}0000'
+                      .format(day)}
+            cache.set(params, os.urandom(1000))
+        self.assertGreater(cache.evictions, 0)
+        self.assertLessEqual(cache.stats()['size'], 2500)
+        self.assertIsNotNone(cache.get({'documentType': 'A44',
+                                        'periodStart': '201801050000'}))
+
+    def test_set_file(self):
+        cache = ResponseCache(self.tmp.name)
+        params = {'documentType': 'A44', 'periodStart': '201801010000'}
+        content = os.urandom(200 * 1024)
+        cache.set_file(params, io.BytesIO(content), chunk_size=1000)
+        self.assertEqual(cache.get(params), content)
+        self.assertEqual(cache.stats()['size'], cache._scan_size())
+
+    def test_overwrite_keeps_size(self):
+        cache = ResponseCache(self.tmp.name)
+        params = {'documentType': 'A44', 'periodStart': '201801010000'}
+        for _ in range(3):
+            cache.set(params, os.urandom(1000))
+        self.assertEqual(cache.stats()['size'], cache._scan_size())
+        self.assertEqual(cache.evictions, 0)
+
+
+class NegativeCacheTest(unittest.TestCase):
+    start = pd.Timestamp('20150101', tz='Europe/Brussels')
+    end = pd.Timestamp('20180101', tz='Europe/Brussels')
+
+    @staticmethod
+    def no_data(params):
+        return make_response(NO_MATCHING_DATA_XML, 400)
+
+    def test_base_request_skips_known_empty(self):
+        cache = NegativeCache()
+        client = EntsoeRawClient(api_key='test', negative_cache=cache,
+                                 session=FakeSession(self.no_data))
+        for _ in range(3):
+            with self.assertRaises(NoMatchingDataError):
+                client.query_load('BE', self.start, self.end)
+        self.assertEqual(len(client.session.calls), 1)
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1,
+                                         'stores': 1})
+
+    def test_year_blocks_skip_known_empty(self):
+        def first_block_empty(params):
+            if parse_period(params)[0].year == 2014:
+                return self.no_data(params)
+            return price_responder(params)
+
+        cache = NegativeCache()
+        session = FakeSession(first_block_empty)
+        client = EntsoePandasClient(api_key='test', negative_cache=cache,
+                                    session=session, skip_empty_blocks=True)
+        for _ in range(2):
+            series = client.query_day_ahead_prices('BE', start=self.start,
+                                                   end=self.end)
+        self.assertEqual(series.index[0],
+                         pd.Timestamp('20160101', tz='Europe/Brussels'))
+        self.assertEqual(len(session.calls), 5)
+        # the second time the block was skipped before building a request
+        self.assertEqual(cache.stats()['stores'], 2)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_recent_entries_expire(self):
+        cache = NegativeCache(recent_ttl=0)
+        client = EntsoeRawClient(api_key='test', negative_cache=cache,
+                                 session=FakeSession(self.no_data))
+        end = pd.Timestamp.now(tz='UTC').floor('h')
+        for _ in range(2):
+            with self.assertRaises(NoMatchingDataError):
+                client.query_load('BE', end - pd.Timedelta(hours=1), end)
+        self.assertEqual(len(client.session.calls), 2)
+
+    def test_persistent(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'negative.sqlite')
+            NegativeCache(path).add('key', end=self.end)
+            self.assertTrue(NegativeCache(path).contains('key'))
+            self.assertFalse(NegativeCache(path).contains('other'))
+
+
+@unittest.skipIf(pyarrow is None, "requires pyarrow")
+class TimeSeriesStoreTest(unittest.TestCase):
+    start = pd.Timestamp('20171230', tz='Europe/Brussels')
+    end = pd.Timestamp('20180103', tz='Europe/Brussels')
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.session = FakeSession(price_responder)
+        self.client = EntsoePandasClient(api_key='test', session=self.session)
+
+    def test_intervals(self):
+        ts = [pd.Timestamp('2018-01-0{}'.format(d), tz='UTC')
+              for d in range(1, 8)]
+        covered = merge_intervals([(ts[3], ts[4]), (ts[0], ts[1]),
+                                   (ts[1], ts[2])])
+        self.assertEqual(covered, [(ts[0], ts[2]), (ts[3], ts[4])])
+        self.assertEqual(missing_intervals(covered, ts[0], ts[6]),
+                         [(ts[2], ts[3]), (ts[4], ts[6])])
+        self.assertEqual(missing_intervals(covered, ts[0], ts[1]), [])
+
+    def test_sync_fetches_only_gaps(self):
+        for format in ('parquet', 'feather', 'csv'):
+            store = TimeSeriesStore(os.path.join(self.directory.name, format),
+                                    format=format)
+            query = self.client.query_day_ahead_prices
+            store.sync(query, 'BE', self.start, self.end)
+            self.session.calls.clear()
+
+            day = pd.Timedelta(days=1)
+            fetched = store.sync(query, 'BE', self.start, self.end + day)
+            self.assertEqual(fetched, [(self.end.tz_convert('UTC'),
+                                        (self.end + day).tz_convert('UTC'))])
+            self.assertEqual(len(self.session.calls), 1)
+            self.assertEqual(store.sync(query, 'BE', self.start, self.end),
+                             [])
+            self.assertEqual(len(self.session.calls), 1)
+
+            stored = store.read('day_ahead_prices', 'BE')
+            self.assertIsInstance(stored, pd.Series)
+            self.assertEqual(str(stored.index.tz), 'UTC')
+            self.assertEqual(store.years('day_ahead_prices', 'BE'),
+                             [2017, 2018])
+            # the fixture's prices depend on the requested period
+            expected = query('BE', start=self.start, end=self.end + day)
+            self.assertEqual(list(stored.index),
+                             list(expected.tz_convert('UTC').index))
+
+    def test_refresh_and_overwrite(self):
+        store = TimeSeriesStore(self.directory.name)
+        query = self.client.query_day_ahead_prices
+        store.sync(query, 'BE', self.start, self.end)
+        self.session.calls.clear()
+        fetched = store.sync(query, 'BE', self.start, self.end,
+                             refresh=pd.Timedelta(hours=6))
+        self.assertEqual(len(fetched), 1)
+        self.assertEqual(fetched[0][1] - fetched[0][0], pd.Timedelta(hours=6))
+        self.assertEqual(len(self.session.calls), 1)
+        stored = store.read('day_ahead_prices', 'BE')
+        self.assertFalse(stored.index.duplicated().any())
+        self.assertEqual(len(stored), 4 * 24)
+
+    def test_rows_sharing_a_timestamp_are_kept(self):
+        created = pd.Timestamp('20180101T12', tz='UTC')
+        df = pd.DataFrame({'mrid': ['a', 'b', 'c'], 'revision': [1, 1, 2],
+                           'start': pd.date_range('20180102', periods=3,
+                                                  tz='UTC')},
+                          index=[created, created,
+                                 created + pd.Timedelta(hours=1)])
+        dataset = 'unavailability_of_generation_units-docstatus=A05'
+        for format in ('parquet', 'csv'):
+            store = TimeSeriesStore(os.path.join(self.directory.name, format),
+                                    format=format)
+            store.write(dataset, 'BE', df)
+            store.write(dataset, 'BE', df)
+            stored = store.read(dataset, 'BE')
+            self.assertEqual(len(stored), 3)
+            self.assertEqual(sorted(stored['mrid']), ['a', 'b', 'c'])
+            # a time series cannot hold several rows per timestamp
+            with self.assertRaises(ValueError):
+                store.write('load', 'BE', df)
+
+    def test_merge_mode_is_per_dataset(self):
+        created = pd.Timestamp('20180101T12', tz='UTC')
+        first = pd.DataFrame({'mrid': ['a']}, index=[created])
+        second = pd.DataFrame({'mrid': ['b']}, index=[created])
+        store = TimeSeriesStore(self.directory.name, format='csv',
+                                merge_modes={'events': MERGE_ROWS})
+        for dataset in ('events', 'load'):
+            store.write(dataset, 'BE', first)
+            store.write(dataset, 'BE', second)
+        # both indexes are unique, but events keep every distinct row
+        self.assertEqual(list(store.read('events', 'BE')['mrid']),
+                         ['a', 'b'])
+        self.assertEqual(list(store.read('load', 'BE')['mrid']), ['b'])
+
+    def test_unpublished_data_is_fetched_later(self):
+        published = [pd.Timestamp('20240102', tz='UTC')]
+
+        def query_load(zone, start, end):
+            end = min(end, published[0])
+            if end <= start:
+                raise NoMatchingDataError
+            index = pd.date_range(start, end, freq='h', inclusive='left')
+            return pd.Series(1.0, index=index)
+
+        store = TimeSeriesStore(self.directory.name, format='csv')
+        store.sync(query_load, 'BE', pd.Timestamp('20240101', tz='UTC'),
+                   pd.Timestamp('20240103', tz='UTC'))
+        published[0] = pd.Timestamp('20240104', tz='UTC')
+        fetched = store.sync(query_load, 'BE',
+                             pd.Timestamp('20240101', tz='UTC'),
+                             pd.Timestamp('20240104', tz='UTC'))
+        self.assertEqual(fetched, [(pd.Timestamp('20240102', tz='UTC'),
+                                    pd.Timestamp('20240104', tz='UTC'))])
+        self.assertEqual(len(store.read('load', 'BE')), 3 * 24)
+
+    def test_recent_empty_period_is_not_recorded(self):
+        def query_load(zone, start, end):
+            raise NoMatchingDataError
+
+        store = TimeSeriesStore(self.directory.name, format='csv')
+        end = pd.Timestamp.now(tz='UTC').floor('h')
+        store.sync(query_load, 'BE', end - pd.Timedelta(days=30), end)
+        self.assertEqual(store.coverage('load', 'BE'),
+                         [(end - pd.Timedelta(days=30),
+                           end - pd.Timedelta(days=7))])
+
+    def test_empty_period_is_recorded(self):
+        session = FakeSession(
+            lambda params: make_response(NO_MATCHING_DATA_XML, 400))
+        client = EntsoePandasClient(api_key='test', session=session)
+        store = TimeSeriesStore(self.directory.name)
+        store.sync(client.query_generation, 'BE', self.start, self.end,
+                   psr_type='B16')
+        store.sync(client.query_generation, 'BE', self.start, self.end,
+                   psr_type='B16')
+        self.assertEqual(len(session.calls), 1)
+        dataset = 'generation-psr_type=B16'
+        self.assertEqual(len(store.coverage(dataset, 'BE')), 1)
+        with self.assertRaises(NoMatchingDataError):
+            store.read(dataset, 'BE')
+
+
+def make_backfill_client():
+    """Client factory for the worker processes of BackfillRunnerTest"""
+    return EntsoePandasClient(api_key='test',
+                              session=FakeSession(price_responder))
+
+
+class InterruptingResponder:
+    """Answers with prices, and raises KeyboardInterrupt at request `stop`"""
+
+    def __init__(self, stop):
+        self.stop = stop
+        self.count = 0
+
+    def __call__(self, params):
+        self.count += 1
+        if self.count == self.stop:
+            raise KeyboardInterrupt
+        if params['in_Domain'] == BIDDING_ZONES['NL'] and \
+                params['periodStart'].startswith('2016'):
+            return make_response(NO_MATCHING_DATA_XML, 400)
+        return price_responder(params)
+
+
+@unittest.skipIf(pyarrow is None, "requires pyarrow")
+class BackfillRunnerTest(unittest.TestCase):
+    start = pd.Timestamp('20150101', tz='UTC')
+    end = pd.Timestamp('20170101', tz='UTC')
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.store = TimeSeriesStore(os.path.join(self.directory.name, 'data'))
+        self.journal = Journal(os.path.join(self.directory.name, 'journal.db'))
+
+    def test_expand_job(self):
+        datasets = ['day_ahead_prices', ('generation', {'psr_type': 'B16'})]
+        tasks = expand_job(datasets, ['BE', 'NL'], self.start, self.end)
+        self.assertEqual(len(tasks), 2 * 2 * 2)
+        self.assertEqual(tasks[-1], BackfillTask(
+            'generation', 'NL', pd.Timestamp('20160101', tz='UTC'), self.end,
+            {'psr_type': 'B16'}))
+
+    def test_resume_after_interruption(self):
+        tasks = expand_job(['day_ahead_prices'], ['BE', 'NL'], self.start,
+                           self.end)
+        session = FakeSession(InterruptingResponder(stop=3))
+        client = EntsoePandasClient(api_key='test', session=session)
+        runner = BackfillRunner(self.store, self.journal, client=client)
+        with self.assertRaises(KeyboardInterrupt):
+            runner.run(tasks)
+        self.assertEqual(self.journal.stats(), {'done': 2, 'running': 1,
+                                                'pending': 1})
+        self.assertEqual(self.store.years('day_ahead_prices', 'BE'),
+                         [2015, 2016])
+
+        result = runner.run(tasks)
+        # NL 2015 again, NL 2016 has no data
+        self.assertGreater(result.pop('seconds'), 0)
+        self.assertEqual(result, {'skipped': 2, 'done': 2, 'failed': 0,
+                                  'rows': 365 * 24})
+        self.assertEqual(len(session.calls), 3 + 2)
+        self.assertEqual(self.journal.stats(), {'done': 4})
+        # the empty block is recorded as fetched
+        self.assertEqual(self.store.missing('day_ahead_prices', 'NL',
+                                            self.start, self.end), [])
+        self.assertEqual(runner.run(tasks)['skipped'], 4)
+
+    def test_failed_tasks_are_retried(self):
+        tasks = expand_job(['day_ahead_prices'], ['BE', 'XX'], self.start,
+                           self.end)
+        runner = BackfillRunner(self.store, self.journal,
+                                client_factory=make_backfill_client)
+        result = runner.run(tasks)
+        self.assertEqual((result['done'], result['failed']), (2, 2))
+        self.assertEqual(self.journal.status(tasks[-1]), 'failed')
+        self.assertEqual(runner.run(tasks)['skipped'], 2)
+
+    def test_worker_processes(self):
+        tasks = expand_job(['day_ahead_prices', 'load'], ['BE', 'NL'],
+                           self.start, self.end)
+        runner = BackfillRunner(self.store, self.journal.path,
+                                client_factory=make_backfill_client,
+                                workers=2)
+        result = runner.run(tasks)
+        # the price responder answers load queries with prices
+        self.assertEqual(result['failed'], 4)
+        self.assertEqual(result['done'], 4)
+        self.assertEqual(result['rows'], 2 * (365 + 366) * 24)
+        self.assertEqual(len(self.store.read('day_ahead_prices', 'NL')),
+                         (365 + 366) * 24)
+
+    def test_worker_threads(self):
+        tasks = expand_job(['day_ahead_prices'], ['BE', 'NL', 'FR'],
+                           self.start, self.end)
+        session = FakeSession(price_responder)
+        client = EntsoePandasClient(api_key='test', session=session)
+        runner = BackfillRunner(self.store, self.journal, client=client,
+                                workers=3, threads=True)
+        result = runner.run(tasks)
+        self.assertEqual((result['done'], result['failed']), (6, 0))
+        self.assertEqual(len(session.calls), 6)
+        self.assertEqual(self.journal.stats(), {'done': 6})
+
+
+@unittest.skipIf(pyarrow is None, "requires pyarrow")
+class CommandLineTest(unittest.TestCase):
+    manifest = {
+        'start': '2015-01-01',
+        'end': '2017-01-01',
+        'queries': [
+            {'dataset': 'day_ahead_prices', 'zones': ['BE', 'NL']},
+            {'dataset': 'generation', 'zones': 'BE', 'psr_type': 'B16',
+             'start': '2016-06-01'},
+        ],
+    }
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'manifest.json')
+        with open(self.path, 'w') as f:
+            json.dump(self.manifest, f)
+        self.calls = []
+
+    def request(self, method, url, params=None, **kwargs):
+        self.calls.append(params)
+        if params['documentType'] == 'A75':
+            return make_response(GENERATION_XML)
+        return price_responder(dict(params))
+
+    def test_load_manifest(self):
+        tasks = cli.load_manifest(self.path)
+        self.assertEqual(len(tasks), 2 * 2 + 1)
+        self.assertEqual(tasks[-1].kwargs, {'psr_type': 'B16'})
+        self.assertEqual(tasks[-1].start,
+                         pd.Timestamp('20160601', tz='UTC'))
+
+    def test_unknown_dataset(self):
+        with open(self.path, 'w') as f:
+            json.dump({'queries': [{'dataset': 'weather', 'zones': 'BE'}]},
+                      f)
+        with self.assertRaises(ValueError):
+            cli.load_manifest(self.path)
+        # queries the store cannot merge
+        for dataset in ('crossborder_flows', 'units',
+                        'unavailability_of_generation_units'):
+            with open(self.path, 'w') as f:
+                json.dump({'start': '2016-01-01', 'end': '2017-01-01',
+                           'queries': [{'dataset': dataset, 'zones': 'BE'}]},
+                          f)
+            with self.assertRaises(ValueError):
+                cli.load_manifest(self.path)
+
+    def test_missing_period(self):
+        with open(self.path, 'w') as f:
+            json.dump({'start': '2016-01-01', 'queries': [
+                {'dataset': 'load', 'zones': 'BE'}]}, f)
+        with self.assertRaisesRegex(ValueError, 'start or end'):
+            cli.load_manifest(self.path)
+
+    def test_missing_lxml(self):
+        argv = ['backfill', self.path, '--api-key', 'test',
+                '--output', os.path.join(self.directory.name, 'data'),
+                '--parser-engine', 'lxml']
+        with mock.patch('entsoe.cli.etree', None), \
+                mock.patch('entsoe.parsers.etree', None), \
+                mock.patch.object(requests.Session, 'request') as request:
+            with self.assertRaises(SystemExit):
+                cli.main(argv)
+        request.assert_not_called()
+
+    def test_backfill(self):
+        output = os.path.join(self.directory.name, 'data')
+        argv = ['backfill', self.path, '--output', output, '--format', 'csv',
+                '--workers', '2', '--api-key', 'test']
+        stdout = io.StringIO()
+        def request(session, *args, **kwargs):
+            return self.request(*args, **kwargs)
+
+        with mock.patch.object(requests.Session, 'request', request), \
+                mock.patch('sys.stdout', stdout):
+            self.assertEqual(cli.main(argv), 0)
+            self.assertEqual(len(self.calls), 5)
+            self.assertEqual(cli.main(argv), 0)
+        self.assertEqual(len(self.calls), 5)
+        report = stdout.getvalue()
+        self.assertIn('requests  5 (', report)
+        self.assertIn('5 done before', report)
+        self.assertIn('parsing', report)
+        store = TimeSeriesStore(output, format='csv')
+        self.assertEqual(len(store.read('day_ahead_prices', 'NL')),
+                         (365 + 366) * 24)
+        solar = store.read('generation-psr_type=B16', 'BE')
+        self.assertEqual(list(solar.columns), ['Solar', 'Wind Onshore'])
+
+
+class MetricsTest(unittest.TestCase):
+    start = pd.Timestamp('20180101', tz='Europe/Brussels')
+    end = pd.Timestamp('20180102', tz='Europe/Brussels')
+
+    def make_client(self, respond=price_responder, cls=EntsoePandasClient,
+                    **kwargs):
+        self.requests, self.parses = [], []
+        hooks = {'request': self.requests.append, 'parse': self.parses.append}
+        return cls(api_key='test', session=FakeSession(respond), hooks=hooks,
+                   **kwargs)
+
+    def test_request_event(self):
+        client = self.make_client(lambda params: make_response(PRICES_XML),
+                                  cls=EntsoeRawClient)
+        client.query_day_ahead_prices('BE', start=self.start, end=self.end)
+        event, = self.requests
+        self.assertEqual(event.doc_type, 'A44')
+        self.assertEqual(event.status, 200)
+        self.assertEqual(event.bytes, len(PRICES_XML.encode('utf-8')))
+        self.assertEqual(event.retries, 0)
+        self.assertFalse(event.from_cache)
+        self.assertIsNone(event.error)
+        self.assertNotIn('securityToken', event.params)
+        self.assertGreaterEqual(event.latency, 0)
+
+    @mock.patch('entsoe.misc.sleep')
+    def test_retries_and_errors(self, sleep):
+        client = self.make_client(
+            SequenceResponder(make_response('busy', 503),
+                              make_response(PRICES_XML),
+                              make_response(NO_MATCHING_DATA_XML, 400)),
+            cls=EntsoeRawClient, retry_policy=RetryPolicy(max_retries=2))
+        with self.assertLogs('entsoe.misc', 'WARNING'):
+            client.query_day_ahead_prices('BE', start=self.start,
+                                          end=self.end)
+        with self.assertRaises(NoMatchingDataError):
+            client.query_day_ahead_prices('BE', start=self.start,
+                                          end=self.end)
+        retried, failed = self.requests
+        self.assertEqual(retried.retries, 1)
+        self.assertIsNone(retried.error)
+        self.assertIsInstance(failed.error, NoMatchingDataError)
+        self.assertEqual(failed.status, 400)
+
+    def test_cache_hit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            client = self.make_client(cls=EntsoeRawClient,
+                                      cache=ResponseCache(directory))
+            for _ in range(2):
+                client.query_day_ahead_prices('BE', start=self.start,
+                                              end=self.end)
+        self.assertEqual([e.from_cache for e in self.requests],
+                         [False, True])
+
+    def test_parse_event(self):
+        client = self.make_client(lambda params: make_response(PRICES_XML))
+        client.query_day_ahead_prices('BE', start=self.start, end=self.end)
+        event, = self.parses
+        self.assertEqual(event.parser, 'parse_prices')
+        self.assertEqual(event.doc_type, 'A44')
+        self.assertEqual(event.timeseries, PRICES_XML.count('<TimeSeries>'))
+        self.assertEqual(event.points, PRICES_XML.count('<Point>'))
+        self.assertIsNone(event.error)
+
+    def test_failing_hook(self):
+        def broken(event):
+            raise RuntimeError
+
+        client = EntsoePandasClient(
+            api_key='test', session=FakeSession(price_responder),
+            hooks={'request': broken, 'parse': [broken]})
+        with self.assertLogs('entsoe.metrics', 'ERROR'):
+            series = client.query_day_ahead_prices('BE', start=self.start,
+                                                   end=self.end)
+        self.assertEqual(len(series), 24)
+
+    def test_unknown_event(self):
+        with self.assertRaises(ValueError):
+            EntsoeRawClient(api_key='test', hooks={'response': print})
+
+    def test_collector(self):
+        metrics = MetricsCollector()
+        client = EntsoePandasClient(
+            api_key='test', hooks=metrics.hooks(),
+            session=FakeSession(SequenceResponder(
+                make_response(PRICES_XML),
+                make_response(NO_MATCHING_DATA_XML, 400))))
+        client.query_day_ahead_prices('BE', start=self.start, end=self.end)
+        with self.assertRaises(NoMatchingDataError):
+            client.query_day_ahead_prices('BE', start=self.start,
+                                          end=self.end)
+        snapshot = metrics.snapshot()
+        json.dumps(snapshot)
+        prices = snapshot['requests']['Price Document']
+        self.assertEqual((prices['requests'], prices['errors']), (2, 1))
+        self.assertEqual(prices['status'], {200: 1, 400: 1})
+        self.assertEqual(prices['latency']['count'], 2)
+        parser = snapshot['parsers']['parse_prices']
+        self.assertEqual(parser['calls'], 1)
+        self.assertEqual(parser['points'], PRICES_XML.count('<Point>'))
+        totals = metrics.totals()
+        self.assertEqual(totals['requests'], 2)
+        self.assertEqual(totals['bytes'], len(PRICES_XML.encode('utf-8')) +
+                         len(NO_MATCHING_DATA_XML.encode('utf-8')))
+        with self.assertLogs('entsoe.metrics', 'INFO') as logs:
+            metrics.log()
+        self.assertEqual(len(logs.output), 2)
+        metrics.reset()
+        self.assertEqual(metrics.totals()['requests'], 0)
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(1, 2, 5))
+        for value in (0.5, 0.7, 1.5, 4, 9):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1, 1])
+        self.assertEqual(histogram.quantile(0.5), 2)
+        self.assertEqual(histogram.quantile(1), 9)
+        self.assertIsNone(Histogram().quantile(0.5))
+
+    def test_document_stats(self):
+        self.assertEqual(document_stats(PRICES_XML.encode('utf-8')),
+                         ('A44', PRICES_XML.count('<TimeSeries>'),
+                          PRICES_XML.count('<Point>')))
+        self.assertEqual(document_stats(make_outage_zip(1)),
+                         (None, None, None))
+
+
+class AsyncMetricsTest(unittest.IsolatedAsyncioTestCase):
+    start = pd.Timestamp('20180101', tz='Europe/Brussels')
+    end = pd.Timestamp('20180102', tz='Europe/Brussels')
+
+    async def test_hooks(self):
+        metrics = MetricsCollector()
+        client = AsyncEntsoePandasClient(
+            api_key='test', hooks=metrics.hooks(),
+            session=FakeAsyncSession(price_responder))
+        await client.query_day_ahead_prices('BE', start=self.start,
+                                            end=self.end)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['requests']['Price Document']['requests'], 1)
+        self.assertEqual(snapshot['parsers']['parse_prices']['calls'], 1)
+
+
+class SpooledDownloadTest(unittest.TestCase):
+    start = pd.Timestamp('20180101', tz='Europe/Brussels')
+    end = pd.Timestamp('20180201', tz='Europe/Brussels')
+
+    def setUp(self):
+        self.content = make_outage_zip(5)
+        self.session = FakeSession(lambda params: make_response(self.content))
+
+    def test_raw_client_returns_spooled_file(self):
+        client = EntsoeRawClient(api_key='test', session=self.session,
+                                 spool_threshold=100)
+        with client.query_unavailability_of_generation_units(
+                'BE', self.start, self.end) as spool:
+            self.assertTrue(spool._rolled)
+            self.assertEqual(spool.read(), self.content)
+        self.assertTrue(self.session.kwargs[0]['stream'])
+
+    def test_small_response_stays_in_memory(self):
+        client = EntsoeRawClient(api_key='test', session=self.session,
+                                 spool_threshold=len(self.content) + 1)
+        with client.query_unavailability_of_generation_units(
+                'BE', self.start, self.end) as spool:
+            self.assertFalse(spool._rolled)
+
+    def test_pandas_client_parses_spooled_file(self):
+        expected = EntsoePandasClient(
+            api_key='test', session=self.session
+        ).query_unavailability_of_generation_units('BE', start=self.start,
+                                                   end=self.end)
+        client = EntsoePandasClient(api_key='test',
+                                    session=self.session, spool_threshold=100)
+        df = client.query_unavailability_of_generation_units(
+            'BE', start=self.start, end=self.end)
+        pd.testing.assert_frame_equal(df, expected)
+
+    def test_spooled_response_is_cached(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            client = EntsoeRawClient(api_key='test', session=self.session,
+                                     spool_threshold=100,
+                                     cache=ResponseCache(tmp))
+            for _ in range(2):
+                with client.query_unavailability_of_generation_units(
+                        'BE', self.start, self.end) as spool:
+                    self.assertEqual(spool.read(), self.content)
+            self.assertEqual(len(self.session.calls), 1)
+
+
+class OutageResponder:
+    """
+    Serves one outage document every six hours of January 2018, and a
+    pagination error for periods with more than `allowed` documents,
+    unless an offset is given
+    """
+
+    def __init__(self, allowed=20):
+        self.allowed = allowed
+        self.documents = pd.date_range('2017-12-31T23:00Z',
+                                       '2018-01-31T23:00Z', freq='6h',
+                                       inclusive='left')
+        self.paginated = 0
+
+    def __call__(self, params):
+        start, end = parse_period(params)
+        created = self.documents[(self.documents >= start) &
+                                 (self.documents < end)]
+        if 'offset' in params:
+            offset = params['offset']
+            created = created[offset:offset + self.allowed]
+        elif len(created) > self.allowed:
+            self.paginated += 1
+            return make_response(PAGINATION_XML.format(
+                allowed=self.allowed, requested=len(created)), 400)
+        if not len(created):
+            return make_response(NO_MATCHING_DATA_XML, 400)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as arc:
+            for i, created_time in enumerate(created):
+                arc.writestr('outage_{}.xml'.format(i), OUTAGE_XML.format(
+                    mrid=i, quantity=0,
+                    created=created_time.strftime('%Y-%m-%dT%H:%M:%SZ')))
+        return make_response(buffer.getvalue())
+
+
+class PaginationTest(unittest.TestCase):
+    start = pd.Timestamp('20180101', tz='Europe/Brussels')
+    end = pd.Timestamp('20180201', tz='Europe/Brussels')
+
+    def make_client(self, responder):
+        return EntsoePandasClient(api_key='test',
+                                  session=FakeSession(responder))
+
+    def test_error_reports_document_count(self):
+        client = EntsoeRawClient(api_key='test', session=FakeSession(
+            lambda params: make_response(PAGINATION_XML.format(
+                allowed=200, requested=512), 400)))
+        with self.assertRaises(PaginationError) as cm:
+            client.query_unavailability_of_generation_units(
+                'BE', self.start, self.end)
+        self.assertEqual(cm.exception.requested, 512)
+        self.assertEqual(cm.exception.allowed, 200)
+
+    def test_splits_by_document_count(self):
+        responder = OutageResponder()
+        client = self.make_client(responder)
+        df = client.query_unavailability_of_generation_units(
+            'BE', start=self.start, end=self.end)
+        # 124 documents at 80% of 20 per window: 8 windows at once
+        self.assertEqual(len(client.session.calls), 9)
+        self.assertEqual(responder.paginated, 1)
+        self.assertEqual(len(df), len(responder.documents))
+        self.assertTrue(df.index.is_monotonic_increasing)
+
+    def test_remembers_window_size(self):
+        responder = OutageResponder()
+        client = self.make_client(responder)
+        client.query_unavailability_of_generation_units(
+            'BE', start=self.start, end=self.end)
+        calls = len(client.session.calls)
+        df = client.query_unavailability_of_generation_units(
+            'BE', start=self.start, end=self.end)
+        self.assertEqual(len(client.session.calls) - calls, 8)
+        self.assertEqual(responder.paginated, 1)
+        self.assertEqual(len(df), len(responder.documents))
+        # one window size for the endpoint and zone
+        self.assertEqual(len(client.pagination_windows), 1)
+
+    def test_unknown_count_halves(self):
+        responder = OutageResponder()
+        client = self.make_client(responder)
+        with mock.patch('entsoe.entsoerawclient._document_count',
+                        return_value=None):
+            df = client.query_unavailability_of_generation_units(
+                'BE', start=self.start, end=self.end)
+        self.assertEqual(len(df), len(responder.documents))
+
+    def test_unsplittable_period_raises(self):
+        client = self.make_client(
+            lambda params: make_response(PAGINATION_XML.format(
+                allowed=200, requested=300), 400))
+        with self.assertRaises(PaginationError):
+            client.query_unavailability_of_generation_units(
+                'BE', start=pd.Timestamp('20180101T1000Z'),
+                end=pd.Timestamp('20180101T1130Z'))
+        # two windows are needed, but 10:00-11:30 has no whole hour inside
+        self.assertEqual(len(client.session.calls), 1)
+
+
+@mock.patch('entsoe.entsoerawclient.PAGE_SIZE', 20)
+class OffsetPagingTest(unittest.TestCase):
+    start = pd.Timestamp('20180101', tz='Europe/Brussels')
+    end = pd.Timestamp('20180201', tz='Europe/Brussels')
+
+    def test_raw_client_pages(self):
+        responder = OutageResponder()
+        client = EntsoeRawClient(api_key='test',
+                                 session=FakeSession(responder))
+        pages = list(client.iter_unavailability_of_generation_units(
+            'BE', self.start, self.end))
+        # 124 documents
+        self.assertEqual(len(pages), 7)
+        self.assertEqual([call['offset'] for call in client.session.calls],
+                         list(range(0, 140, 20)))
+        with zipfile.ZipFile(io.BytesIO(pages[-1])) as arc:
+            self.assertEqual(len(arc.namelist()), 4)
+        self.assertEqual(responder.paginated, 0)
+
+    def test_stops_on_empty_page(self):
+        responder = OutageResponder()
+        responder.documents = responder.documents[:40]
+        client = EntsoeRawClient(api_key='test',
+                                 session=FakeSession(responder))
+        pages = list(client.iter_unavailability_of_generation_units(
+            'BE', self.start, self.end))
+        self.assertEqual(len(pages), 2)
+        self.assertEqual(len(client.session.calls), 3)
+
+    @mock.patch('entsoe.entsoerawclient.MAX_OFFSET', 40)
+    def test_too_many_documents(self):
+        client = EntsoeRawClient(api_key='test',
+                                 session=FakeSession(OutageResponder()))
+        pages = client.iter_unavailability_of_generation_units(
+            'BE', self.start, self.end)
+        with self.assertRaises(PaginationError):
+            list(pages)
+
+    def test_pandas_client_pages(self):
+        responder = OutageResponder()
+        client = EntsoePandasClient(api_key='test',
+                                    session=FakeSession(responder))
+        frames = list(client.iter_unavailability_of_generation_units(
+            'BE', self.start, self.end))
+        self.assertEqual([len(df) for df in frames], [20] * 6 + [4])
+        df = pd.concat(frames)
+        self.assertEqual(len(df), len(responder.documents))
+        self.assertEqual(str(df.index.tz), 'Europe/Brussels')
+
+    def test_pandas_client_no_data(self):
+        responder = OutageResponder()
+        client = EntsoePandasClient(api_key='test',
+                                    session=FakeSession(responder))
+        with self.assertRaises(NoMatchingDataError):
+            list(client.iter_unavailability_of_generation_units(
+                'BE', pd.Timestamp('20190101', tz='Europe/Brussels'),
+                pd.Timestamp('20190201', tz='Europe/Brussels')))
+
+
 if __name__ == '__main__':
     unittest.main()